@@ -1,6 +1,6 @@
 import logging
 import random, shutil, sqlite3, configparser, hashlib, ipaddress, json, os, secrets, subprocess
-import time, re, uuid, bcrypt, psutil, pyotp, threading
+import time, re, uuid, bcrypt, psutil, pyotp, threading, queue, csv, io
 import traceback
 from uuid import uuid4
 from zipfile import ZipFile
@@ -11,25 +11,26 @@ from jinja2 import Template
 from flask import Flask, request, render_template, session, send_file
 from flask_cors import CORS
 from icmplib import ping, traceroute
-from flask.json.provider import DefaultJSONProvider
 from itertools import islice
 
-from sqlalchemy import RowMapping
 
 from modules.Utilities import (
     RegexMatch, StringToBoolean,
     ValidateIPAddressesWithRange, ValidateDNSAddress,
-    GenerateWireguardPublicKey, GenerateWireguardPrivateKey
+    GenerateWireguardPublicKey, GenerateWireguardPresharedKey
 )
 from packaging import version
 from modules.Email import EmailSender
 from modules.DashboardLogger import DashboardLogger
 from modules.PeerJob import PeerJob
 from modules.SystemStatus import SystemStatus
+from modules.InterfaceTrafficSampler import InterfaceTrafficSampler
 from modules.PeerShareLinks import PeerShareLinks
 from modules.PeerJobs import PeerJobs
 from modules.DashboardConfig import DashboardConfig
 from modules.WireguardConfiguration import WireguardConfiguration
+from modules.Peer import Peer
+from modules.AmneziaWGPeer import AmneziaWGPeer
 from modules.AmneziaWireguardConfiguration import AmneziaWireguardConfiguration
 
 from client import createClientBlueprint
@@ -40,20 +41,14 @@ from modules.DashboardClients import DashboardClients
 from modules.DashboardPlugins import DashboardPlugins
 from modules.DashboardWebHooks import DashboardWebHooks
 from modules.NewConfigurationTemplates import NewConfigurationTemplates
-
-class CustomJsonEncoder(DefaultJSONProvider):
-    def __init__(self, app):
-        super().__init__(app)
-
-    def default(self, o):
-        if callable(getattr(o, "toJson", None)):
-            return o.toJson()
-        if type(o) is RowMapping:
-            return dict(o)
-        if type(o) is datetime:
-            return o.strftime("%Y-%m-%d %H:%M:%S")
-        return super().default(self)
-
+from modules.UnitOfWork import UnitOfWork
+from modules.PeerEventStream import PeerEventStream
+from modules.ResponseCompression import ResponseCompression
+from modules.ZipStream import ZipStream
+from modules.BackupIndex import BackupIndex
+from modules.WorkerCoordinator import WorkerCoordinator, RegisterForkSafePool
+from modules.KeyPairPool import KeyPairPool
+from modules.CustomJsonEncoder import CustomJsonEncoder
 
 
 '''
@@ -69,6 +64,30 @@ def ResponseObject(status=True, message=None, data=None, status_code = 200) -> F
     response.content_type = "application/json"
     return response
 
+def MatchETag(etag: str) -> str | None:
+    """
+    Find etag, or one of its compressed variants, in If-None-Match
+    @param etag: Strong ETag value without quotes
+    @return: The matching ETag, or None
+    """
+    return ResponseCompression.MatchETag(etag, request.if_none_match)
+
+def ConditionalResponseObject(etag: str, build) -> Flask.response_class:
+    """
+    Answer 304 when the client already holds etag, otherwise build the response
+    @param etag: Strong ETag value without quotes
+    @param build: Callable returning the full response
+    """
+    matched = MatchETag(etag)
+    if matched is not None:
+        response = app.response_class(status=304)
+        etag = matched
+    else:
+        response = build()
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
 '''
 Flask App
 '''
@@ -92,21 +111,32 @@ def peerInformationBackgroundThread():
                             c.getPeersTransfer()
                             c.getPeersEndpoint()
                             c.getPeers()
+                            PeerEvents.publishConfiguration(c)
                             if delay == 6:
                                 if c.configurationInfo.PeerTrafficTracking:
                                     c.logPeersTraffic()
                                 if c.configurationInfo.PeerHistoricalEndpointTracking:
                                     c.logPeersHistoryEndpoint()
                             c.getRestrictedPeersList()
+                Coordinator.publishSnapshot()
             except Exception as e:
                 app.logger.error(f"[WGDashboard] Background Thread #1 Error", e)
 
         if delay == 6:
+            FlushAPIKeyUsage()
             delay = 1
         else:
             delay += 1
         time.sleep(10)
 
+def FlushAPIKeyUsage():
+    """
+    Write the API key access counters this worker collected to the dashboard log
+    """
+    with app.app_context():
+        for key, count in DashboardConfig.flushAPIKeyUsage():
+            DashboardLogger.log(Message=f"API Key Access: true - Key: {key} - Requests: {count}")
+
 def peerJobScheduleBackgroundThread():
     with app.app_context():
         app.logger.info(f"Background Thread #2 Started")
@@ -169,10 +199,81 @@ def InitWireguardConfigurationsList(startup: bool = False):
                     app.logger.error(f"{i} have an invalid configuration file.")
 
 def startThreads():
+    KeyPairs.start()
+    if Coordinator.tryAcquireLeadership():
+        startLeaderThreads()
+    else:
+        followerThread = threading.Thread(target=followerBackgroundThread, daemon=True)
+        followerThread.start()
+
+def startLeaderThreads():
     bgThread = threading.Thread(target=peerInformationBackgroundThread, daemon=True)
     bgThread.start()
     scheduleJobThread = threading.Thread(target=peerJobScheduleBackgroundThread, daemon=True)
     scheduleJobThread.start()
+    DashboardPlugins.startThreads()
+
+def followerBackgroundThread():
+    """
+    Followers do not talk to WireGuard, they refresh peers from the database whenever the leader's collector
+    published a new snapshot there, and take over if the leader goes away. Like the leader, they write their API key
+    usage to the log every minute.
+    """
+    app.logger.info(f"Follower Thread Started, PID: {os.getpid()}")
+    tick = 0
+    while True:
+        time.sleep(2)
+        tick += 1
+        if tick % 30 == 0:
+            try:
+                FlushAPIKeyUsage()
+            except Exception as e:
+                app.logger.error("Follower Thread Error", e)
+        if tick % 5 == 0 and Coordinator.tryAcquireLeadership():
+            app.logger.info(f"Worker {os.getpid()} became the leader")
+            startLeaderThreads()
+            return
+        if not Coordinator.snapshotChanged():
+            continue
+        with app.app_context():
+            try:
+                for name in list(WireguardConfigurations.keys()):
+                    c = WireguardConfigurations.get(name)
+                    if c is not None and c.getStatus():
+                        c.getPeers()
+                        PeerEvents.publishConfiguration(c)
+                        c.getRestrictedPeersList()
+            except Exception as e:
+                app.logger.error("Follower Thread Error", e)
+
+def SynchronizeWorkerState(changes: set[str]):
+    """
+    Reload the state another worker changed
+    @param changes: What changed, as recorded by invalidateWorkers, "*" reloads everything
+    """
+    reloadAll = "*" in changes
+    if reloadAll or "apikeys" in changes:
+        DashboardConfig.reload()
+    elif "settings" in changes:
+        DashboardConfig.reloadSettings()
+    if reloadAll or "jobs" in changes:
+        AllPeerJobs.reload()
+    if reloadAll or "configurations" in changes:
+        for name in list(WireguardConfigurations.keys()):
+            if not os.path.exists(WireguardConfigurations[name].configPath):
+                WireguardConfigurations.pop(name, None)
+        InitWireguardConfigurationsList()
+    names = (set(WireguardConfigurations.keys()) if reloadAll else
+             {c.split(":", 1)[1] for c in changes if c.startswith("configuration:")})
+    for name in names:
+        c = WireguardConfigurations.get(name)
+        if c is None:
+            # Created by the other worker
+            InitWireguardConfigurationsList()
+        elif os.path.exists(c.configPath):
+            c.refresh()
+        else:
+            WireguardConfigurations.pop(name, None)
 
 dictConfig({
     'version': 1,
@@ -191,9 +292,11 @@ CONFIGURATION_PATH = os.getenv('CONFIGURATION_PATH', '.')
 app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 5206928
 app.secret_key = secrets.token_urlsafe(32)
 app.json = CustomJsonEncoder(app)
+RegisterForkSafePool()
 with app.app_context():
-    SystemStatus = SystemStatus()
     DashboardConfig = DashboardConfig()
+    InterfaceTraffic: InterfaceTrafficSampler = InterfaceTrafficSampler()
+    SystemStatus = SystemStatus(DashboardConfig, InterfaceTraffic)
     EmailSender = EmailSender(DashboardConfig)
     AllPeerShareLinks: PeerShareLinks = PeerShareLinks(DashboardConfig, WireguardConfigurations)
     AllPeerJobs: PeerJobs = PeerJobs(DashboardConfig, WireguardConfigurations, AllPeerShareLinks)
@@ -201,6 +304,12 @@ with app.app_context():
     DashboardPlugins: DashboardPlugins = DashboardPlugins(app, WireguardConfigurations)
     DashboardWebHooks: DashboardWebHooks = DashboardWebHooks(DashboardConfig)
     NewConfigurationTemplates: NewConfigurationTemplates = NewConfigurationTemplates()
+    PeerEvents: PeerEventStream = PeerEventStream()
+    KeyPairs: KeyPairPool = KeyPairPool(DashboardConfig)
+    Coordinator: WorkerCoordinator = WorkerCoordinator(
+        os.path.join(DashboardConfig.ConfigurationPath, "db"), int(os.environ.get("WGDASHBOARD_WORKERS", "1"))
+    )
+    Compression: ResponseCompression = ResponseCompression()
     InitWireguardConfigurationsList(startup=True)
     DashboardClients: DashboardClients = DashboardClients(WireguardConfigurations)
     app.register_blueprint(createClientBlueprint(WireguardConfigurations, DashboardConfig, DashboardClients))
@@ -219,6 +328,100 @@ _, WG_CONF_PATH = DashboardConfig.GetConfig("Server", "wg_conf_path")
 API Routes
 '''
 
+# Routes that change state other workers hold in memory, and what they change: "settings" (dashboard settings),
+# "apikeys", "jobs" (peer jobs), "configurations" (configurations added, removed or renamed) and "configuration"
+# (the configuration the request names)
+SharedStateRoutes = {
+    'API_addWireguardConfiguration': ['configurations'],
+    'API_toggleWireguardConfiguration': ['configuration'],
+    'API_updateWireguardConfiguration': ['configuration'],
+    'API_updateWireguardConfigurationInfo': ['configuration'],
+    'API_UpdateWireguardConfigurationRawFile': ['configuration'],
+    'API_deleteWireguardConfiguration': ['configurations'],
+    'API_renameWireguardConfiguration': ['configurations'],
+    'API_restoreWireguardConfigurationBackup': ['configuration'],
+    'API_updateDashboardConfigurationItem': ['settings', 'configurations'],
+    'API_newDashboardAPIKey': ['apikeys'],
+    'API_deleteDashboardAPIKey': ['apikeys'],
+    'API_updatePeerSettings': ['configuration'],
+    'API_updatePeerSettingsBatch': ['configuration'],
+    'API_resetPeerData': ['configuration'],
+    'API_deletePeers': ['configuration'],
+    'API_restrictPeers': ['configuration'],
+    'API_allowAccessPeers': ['configuration'],
+    'API_addPeers': ['configuration'],
+    'API_sharePeer_create': ['configuration'],
+    'API_sharePeer_update': ['configuration'],
+    'API_savePeerScheduleJob': ['jobs', 'configuration'],
+    'API_deletePeerScheduleJob': ['jobs', 'configuration'],
+    'API_Welcome_GetTotpLink': ['settings'],
+    'API_Welcome_VerifyTotpLink': ['settings'],
+    'API_Welcome_Finish': ['settings'],
+    'API_Locale_Update': ['settings'],
+    'API_OIDC_Toggle': ['settings'],
+    'API_Clients_ToggleStatus': ['settings']
+}
+
+def RequestConfigurationName() -> str | None:
+    """
+    Name of the configuration the current request changes, wherever the route takes it from
+    """
+    data = request.get_json(silent=True) if request.is_json else None
+    data = data if isinstance(data, dict) else {}
+    job = data.get("Job") if isinstance(data.get("Job"), dict) else {}
+    names = [(request.view_args or {}).get("configName"), request.args.get("configurationName"),
+             data.get("configurationName"), data.get("ConfigurationName"), data.get("Name"),
+             data.get("Configuration"), job.get("Configuration")]
+    if isinstance(data.get("ShareID"), str):
+        names += [link.Configuration for link in AllPeerShareLinks.getLinkByID(data.get("ShareID"))]
+    return next((n for n in names if isinstance(n, str) and len(n) > 0), None)
+
+def synchronizeWorker():
+    """
+    Reload what other workers changed, called once the request is authenticated. Only what the changes name is
+    reloaded, when nothing changed this is one read of the generation file.
+    """
+    changes = Coordinator.changedState()
+    if len(changes) > 0:
+        SynchronizeWorkerState(changes)
+
+@app.after_request
+def invalidateWorkers(response):
+    if response.status_code < 400 and request.endpoint in SharedStateRoutes:
+        changes = []
+        for change in SharedStateRoutes[request.endpoint]:
+            if change == 'configuration':
+                name = RequestConfigurationName()
+                # A change we cannot pin on one configuration reloads everything
+                changes.append(f"configuration:{name}" if name is not None else "*")
+            else:
+                changes.append(change)
+        Coordinator.bumpGeneration(changes)
+    return response
+
+@app.after_request
+def compressResponse(response):
+    if not DashboardConfig.GetConfig("Server", "response_compression")[1]:
+        return response
+    # Read the settings on every response, so updating them applies without a restart
+    Compression.configure(DashboardConfig.GetConfig("Server", "response_compression_level")[1],
+                          DashboardConfig.GetConfig("Server", "response_compression_min_size")[1])
+    return Compression.compressResponse(response, request.accept_encodings)
+
+@app.before_request
+def startUnitOfWork():
+    UnitOfWork.Start()
+
+@app.after_request
+def finishUnitOfWork(response):
+    if not UnitOfWork.Finish(response.status_code < 500):
+        return ResponseObject(False, "Database error", status_code=500)
+    return response
+
+@app.teardown_request
+def discardUnitOfWork(exception):
+    UnitOfWork.Discard()
+
 @app.before_request
 def auth_req():
     if request.method.lower() == 'options':
@@ -231,9 +434,10 @@ def auth_req():
         apiKey = d.get('wg-dashboard-apikey')
         apiKeyEnabled = DashboardConfig.GetConfig("Server", "dashboard_api_key")[1]
         if apiKey is not None and len(apiKey) > 0 and apiKeyEnabled:
-            apiKeyExist = len(list(filter(lambda x : x.Key == apiKey, DashboardConfig.DashboardAPIKeys))) == 1
-            DashboardLogger.log(str(request.url), str(request.remote_addr), Message=f"API Key Access: {('true' if apiKeyExist else 'false')} - Key: {apiKey}")
+            apiKeyExist = DashboardConfig.validateAPIKey(apiKey)
             if not apiKeyExist:
+                DashboardLogger.log(str(request.url), str(request.remote_addr), Status="false",
+                                    Message=f"API Key Access: false - Key: {apiKey[:6]}...")
                 DashboardConfig.APIAccessed = False
                 response = Flask.make_response(app, {
                     "status": False,
@@ -265,6 +469,11 @@ def auth_req():
                 response.content_type = "application/json"
                 response.status_code = 401
                 return response
+    # Whitelisted routes reached without a session are not authenticated, they never trigger a reload
+    if (not authenticationRequired or DashboardConfig.APIAccessed
+            or ("username" in session and session.get("role") == "admin")
+            or (session.get("Role") == "client" and session.get("TotpVerified"))):
+        synchronizeWorker()
 
 @app.route(f'{APP_PREFIX}/api/handshake', methods=["GET", "OPTIONS"])
 def API_Handshake():
@@ -285,6 +494,9 @@ def API_RequireAuthentication():
 @app.post(f'{APP_PREFIX}/api/authenticate')
 def API_AuthenticateLogin():
     data = request.get_json()
+    if Coordinator.Workers > 1:
+        # Not authenticated yet, so no full reload, but the credentials may have been changed by another worker
+        DashboardConfig.reloadSettings()
     if not DashboardConfig.GetConfig("Server", "auth_req")[1]:
         return ResponseObject(True, DashboardConfig.GetConfig("Other", "welcome_session")[1])
     
@@ -331,7 +543,10 @@ def API_SignOut():
 @app.get(f'{APP_PREFIX}/api/getWireguardConfigurations')
 def API_getWireguardConfigurations():
     InitWireguardConfigurationsList()
-    return ResponseObject(data=[wc for wc in WireguardConfigurations.values()])
+    etag = hashlib.sha256(
+        ",".join(f"{name}:{wc.getETag()}" for name, wc in sorted(WireguardConfigurations.items())).encode()
+    ).hexdigest()[:32]
+    return ConditionalResponseObject(etag, lambda: ResponseObject(data=[wc for wc in WireguardConfigurations.values()]))
 
 @app.get(f'{APP_PREFIX}/api/newConfigurationTemplates')
 def API_NewConfigurationTemplates():
@@ -523,14 +738,20 @@ def API_getWireguardConfigurationRealtimeTraffic():
     configurationName = request.args.get('configurationName')
     if configurationName is None or configurationName not in WireguardConfigurations.keys():
         return ResponseObject(False, "Configuration does not exist", status_code=404)
-    return ResponseObject(data=WireguardConfigurations[configurationName].getRealtimeTrafficUsage())
+    history = request.args.get('history', '0')
+    if not history.isdigit():
+        return ResponseObject(False, "History must be a number of seconds", status_code=400)
+    return ResponseObject(data=WireguardConfigurations[configurationName].getRealtimeTrafficUsage(
+        InterfaceTraffic, min(int(history), InterfaceTraffic.historySize)
+    ))
 
 @app.get(f'{APP_PREFIX}/api/getWireguardConfigurationBackup')
 def API_getWireguardConfigurationBackup():
     configurationName = request.args.get('configurationName')
     if configurationName is None or configurationName not in WireguardConfigurations.keys():
         return ResponseObject(False, "Configuration does not exist",  status_code=404)
-    return ResponseObject(data=WireguardConfigurations[configurationName].getBackups())
+    return ResponseObject(data=WireguardConfigurations[configurationName].getBackups(
+        content=request.args.get('content', 'true') == 'true'))
 
 @app.get(f'{APP_PREFIX}/api/getAllWireguardConfigurationBackup')
 def API_getAllWireguardConfigurationBackup():
@@ -538,40 +759,43 @@ def API_getAllWireguardConfigurationBackup():
         "ExistingConfigurations": {},
         "NonExistingConfigurations": {}
     }
+    # With content=false only metadata is listed, contents are fetched with getWireguardConfigurationBackupContent
+    content = request.args.get('content', 'true') == 'true'
     existingConfiguration = WireguardConfigurations.keys()
     for i in existingConfiguration:
-        b = WireguardConfigurations[i].getBackups(True)
+        b = WireguardConfigurations[i].getBackups(content, content)
         if len(b) > 0:
-            data['ExistingConfigurations'][i] = WireguardConfigurations[i].getBackups(True)
+            data['ExistingConfigurations'][i] = b
             
     for protocol in ProtocolsEnabled():
         directory = os.path.join(DashboardConfig.GetConfig("Server", f"{protocol}_conf_path")[1], 'WGDashboard_Backup')
-        if os.path.exists(directory):
-            files = [(file, os.path.getctime(os.path.join(directory, file)))
-                     for file in os.listdir(directory) if os.path.isfile(os.path.join(directory, file))]
-            files.sort(key=lambda x: x[1], reverse=True)
-        
-            for f, ct in files:
-                if RegexMatch(r"^(.*)_(.*)\.(conf)$", f):
-                    s = re.search(r"^(.*)_(.*)\.(conf)$", f)
-                    name = s.group(1)
-                    if name not in existingConfiguration:
-                        if name not in data['NonExistingConfigurations'].keys():
-                            data['NonExistingConfigurations'][name] = []
-                        
-                        date = s.group(2)
-                        d = {
-                            "protocol": protocol,
-                            "filename": f,
-                            "backupDate": date,
-                            "content": open(os.path.join(DashboardConfig.GetConfig("Server", f"{protocol}_conf_path")[1], 'WGDashboard_Backup', f), 'r').read()
-                        }
-                        if f.replace(".conf", ".sql") in list(os.listdir(directory)):
-                            d['database'] = True
-                            d['databaseContent'] = open(os.path.join(DashboardConfig.GetConfig("Server", f"{protocol}_conf_path")[1], 'WGDashboard_Backup', f.replace(".conf", ".sql")), 'r').read()
-                        data['NonExistingConfigurations'][name].append(d)
+        for backup in BackupIndex.List(directory):
+            name = backup['configuration']
+            if name not in existingConfiguration:
+                d = {"protocol": protocol, **{k: v for k, v in backup.items() if k != 'configuration'}}
+                if content:
+                    with open(os.path.join(directory, backup['filename']), 'r') as f:
+                        d['content'] = f.read()
+                    if backup['database']:
+                        with open(os.path.join(directory, backup['filename'].replace(".conf", ".sql")), 'r') as f:
+                            d['databaseContent'] = f.read()
+                data['NonExistingConfigurations'].setdefault(name, []).append(d)
     return ResponseObject(data=data)
 
+@app.get(f'{APP_PREFIX}/api/getWireguardConfigurationBackupContent')
+def API_getWireguardConfigurationBackupContent():
+    protocol = request.args.get('protocol', 'wg')
+    backupFileName = request.args.get('backupFileName')
+    database = request.args.get('database', 'false') == 'true'
+    if protocol not in ProtocolsEnabled():
+        return ResponseObject(False, "Protocol does not exist", status_code=404)
+    directory = os.path.join(DashboardConfig.GetConfig("Server", f"{protocol}_conf_path")[1], 'WGDashboard_Backup')
+    backup = next((b for b in BackupIndex.List(directory) if b['filename'] == backupFileName), None)
+    if backup is None or (database and not backup['database']):
+        return ResponseObject(False, "Backup file does not exist", status_code=404)
+    fileName = backup['filename'].replace(".conf", ".sql") if database else backup['filename']
+    return send_file(os.path.join(directory, fileName), mimetype="text/plain", download_name=fileName)
+
 @app.get(f'{APP_PREFIX}/api/createWireguardConfigurationBackup')
 def API_createWireguardConfigurationBackup():
     configurationName = request.args.get('configurationName')
@@ -643,6 +867,8 @@ def API_updateDashboardConfigurationItem():
             WireguardConfigurations.clear()
             WireguardConfigurations.clear()
             InitWireguardConfigurationsList()
+    if data['section'] == "Peers" and data['key'] == 'peer_key_pool_size':
+        KeyPairs.start()
     return ResponseObject(True, data=DashboardConfig.GetConfig(data["section"], data["key"])[1])
 
 @app.get(f'{APP_PREFIX}/api/getDashboardAPIKeys')
@@ -708,6 +934,21 @@ def API_updatePeerSettings(configName):
             
     return ResponseObject(False, "Peer does not exist")
 
+@app.post(f'{APP_PREFIX}/api/updatePeerSettingsBatch/<configName>')
+def API_updatePeerSettingsBatch(configName):
+    if configName not in WireguardConfigurations.keys():
+        return ResponseObject(False, "Configuration does not exist", status_code=404)
+    data = request.get_json(silent=True)
+    if type(data) is not dict:
+        return ResponseObject(False, "Please provide a JSON object", status_code=400)
+    operations = data.get('operations')
+    if type(operations) is not list or len(operations) == 0:
+        return ResponseObject(False, "Please provide a list of operations", status_code=400)
+    if len(operations) > 10000:
+        return ResponseObject(False, "A batch can contain at most 10000 operations", status_code=400)
+    status, results = WireguardConfigurations[configName].updatePeers(operations, data.get('atomic', False) is True)
+    return ResponseObject(status, None if status else "Some operations were not applied", results)
+
 @app.post(f'{APP_PREFIX}/api/resetPeerData/<configName>')
 def API_resetPeerData(configName):
     data = request.get_json()
@@ -889,14 +1130,20 @@ def API_addPeers(configName):
                             f"The maximum number of peers can add is {sum(list(numberOfAvailableIPs.values()))}")
                 keyPairs = []
                 addedCount = 0
+                allowedIPsIndex = config.getAllowedIPsIndex()
                 for subnet in availableIps.keys():
                     for ip in availableIps[subnet]:
-                        newPrivateKey = GenerateWireguardPrivateKey()[1]
+                        # Free as an address, but it may still fall inside another peer's allowed IPs range
+                        if len(allowedIPsIndex.overlaps(ip)) > 0:
+                            continue
+                        keyStatus, newPrivateKey, newPublicKey = KeyPairs.get()
+                        if not keyStatus:
+                            break
                         addedCount += 1
                         keyPairs.append({
                             "private_key": newPrivateKey,
-                            "id": GenerateWireguardPublicKey(newPrivateKey)[1],
-                            "preshared_key": (GenerateWireguardPrivateKey()[1] if preshared_key_bulkAdd else ""),
+                            "id": newPublicKey,
+                            "preshared_key": (GenerateWireguardPresharedKey()[1] if preshared_key_bulkAdd else ""),
                             "allowed_ip": ip,
                             "name": f"BulkPeer_{(addedCount + 1)}_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
                             "DNS": dns_addresses,
@@ -922,8 +1169,7 @@ def API_addPeers(configName):
 
                 if len(public_key) == 0:
                     if len(private_key) == 0:
-                        private_key = GenerateWireguardPrivateKey()[1]
-                        public_key = GenerateWireguardPublicKey(private_key)[1]
+                        _, private_key, public_key = KeyPairs.get()
                     else:
                         public_key = GenerateWireguardPublicKey(private_key)[1]
                 else:
@@ -953,6 +1199,8 @@ def API_addPeers(configName):
                         
                         if not found:
                             return ResponseObject(False, f"This IP is not available: {i}")
+                    if len(config.getAllowedIPsIndex().overlaps(','.join(allowed_ips))) > 0:
+                        return ResponseObject(False, "Allowed IP already taken by another peer")
 
                 status, addedPeers, message = config.addPeers([
                     {
@@ -1002,6 +1250,41 @@ def API_downloadAllPeers(configName):
         peerData.append(file)
     return ResponseObject(data=peerData)
 
+@app.get(f"{APP_PREFIX}/api/downloadAllPeersZip/<configName>")
+def API_downloadAllPeersZip(configName):
+    if configName not in WireguardConfigurations.keys():
+        return ResponseObject(False, "Configuration does not exist", status_code=404)
+    configuration = WireguardConfigurations[configName]
+    peers = list(configuration.Peers)
+    group = request.args.get('group')
+    if group:
+        peerGroup = configuration.configurationInfo.PeerGroups.get(group)
+        if peerGroup is None:
+            return ResponseObject(False, "Peer group does not exist", status_code=404)
+        groupPeers = set(peerGroup.Peers)
+        peers = [p for p in peers if p.id in groupPeers]
+
+    def files():
+        fileNames = set()
+        for peer in peers:
+            try:
+                file = peer.downloadPeer()
+            except Exception as e:
+                app.logger.error(f"Rendering peer {peer.id} of {configName} failed", exc_info=e)
+                continue
+            fileName, n = file["fileName"], 0
+            while fileName in fileNames:
+                n += 1
+                fileName = f"{n}_{file['fileName']}"
+            fileNames.add(fileName)
+            yield f"{fileName}.conf", file["file"]
+
+    # Streamed from the start, no Content-Length, the archive is built as peers are rendered
+    return app.response_class(ZipStream.Stream(files()), mimetype="application/zip", headers={
+        "Content-Disposition": f'attachment; filename="{configName}.zip"',
+        "Cache-Control": "no-cache"
+    })
+
 @app.get(f"{APP_PREFIX}/api/getAvailableIPs/<configName>")
 def API_getAvailableIPs(configName):
     if configName not in WireguardConfigurations.keys():
@@ -1016,15 +1299,118 @@ def API_getNumberOfAvailableIPs(configName):
     status, ips = WireguardConfigurations.get(configName).getNumberOfAvailableIP()
     return ResponseObject(status=status, data=ips)
 
+def ProjectPeerLists(configuration: WireguardConfiguration, data: dict) -> tuple[bool, dict | str]:
+    """
+    Apply the fields= projection and format=compact encoding of the request to the peer lists in data
+    @param configuration: Configuration the peers belong to
+    @param data: Response data holding configurationPeers and configurationRestrictedPeers
+    @return: Projected data, or False and an error message
+    """
+    fields = request.args.get("fields")
+    compact = request.args.get("format") == "compact"
+    if fields is None and not compact:
+        return True, data
+    allowedFields = (AmneziaWGPeer if configuration.Protocol == "awg" else Peer).SerializedFields + ['configuration']
+    if fields is not None:
+        # Each field once, in the order asked for
+        fields = list(dict.fromkeys(f.strip() for f in fields.split(",") if len(f.strip()) > 0))
+        unknownFields = [f for f in fields if f not in allowedFields]
+        if len(unknownFields) > 0:
+            return False, f"Unknown fields: {', '.join(unknownFields)}"
+    else:
+        # Keys are only sent when they are asked for by name
+        fields = [f for f in allowedFields if f not in Peer.SecretFields]
+    for key in ["configurationPeers", "configurationRestrictedPeers"]:
+        rows = [p.toJson(fields) for p in data[key]]
+        data[key] = {
+            "columns": fields,
+            "rows": [[r[f] for f in fields] for r in rows]
+        } if compact else rows
+    return True, data
+
 @app.get(f'{APP_PREFIX}/api/getWireguardConfigurationInfo')
 def API_getConfigurationInfo():
     configurationName = request.args.get("configurationName")
     if not configurationName or configurationName not in WireguardConfigurations.keys():
         return ResponseObject(False, "Please provide configuration name")
-    return ResponseObject(data={
-        "configurationInfo": WireguardConfigurations[configurationName],
-        "configurationPeers": WireguardConfigurations[configurationName].getPeersList(),
-        "configurationRestrictedPeers": WireguardConfigurations[configurationName].getRestrictedPeersList()
+    configuration = WireguardConfigurations[configurationName]
+    # Refresh first, reading the restricted peers may bump the state version the ETag is made of
+    restrictedPeers = configuration.getRestrictedPeersList()
+    query = request.query_string + DashboardConfig.GetConfig("Server", "dashboard_sort")[1].encode()
+    etag = f'{configuration.getETag()}-{hashlib.sha256(query).hexdigest()[:8]}'
+    if MatchETag(etag) is not None:
+        return ConditionalResponseObject(etag, None)
+    queryKeys = ["page", "pageSize", "sort", "order", "status", "search"]
+    if not any(k in request.args.keys() for k in queryKeys):
+        status, data = ProjectPeerLists(configuration, {
+            "configurationInfo": configuration,
+            "configurationPeers": configuration.getPeersList(),
+            "configurationRestrictedPeers": restrictedPeers
+        })
+        if not status:
+            return ResponseObject(False, data)
+        return ConditionalResponseObject(etag, lambda: ResponseObject(data=data))
+    page = request.args.get("page", type=int)
+    pageSize = request.args.get("pageSize", 50, type=int)
+    if ("page" in request.args.keys() and (page is None or page < 1)) or pageSize is None or not 1 <= pageSize <= 1000:
+        return ResponseObject(False, "page must be at least 1 and pageSize between 1 and 1000")
+    if request.args.get("order", "asc") not in ("asc", "desc"):
+        return ResponseObject(False, "order must be either asc or desc")
+    status, data = ProjectPeerLists(configuration, {
+        "configurationInfo": configuration,
+        **configuration.queryPeers(
+            page=page,
+            pageSize=pageSize,
+            sort=request.args.get("sort", DashboardConfig.GetConfig("Server", "dashboard_sort")[1]),
+            order=request.args.get("order", "asc"),
+            status=request.args.get("status"),
+            search=request.args.get("search")
+        )
+    })
+    if not status:
+        return ResponseObject(False, data)
+    return ConditionalResponseObject(etag, lambda: ResponseObject(data=data))
+
+@app.get(f'{APP_PREFIX}/api/getWireguardConfigurationPeerChanges')
+def API_getConfigurationPeerChanges():
+    configurationName = request.args.get("configurationName")
+    if not configurationName or configurationName not in WireguardConfigurations.keys():
+        return ResponseObject(False, "Please provide configuration name")
+    configuration = WireguardConfigurations[configurationName]
+    status, data = ProjectPeerLists(configuration, {
+        "configurationInfo": configuration,
+        **configuration.getPeerChanges(request.args.get("since"))
+    })
+    if not status:
+        return ResponseObject(False, data)
+    return ResponseObject(data=data)
+
+@app.get(f'{APP_PREFIX}/api/stream/<configName>')
+def API_StreamConfigurationPeers(configName):
+    if configName not in WireguardConfigurations.keys():
+        return ResponseObject(False, "Configuration does not exist", status_code=404)
+    subscriber = PeerEvents.subscribe(configName)
+    if subscriber is None:
+        return ResponseObject(False, "Too many open streams, please try again later", status_code=503)
+    snapshot = PeerEvents.snapshot(WireguardConfigurations[configName])
+
+    def stream():
+        # Streams are closed after 30 minutes so gthread workers are recycled, EventSource reconnects on its own
+        started = time.time()
+        try:
+            yield f"retry: 10000\nevent: snapshot\ndata: {json.dumps(snapshot)}\n\n"
+            while time.time() - started < 1800 and not subscriber.Dropped:
+                try:
+                    event = subscriber.Queue.get(timeout=15)
+                    yield f"event: peers\ndata: {json.dumps(event)}\n\n"
+                except queue.Empty:
+                    yield ": heartbeat\n\n"
+        finally:
+            PeerEvents.unsubscribe(subscriber)
+
+    return app.response_class(stream(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
     })
 
 @app.get(f'{APP_PREFIX}/api/getPeerHistoricalEndpoints')
@@ -1121,14 +1507,59 @@ def API_GetPeerTrackingTableCounts():
 def API_DownloadPeerTackingTable():
     configurationName = request.args.get("configurationName")
     table = request.args.get('table')
+    exportFormat = request.args.get('format', 'json')
     if configurationName not in WireguardConfigurations.keys():
         return ResponseObject(False, "Configuration does not exist")
     if table not in ['TrafficTrackingTable', 'HistoricalTrackingTable']:
         return ResponseObject(False, "Table does not exist")
+    if exportFormat not in ['json', 'ndjson', 'csv']:
+        return ResponseObject(False, "Format can only be json, ndjson or csv", status_code=400)
+    try:
+        since = datetime.fromisoformat(request.args['since']) if request.args.get('since') else None
+        until = datetime.fromisoformat(request.args['until']) if request.args.get('until') else None
+    except ValueError:
+        return ResponseObject(False, "since and until must be ISO 8601 date times", status_code=400)
     c = WireguardConfigurations.get(configurationName)
-    return ResponseObject(
-        data=c.downloadTransferTable() if table == 'TrafficTrackingTable' 
-        else c.downloadHistoricalEndpointTable())
+    rows = c.downloadTrackingTable(table, since, until, request.args.get('peer') or None)
+
+    def stream():
+        try:
+            if exportFormat == 'json':
+                # Same envelope as ResponseObject, written one row at a time. status comes last, so it is only true
+                # once every row was written
+                yield '{"data": ['
+                for i, row in enumerate(rows):
+                    yield ("," if i > 0 else "") + app.json.dumps(row)
+                yield '], "status": true, "message": null}'
+            elif exportFormat == 'ndjson':
+                for row in rows:
+                    yield app.json.dumps(row) + "\n"
+            else:
+                buffer = io.StringIO()
+                writer = csv.DictWriter(buffer, fieldnames=c.trackingTableColumns(table))
+                writer.writeheader()
+                yield buffer.getvalue()
+                for row in rows:
+                    buffer.seek(0)
+                    buffer.truncate()
+                    writer.writerow(row)
+                    yield buffer.getvalue()
+        except Exception as e:
+            app.logger.error(f"Exporting {table} of {configurationName} failed", exc_info=e)
+            # The HTTP status is already sent, end the body with a marker so the export is not taken as complete.
+            # The json envelope's status has not been written yet, it is written once, as false
+            if exportFormat == 'json':
+                yield '], "status": false, "message": "Export failed, the data is incomplete"}'
+            elif exportFormat == 'ndjson':
+                yield app.json.dumps({"status": False, "message": "Export failed, the data is incomplete"}) + "\n"
+            else:
+                yield "# Export failed, the data is incomplete\n"
+
+    mimetype = {'json': 'application/json', 'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}[exportFormat]
+    headers = {"Cache-Control": "no-cache"}
+    if exportFormat != 'json':
+        headers["Content-Disposition"] = f'attachment; filename="{configurationName}_{table}.{exportFormat}"'
+    return app.response_class(stream(), mimetype=mimetype, headers=headers)
 
 @app.post(f'{APP_PREFIX}/api/deletePeerTrackingTable')
 def API_DeletePeerTrackingTable():
@@ -1689,5 +2120,7 @@ def index():
 
 if __name__ == "__main__":
     startThreads()
-    DashboardPlugins.startThreads()
-    app.run(host=app_ip, debug=False, port=app_port)
\ No newline at end of file
+    try:
+        app.run(host=app_ip, debug=False, port=app_port)
+    finally:
+        FlushAPIKeyUsage()
\ No newline at end of file
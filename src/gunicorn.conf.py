@@ -1,3 +1,4 @@
+import os
 import dashboard
 from datetime import datetime
 global sqldb, cursor, DashboardConfig, WireguardConfigurations, AllPeerJobs, JobLogger, Dash
@@ -5,12 +6,17 @@ app_host, app_port = dashboard.gunicornConfig()
 date = datetime.today().strftime('%Y_%m_%d_%H_%M_%S')
 
 def post_worker_init(worker):
+    # Only the worker holding the leader lock runs the collector, job scheduler and plugins
     dashboard.startThreads()
-    dashboard.DashboardPlugins.startThreads()
+
+def worker_exit(server, worker):
+    # API key usage counted since the last background flush would be lost with the worker
+    dashboard.FlushAPIKeyUsage()
 
 worker_class = 'gthread'
-workers = 1
-threads = 2
+workers = int(os.environ.get("WGDASHBOARD_WORKERS", "1"))
+# Each open /api/stream connection holds a thread, PeerEventStream allows at most 4 of them
+threads = 8
 bind = f"{app_host}:{app_port}"
 daemon = True
 pidfile = './gunicorn.pid'
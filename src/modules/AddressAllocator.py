@@ -0,0 +1,280 @@
+"""
+Address Allocator
+"""
+import hashlib
+import ipaddress
+import threading
+from typing import Iterator
+
+from flask import current_app
+
+# IPv4 networks with more host addresses than this are not worth a bitmap
+BitmapMaximumSize = 1 << 24
+
+
+def HostRange(network: ipaddress.IPv4Network | ipaddress.IPv6Network) -> tuple[int, int]:
+    """
+    First and last address network.hosts() would return
+    """
+    if network.num_addresses <= 2:
+        return int(network.network_address), int(network.broadcast_address)
+    if network.version == 6:
+        return int(network.network_address) + 1, int(network.broadcast_address)
+    return int(network.network_address) + 1, int(network.broadcast_address) - 1
+
+
+class BitmapAddressPool:
+    """
+    Host addresses of one subnet as a bitmap, one bit per address. The cursor points at the lowest address that
+    may be free, so handing out addresses in order costs O(1) amortized.
+    """
+    def __init__(self, network: ipaddress.IPv4Network | ipaddress.IPv6Network):
+        self.Network = network
+        self.__first, last = HostRange(network)
+        self.Size = last - self.__first + 1
+        self.Used = 0
+        self.__bitmap = bytearray((self.Size + 7) // 8)
+        self.__cursor = 0
+
+    def contains(self, address: int) -> bool:
+        return 0 <= address - self.__first < self.Size
+
+    def mark(self, address: int):
+        i = address - self.__first
+        if not self.__bitmap[i >> 3] & (1 << (i & 7)):
+            self.__bitmap[i >> 3] |= 1 << (i & 7)
+            self.Used += 1
+
+    def unmark(self, address: int):
+        i = address - self.__first
+        if self.__bitmap[i >> 3] & (1 << (i & 7)):
+            self.__bitmap[i >> 3] &= ~(1 << (i & 7))
+            self.Used -= 1
+            self.__cursor = min(self.__cursor, i)
+
+    def free(self) -> Iterator[int]:
+        """
+        Free addresses in ascending order, starting at the cursor
+        """
+        byte = self.__cursor >> 3
+        # Everything before the first free address is used, move the cursor past it for the next caller
+        advanced = False
+        while byte < len(self.__bitmap):
+            if self.__bitmap[byte] != 0xFF:
+                for bit in range(8):
+                    i = (byte << 3) | bit
+                    if i >= self.Size:
+                        return
+                    if not self.__bitmap[byte] & (1 << bit):
+                        if not advanced:
+                            self.__cursor = max(self.__cursor, i)
+                            advanced = True
+                        yield self.__first + i
+            byte += 1
+
+    def available(self) -> int:
+        return self.Size - self.Used
+
+
+class SparseAddressPool:
+    """
+    Host addresses of a network too large for a bitmap, such as an IPv6 /64. Only used addresses are stored, in a
+    set, so conflict checks are O(1) and the capacity is plain arithmetic.
+    In sequential mode free addresses are handed out from the start of the network, in hashed mode they are spread
+    over the network in a pseudo-random but stable order. Both modes keep a cursor past the addresses known to be
+    used, so handing out addresses one after another does not walk over the earlier ones again.
+    """
+    def __init__(self, network: ipaddress.IPv4Network | ipaddress.IPv6Network, mode: str = "sequential"):
+        self.Network = network
+        self.Mode = mode
+        self.__first, last = HostRange(network)
+        self.Size = last - self.__first + 1
+        self.__used: set[int] = set()
+        self.__cursor = self.__first
+        # Position in the hashed probe sequence before which every probed address is used
+        self.__probeCursor = 0
+        self.__seed = network.compressed.encode()
+
+    @property
+    def Used(self) -> int:
+        return len(self.__used)
+
+    def contains(self, address: int) -> bool:
+        return 0 <= address - self.__first < self.Size
+
+    def isUsed(self, address: int) -> bool:
+        return address in self.__used
+
+    def mark(self, address: int):
+        self.__used.add(address)
+
+    def unmark(self, address: int):
+        if address in self.__used:
+            self.__used.discard(address)
+            self.__cursor = min(self.__cursor, address)
+            # The address may sit anywhere in the probe sequence, the next call walks it again once
+            self.__probeCursor = 0
+
+    def free(self) -> Iterator[int]:
+        if self.Mode == "hashed":
+            yield from self.__freeHashed()
+        else:
+            yield from self.__freeSequential()
+
+    def __freeSequential(self) -> Iterator[int]:
+        # Everything before the cursor is known to be used
+        address = self.__cursor
+        last = self.__first + self.Size
+        while address < last and address in self.__used:
+            address += 1
+        self.__cursor = address
+        while address < last:
+            if address not in self.__used:
+                yield address
+            address += 1
+
+    def __probe(self, counter: int) -> int:
+        digest = hashlib.blake2b(self.__seed + counter.to_bytes(8, "big"), digest_size=16).digest()
+        return self.__first + int.from_bytes(digest, "big") % self.Size
+
+    def __freeHashed(self) -> Iterator[int]:
+        yielded = set()
+        counter = self.__probeCursor
+        misses = 0
+        advancing = True
+        # Random probing stops making progress once the pool is nearly full, walk the rest sequentially
+        while len(yielded) < self.available() and misses < (1 << 16 if advancing else 1024):
+            address = self.__probe(counter)
+            counter += 1
+            if address in yielded or address in self.__used:
+                misses += 1
+                if advancing:
+                    self.__probeCursor = counter
+                continue
+            advancing = False
+            misses = 0
+            yielded.add(address)
+            yield address
+        for address in self.__freeSequential():
+            if address not in yielded:
+                yield address
+
+    def available(self) -> int:
+        return self.Size - self.Used
+
+
+class AddressAllocator:
+    """
+    Tracks which host addresses of a configuration's subnets are used by its peers. Peers are assigned and released
+    one at a time, an address shared by several peers stays used until the last of them releases it.
+    """
+    def __init__(self, address: str, ipv6Mode: str = "sequential"):
+        """
+        @param address: Address of the configuration, comma separated list of interface addresses with prefixes
+        @param ipv6Mode: sequential or hashed, how IPv6 addresses are picked
+        """
+        self.Address = address
+        self.IPv6Mode = ipv6Mode
+        self.Version = None
+        self.Pools: dict[str, BitmapAddressPool | SparseAddressPool] = {}
+        self.__owners: dict[str, tuple[str, list]] = {}
+        self.__references: dict[ipaddress.IPv4Address | ipaddress.IPv6Address, int] = {}
+        self.__lock = threading.RLock()
+        for ca in address.split(','):
+            ca = ca.strip()
+            caSplit = ca.split('/')
+            if len(caSplit) != 2:
+                continue
+            try:
+                network = ipaddress.ip_network(ca, False)
+                if network.version == 6:
+                    self.Pools[ca] = SparseAddressPool(network, ipv6Mode)
+                elif network.num_addresses <= BitmapMaximumSize:
+                    self.Pools[ca] = BitmapAddressPool(network)
+                else:
+                    self.Pools[ca] = SparseAddressPool(network)
+            except ValueError as e:
+                current_app.logger.error(f"Error: Failed to parse IP address {ca}", e)
+                continue
+            # The interface's own address is never handed out
+            self.assign(f"Interface:{ca}", ca)
+
+    @staticmethod
+    def __parse(allowedIp: str) -> list:
+        addresses = []
+        for pip in allowedIp.split(','):
+            ppip = pip.strip().split('/')
+            if len(ppip) == 2:
+                try:
+                    addresses.append(ipaddress.ip_address(ppip[0]))
+                except ValueError:
+                    pass
+        return addresses
+
+    def __reference(self, address, delta: int):
+        count = self.__references.get(address, 0) + delta
+        if count > 0:
+            self.__references[address] = count
+        else:
+            self.__references.pop(address, None)
+        if count == (1 if delta > 0 else 0):
+            for pool in self.Pools.values():
+                if pool.Network.version == address.version and pool.contains(int(address)):
+                    if delta > 0:
+                        pool.mark(int(address))
+                    else:
+                        pool.unmark(int(address))
+
+    def assign(self, peerId: str, allowedIp: str):
+        """
+        Mark the addresses of a peer's allowed IPs as used, releasing what the peer used before
+        """
+        with self.__lock:
+            owner = self.__owners.get(peerId)
+            if owner is not None and owner[0] == allowedIp:
+                return
+            self.release(peerId)
+            addresses = self.__parse(allowedIp)
+            for address in addresses:
+                self.__reference(address, 1)
+            self.__owners[peerId] = (allowedIp, addresses)
+
+    def release(self, peerId: str):
+        with self.__lock:
+            owner = self.__owners.pop(peerId, None)
+            if owner is not None:
+                for address in owner[1]:
+                    self.__reference(address, -1)
+
+    def sync(self, peers: list):
+        """
+        Bring the allocator in line with a full list of peers, only peers whose allowed IPs changed are touched
+        """
+        with self.__lock:
+            ids = set()
+            for peer in peers:
+                ids.add(peer.id)
+                self.assign(peer.id, peer.allowed_ip)
+            for peerId in [k for k in self.__owners.keys() if k not in ids and not k.startswith("Interface:")]:
+                self.release(peerId)
+
+    def getAvailable(self, threshold: int = 255) -> dict[str, list[str] | Iterator[str]]:
+        """
+        Free addresses of every subnet
+        @param threshold: Maximum number of addresses per subnet, -1 returns lazy iterators instead of lists
+        """
+        available = {}
+        for ca, pool in self.Pools.items():
+            addressClass, prefix = ((ipaddress.IPv4Address, 32) if pool.Network.version == 4
+                                    else (ipaddress.IPv6Address, 128))
+            addresses = (f"{addressClass(a).compressed}/{prefix}" for a in pool.free())
+            if threshold == -1:
+                available[ca] = addresses
+            else:
+                with self.__lock:
+                    available[ca] = [a for a, _ in zip(addresses, range(threshold))]
+        return available
+
+    def getNumberOfAvailable(self) -> dict[str, int]:
+        with self.__lock:
+            return {ca: pool.available() for ca, pool in self.Pools.items()}
@@ -1,19 +1,25 @@
 import os
 from flask import current_app
 import random
-import re
 import subprocess
 import uuid
 
 from .Peer import Peer
-from .Utilities import ValidateIPAddressesWithRange, ValidateDNSAddress, GenerateWireguardPublicKey
+from .UnitOfWork import UnitOfWork
 
 
 class AmneziaWGPeer(Peer):
+    SerializedFields = Peer.SerializedFields + ['advanced_security']
+    SettingsFields = Peer.SettingsFields + ['advanced_security']
+
     def __init__(self, tableData, configuration):
         self.advanced_security = tableData["advanced_security"]
         super().__init__(tableData, configuration)
 
+    def validateSettings(self, settings: dict) -> tuple[bool, str] | tuple[bool, None]:
+        if settings['advanced_security'] != "on" and settings['advanced_security'] != "off":
+            return False, "Advanced Security can only be on or off"
+        return super().validateSettings(settings)
 
     def updatePeer(self, name: str, private_key: str,
                    preshared_key: str,
@@ -22,34 +28,19 @@ class AmneziaWGPeer(Peer):
         if not self.configuration.getStatus():
             self.configuration.toggleConfiguration()
 
-        existingAllowedIps = [item for row in list(
-            map(lambda x: [q.strip() for q in x.split(',')],
-                map(lambda y: y.allowed_ip,
-                    list(filter(lambda k: k.id != self.id, self.configuration.getPeersList()))))) for item in row]
-
-        if allowed_ip in existingAllowedIps:
+        if allowed_ip.replace(" ", "") != self.allowed_ip.replace(" ", "") and \
+                len(self.configuration.getAllowedIPsIndex().overlaps(allowed_ip, self.id)) > 0:
             return False, "Allowed IP already taken by another peer"
-        if not ValidateIPAddressesWithRange(endpoint_allowed_ip):
-            return False, f"Endpoint Allowed IPs format is incorrect"
-        if len(dns_addresses) > 0 and not ValidateDNSAddress(dns_addresses):
-            return False, f"DNS format is incorrect"
 
-        if type(mtu) is str:
-            mtu = 0
-
-        if type(keepalive) is str:
-            keepalive = 0
-        
-        if mtu < 0 or mtu > 1460:
-            return False, "MTU format is not correct"
-        if keepalive < 0:
-            return False, "Persistent Keepalive format is not correct"
-        if advanced_security != "on" and advanced_security != "off":
-            return False, "Advanced Security can only be on or off"
-        if len(private_key) > 0:
-            pubKey = GenerateWireguardPublicKey(private_key)
-            if not pubKey[0] or pubKey[1] != self.id:
-                return False, "Private key does not match with the public key"
+        settings = {
+            "name": name, "private_key": private_key, "preshared_key": preshared_key, "DNS": dns_addresses,
+            "allowed_ip": allowed_ip, "endpoint_allowed_ip": endpoint_allowed_ip, "mtu": mtu, "keepalive": keepalive,
+            "advanced_security": advanced_security
+        }
+        valid, msg = self.validateSettings(settings)
+        if not valid:
+            return False, msg
+        mtu, keepalive = settings['mtu'], settings['keepalive']
         try:
             rd = random.Random()
             uid = str(uuid.UUID(int=rd.getrandbits(128), version=4))
@@ -58,10 +49,7 @@ class AmneziaWGPeer(Peer):
             if pskExist:
                 with open(uid, "w+") as f:
                     f.write(preshared_key)
-            newAllowedIPs = allowed_ip.replace(" ", "")
-
-            if not re.match(r"^[0-9a-fA-F\.\,:/ ]+$", newAllowedIPs):
-                return False, "Allowed IPs entry format is incorrect"
+            newAllowedIPs = settings['allowed_ip']
 
             command = [self.configuration.Protocol, "set", self.configuration.Name, "peer", self.id, "allowed-ips", newAllowedIPs, "preshared-key", uid if pskExist else "/dev/null"]
             updateAllowedIp = subprocess.check_output(command, stderr=subprocess.STDOUT)
@@ -79,7 +67,7 @@ class AmneziaWGPeer(Peer):
                 current_app.logger.error("Update peer failed when saving the configuration")
                 return False, "Internal server error"
 
-            with self.configuration.engine.begin() as conn:
+            with UnitOfWork.Begin(self.configuration.engine) as conn:
                 conn.execute(
                     self.configuration.peersTable.update().values({
                         "name": name,
@@ -6,7 +6,8 @@ from flask import current_app
 from .PeerJobs import PeerJobs
 from .AmneziaWGPeer import AmneziaWGPeer
 from .PeerShareLinks import PeerShareLinks
-from .Utilities import RegexMatch
+from .Utilities import RegexMatch, BytesToGigabytes
+from .UnitOfWork import UnitOfWork
 from .WireguardConfiguration import WireguardConfiguration
 from .DashboardWebHooks import DashboardWebHooks
 
@@ -45,9 +46,9 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
             "SaveConfig": self.SaveConfig,
             "Info": self.configurationInfo.model_dump(),
             "DataUsage": {
-                "Total": sum(list(map(lambda x: x.cumu_data + x.total_data, self.Peers))),
-                "Sent": sum(list(map(lambda x: x.cumu_sent + x.total_sent, self.Peers))),
-                "Receive": sum(list(map(lambda x: x.cumu_receive + x.total_receive, self.Peers)))
+                "Total": BytesToGigabytes(sum(list(map(lambda x: x.cumu_data + x.total_data, self.Peers)))),
+                "Sent": BytesToGigabytes(sum(list(map(lambda x: x.cumu_sent + x.total_sent, self.Peers)))),
+                "Receive": BytesToGigabytes(sum(list(map(lambda x: x.cumu_receive + x.total_receive, self.Peers))))
             },
             "ConnectedPeers": len(list(filter(lambda x: x.status == "running", self.Peers))),
             "TotalPeers": len(self.Peers),
@@ -77,16 +78,16 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
             sqlalchemy.Column('advanced_security', sqlalchemy.String(255)),
             sqlalchemy.Column('endpoint_allowed_ip', sqlalchemy.Text),
             sqlalchemy.Column('name', sqlalchemy.Text),
-            sqlalchemy.Column('total_receive', sqlalchemy.Float),
-            sqlalchemy.Column('total_sent', sqlalchemy.Float),
-            sqlalchemy.Column('total_data', sqlalchemy.Float),
+            sqlalchemy.Column('total_receive', sqlalchemy.BigInteger),
+            sqlalchemy.Column('total_sent', sqlalchemy.BigInteger),
+            sqlalchemy.Column('total_data', sqlalchemy.BigInteger),
             sqlalchemy.Column('endpoint', sqlalchemy.String(255)),
             sqlalchemy.Column('status', sqlalchemy.String(255)),
             sqlalchemy.Column('latest_handshake', sqlalchemy.String(255)),
             sqlalchemy.Column('allowed_ip', sqlalchemy.String(255)),
-            sqlalchemy.Column('cumu_receive', sqlalchemy.Float),
-            sqlalchemy.Column('cumu_sent', sqlalchemy.Float),
-            sqlalchemy.Column('cumu_data', sqlalchemy.Float),
+            sqlalchemy.Column('cumu_receive', sqlalchemy.BigInteger),
+            sqlalchemy.Column('cumu_sent', sqlalchemy.BigInteger),
+            sqlalchemy.Column('cumu_data', sqlalchemy.BigInteger),
             sqlalchemy.Column('mtu', sqlalchemy.Integer),
             sqlalchemy.Column('keepalive', sqlalchemy.Integer),
             sqlalchemy.Column('remote_endpoint', sqlalchemy.String(255)),
@@ -101,16 +102,16 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
             sqlalchemy.Column('advanced_security', sqlalchemy.String(255)),
             sqlalchemy.Column('endpoint_allowed_ip', sqlalchemy.Text),
             sqlalchemy.Column('name', sqlalchemy.Text),
-            sqlalchemy.Column('total_receive', sqlalchemy.Float),
-            sqlalchemy.Column('total_sent', sqlalchemy.Float),
-            sqlalchemy.Column('total_data', sqlalchemy.Float),
+            sqlalchemy.Column('total_receive', sqlalchemy.BigInteger),
+            sqlalchemy.Column('total_sent', sqlalchemy.BigInteger),
+            sqlalchemy.Column('total_data', sqlalchemy.BigInteger),
             sqlalchemy.Column('endpoint', sqlalchemy.String(255)),
             sqlalchemy.Column('status', sqlalchemy.String(255)),
             sqlalchemy.Column('latest_handshake', sqlalchemy.String(255)),
             sqlalchemy.Column('allowed_ip', sqlalchemy.String(255)),
-            sqlalchemy.Column('cumu_receive', sqlalchemy.Float),
-            sqlalchemy.Column('cumu_sent', sqlalchemy.Float),
-            sqlalchemy.Column('cumu_data', sqlalchemy.Float),
+            sqlalchemy.Column('cumu_receive', sqlalchemy.BigInteger),
+            sqlalchemy.Column('cumu_sent', sqlalchemy.BigInteger),
+            sqlalchemy.Column('cumu_data', sqlalchemy.BigInteger),
             sqlalchemy.Column('mtu', sqlalchemy.Integer),
             sqlalchemy.Column('keepalive', sqlalchemy.Integer),
             sqlalchemy.Column('remote_endpoint', sqlalchemy.String(255)),
@@ -120,12 +121,12 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
         self.peersTransferTable = sqlalchemy.Table(
             f'{dbName}_transfer', self.metadata,
             sqlalchemy.Column('id', sqlalchemy.String(255), nullable=False),
-            sqlalchemy.Column('total_receive', sqlalchemy.Float),
-            sqlalchemy.Column('total_sent', sqlalchemy.Float),
-            sqlalchemy.Column('total_data', sqlalchemy.Float),
-            sqlalchemy.Column('cumu_receive', sqlalchemy.Float),
-            sqlalchemy.Column('cumu_sent', sqlalchemy.Float),
-            sqlalchemy.Column('cumu_data', sqlalchemy.Float),
+            sqlalchemy.Column('total_receive', sqlalchemy.BigInteger),
+            sqlalchemy.Column('total_sent', sqlalchemy.BigInteger),
+            sqlalchemy.Column('total_data', sqlalchemy.BigInteger),
+            sqlalchemy.Column('cumu_receive', sqlalchemy.BigInteger),
+            sqlalchemy.Column('cumu_sent', sqlalchemy.BigInteger),
+            sqlalchemy.Column('cumu_data', sqlalchemy.BigInteger),
             sqlalchemy.Column('time', (sqlalchemy.DATETIME if self.DashboardConfig.GetConfig("Database", "type")[1] == 'sqlite' else sqlalchemy.TIMESTAMP),
                               server_default=sqlalchemy.func.now()),
             extend_existing=True
@@ -138,16 +139,16 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
             sqlalchemy.Column('advanced_security', sqlalchemy.String(255)),
             sqlalchemy.Column('endpoint_allowed_ip', sqlalchemy.Text),
             sqlalchemy.Column('name', sqlalchemy.Text),
-            sqlalchemy.Column('total_receive', sqlalchemy.Float),
-            sqlalchemy.Column('total_sent', sqlalchemy.Float),
-            sqlalchemy.Column('total_data', sqlalchemy.Float),
+            sqlalchemy.Column('total_receive', sqlalchemy.BigInteger),
+            sqlalchemy.Column('total_sent', sqlalchemy.BigInteger),
+            sqlalchemy.Column('total_data', sqlalchemy.BigInteger),
             sqlalchemy.Column('endpoint', sqlalchemy.String(255)),
             sqlalchemy.Column('status', sqlalchemy.String(255)),
             sqlalchemy.Column('latest_handshake', sqlalchemy.String(255)),
             sqlalchemy.Column('allowed_ip', sqlalchemy.String(255)),
-            sqlalchemy.Column('cumu_receive', sqlalchemy.Float),
-            sqlalchemy.Column('cumu_sent', sqlalchemy.Float),
-            sqlalchemy.Column('cumu_data', sqlalchemy.Float),
+            sqlalchemy.Column('cumu_receive', sqlalchemy.BigInteger),
+            sqlalchemy.Column('cumu_sent', sqlalchemy.BigInteger),
+            sqlalchemy.Column('cumu_data', sqlalchemy.BigInteger),
             sqlalchemy.Column('mtu', sqlalchemy.Integer),
             sqlalchemy.Column('keepalive', sqlalchemy.Integer),
             sqlalchemy.Column('remote_endpoint', sqlalchemy.String(255)),
@@ -170,10 +171,12 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
             extend_existing=True
         )
 
+        UnitOfWork.Flush(self.engine)
         self.metadata.create_all(self.engine)
+        self.migrateDataUsageColumns()
 
     def getPeers(self):
-        self.Peers.clear()        
+        tmpList = []
         if self.configurationFileChanged():
             with open(self.configPath, 'r') as configFile:
                 p = []
@@ -182,6 +185,7 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
                 try:
                     if "[Peer]" not in content:
                         current_app.logger.info(f"{self.Name} config has no [Peer] section")
+                        self.publishPeers(tmpList)
                         return
 
                     peerStarts = content.index("[Peer]")
@@ -202,7 +206,7 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
                             split = re.split(r'\s*=\s*', i, 1)
                             if len(split) == 2:
                                 p[pCounter]["name"] = split[1]
-                    with self.engine.begin() as conn:
+                    with UnitOfWork.Begin(self.engine) as conn:
                         for i in p:
                             if "PublicKey" in i.keys():
                                 tempPeer = conn.execute(self.peersTable.select().where(
@@ -243,14 +247,15 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
                                             self.peersTable.columns.id == i['PublicKey']
                                         )
                                     )
-                                self.Peers.append(AmneziaWGPeer(tempPeer, self))
+                                tmpList.append(AmneziaWGPeer(tempPeer, self))
                 except Exception as e:
                     current_app.logger.error(f"{self.Name} getPeers() Error", e)
         else:
-            with self.engine.connect() as conn:
+            with UnitOfWork.Connect(self.engine) as conn:
                 existingPeers = conn.execute(self.peersTable.select()).mappings().fetchall()
                 for i in existingPeers:
-                    self.Peers.append(AmneziaWGPeer(i, self))
+                    tmpList.append(AmneziaWGPeer(i, self))
+        self.publishPeers(tmpList)
 
     def addPeers(self, peers: list) -> tuple[bool, list, str]:
         result = {
@@ -258,7 +263,7 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
             "peers": []
         }
         try:
-            with self.engine.begin() as conn:
+            with UnitOfWork.Begin(self.engine) as conn:
                 for i in peers:
                     newPeer = {
                         "id": i['id'],
@@ -307,6 +312,7 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
             
             command = [f"{self.Protocol}-quick", "save", self.Name]
             subprocess.check_output(command, stderr=subprocess.STDOUT)
+            self.assignPeerAddresses(peers)
 
             self.getPeers()
             for p in peers:
@@ -323,8 +329,9 @@ class AmneziaWireguardConfiguration(WireguardConfiguration):
         return True, result['peers'], ""
 
     def getRestrictedPeers(self):
-        self.RestrictedPeers = []
-        with self.engine.connect() as conn:
+        restrictedPeers = []
+        with UnitOfWork.Connect(self.engine) as conn:
             restricted = conn.execute(self.peersRestrictedTable.select()).mappings().fetchall()
             for i in restricted:
-                self.RestrictedPeers.append(AmneziaWGPeer(i, self))
\ No newline at end of file
+                restrictedPeers.append(AmneziaWGPeer(i, self))
+        self.publishPeers(restrictedPeers, True)
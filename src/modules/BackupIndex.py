@@ -0,0 +1,63 @@
+"""
+Backup Index
+"""
+import os
+import threading
+import time
+
+# Directory timestamps are only as fine as the kernel's clock tick, a directory changed less than this before a scan
+# could change again without its modification time moving, such scans are not cached
+RacyInterval = 1_000_000_000
+
+
+class BackupIndex:
+    """
+    Metadata of the configuration backups in a WGDashboard_Backup directory, built from one directory scan and
+    cached until the directory's modification time changes. Backup contents are never loaded here.
+    """
+    __cache: dict[str, tuple[int, list[dict]]] = {}
+    __lock = threading.Lock()
+
+    @staticmethod
+    def List(directory: str) -> list[dict]:
+        """
+        List the backups of a directory, newest first
+        @param directory: Backup directory
+        @return: List of {configuration, filename, backupDate, size, database, databaseSize, createdAt}
+        """
+        try:
+            modified = os.stat(directory).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        with BackupIndex.__lock:
+            cached = BackupIndex.__cache.get(directory)
+            if cached is not None and cached[0] == modified:
+                return cached[1]
+
+        scanned = time.time_ns()
+        entries = {}
+        with os.scandir(directory) as scan:
+            for entry in scan:
+                if entry.is_file():
+                    entries[entry.name] = entry.stat()
+        backups = []
+        for filename, stat in entries.items():
+            name, extension = os.path.splitext(filename)
+            configuration, separator, date = name.rpartition("_")
+            if extension != ".conf" or len(separator) == 0 or len(configuration) == 0:
+                continue
+            database = entries.get(f"{name}.sql")
+            backups.append({
+                "configuration": configuration,
+                "filename": filename,
+                "backupDate": date,
+                "size": stat.st_size,
+                "database": database is not None,
+                "databaseSize": database.st_size if database is not None else 0,
+                "createdAt": stat.st_ctime
+            })
+        backups.sort(key=lambda x: x["createdAt"], reverse=True)
+        if scanned - modified >= RacyInterval:
+            with BackupIndex.__lock:
+                BackupIndex.__cache[directory] = (modified, backups)
+        return backups
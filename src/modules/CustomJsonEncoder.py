@@ -0,0 +1,48 @@
+"""
+Custom JSON Encoder
+"""
+from datetime import datetime
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import RowMapping
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class CustomJsonEncoder(DefaultJSONProvider):
+    def __init__(self, app):
+        super().__init__(app)
+
+    def default(self, o):
+        if callable(getattr(o, "toJson", None)):
+            return o.toJson()
+        if type(o) is RowMapping:
+            return dict(o)
+        if type(o) is datetime:
+            return o.strftime("%Y-%m-%d %H:%M:%S")
+        return super().default(o)
+
+    def dumps(self, obj, **kwargs):
+        # orjson is optional, anything it refuses (e.g. integers beyond 64 bits) goes through the stdlib encoder
+        if orjson is not None and set(kwargs.keys()) <= {"indent", "separators"}:
+            option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            if kwargs.get("indent"):
+                option |= orjson.OPT_INDENT_2
+            try:
+                return orjson.dumps(obj, default=self.default, option=option).decode("utf-8")
+            except orjson.JSONEncodeError:
+                pass
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and len(kwargs) == 0:
+            try:
+                return orjson.loads(s)
+            except orjson.JSONDecodeError:
+                pass
+        return super().loads(s, **kwargs)
@@ -9,6 +9,7 @@ import sqlalchemy as db
 import requests
 
 from .ConnectionString import ConnectionString
+from .UnitOfWork import UnitOfWork
 from .DashboardClientsPeerAssignment import DashboardClientsPeerAssignment
 from .DashboardClientsTOTP import DashboardClientsTOTP
 from .DashboardOIDC import DashboardOIDC
@@ -80,7 +81,7 @@ class DashboardClients:
         self.DashboardClientsPeerAssignment = DashboardClientsPeerAssignment(wireguardConfigurations)
         
     def __getClients(self):
-        with self.engine.connect() as conn:
+        with UnitOfWork.Connect(self.engine) as conn:
             localClients = db.select(
                 self.dashboardClientsTable.c.ClientID,
                 self.dashboardClientsTable.c.Email,
@@ -133,7 +134,7 @@ class DashboardClients:
         return client
     
     def GetClientProfile(self, ClientID):
-        with self.engine.connect() as conn:
+        with UnitOfWork.Connect(self.engine) as conn:
             return dict(conn.execute(
                 db.select(
                     *[c for c in self.dashboardClientsInfoTable.c if c.name != 'ClientID']
@@ -151,7 +152,7 @@ class DashboardClients:
         return False
         
     def SignIn_UserExistence(self, Email):
-        with self.engine.connect() as conn:
+        with UnitOfWork.Connect(self.engine) as conn:
             existingClient = conn.execute(
                 self.dashboardClientsTable.select().where(
                     self.dashboardClientsTable.c.Email == Email
@@ -160,7 +161,7 @@ class DashboardClients:
             return existingClient
     
     def SignIn_OIDC_UserExistence(self, data: dict[str, str]):
-        with self.engine.connect() as conn:
+        with UnitOfWork.Connect(self.engine) as conn:
             existingClient = conn.execute(
                 self.dashboardOIDCClientsTable.select().where(
                     db.and_(
@@ -173,7 +174,7 @@ class DashboardClients:
         
     def SignUp_OIDC(self, data: dict[str, str]) -> tuple[bool, str] | tuple[bool, None]:
         if not self.SignIn_OIDC_UserExistence(data):
-            with self.engine.begin() as conn:
+            with UnitOfWork.Begin(self.engine) as conn:
                 newClientUUID = str(uuid.uuid4())
                 conn.execute(
                     self.dashboardOIDCClientsTable.insert().values({
@@ -251,7 +252,7 @@ class DashboardClients:
             else:
                 self.DashboardClientsTOTP.RevokeToken(Token)
         if data.get('TotpKeyVerified') is None:
-            with self.engine.begin() as conn:
+            with UnitOfWork.Begin(self.engine) as conn:
                 conn.execute(
                     self.dashboardClientsTable.update().values({
                         'TotpKeyVerified': 1
@@ -277,7 +278,7 @@ class DashboardClients:
             if not pwStrength:
                 return pwStrength, msg
     
-            with self.engine.begin() as conn:
+            with UnitOfWork.Begin(self.engine) as conn:
                 newClientUUID = str(uuid.uuid4())
                 totpKey = pyotp.random_base32()
                 encodePassword = Password.encode('utf-8')
@@ -317,7 +318,7 @@ class DashboardClients:
         if not pwStrength:
             return pwStrength, msg
         try:
-            with self.engine.begin() as conn:
+            with UnitOfWork.Begin(self.engine) as conn:
                 conn.execute(
                     self.dashboardClientsTable.update().values({
                         "TotpKeyVerified": None,
@@ -353,7 +354,7 @@ class DashboardClients:
         if not pwStrength:
             return pwStrength, msg
         try:
-            with self.engine.begin() as conn:
+            with UnitOfWork.Begin(self.engine) as conn:
                 conn.execute(
                     self.dashboardClientsTable.update().values({
                         "Password": bcrypt.hashpw(NewPassword.encode('utf-8'), bcrypt.gensalt()).decode("utf-8"),
@@ -369,7 +370,7 @@ class DashboardClients:
     
     def UpdateClientProfile(self, ClientID, Name):
         try:
-            with self.engine.begin() as conn:
+            with UnitOfWork.Begin(self.engine) as conn:
                 conn.execute(
                     self.dashboardClientsInfoTable.update().values({
                         "Name": Name
@@ -385,7 +386,7 @@ class DashboardClients:
     
     def DeleteClient(self, ClientID):
         try:
-            with self.engine.begin() as conn:
+            with UnitOfWork.Begin(self.engine) as conn:
                 client = self.GetClient(ClientID)
                 if client.get("ClientGroup") == "Local":
                     conn.execute(
@@ -421,7 +422,7 @@ class DashboardClients:
             return False
         
         newToken = str(random.randint(0, 999999)).zfill(6)
-        with self.engine.begin() as conn:
+        with UnitOfWork.Begin(self.engine) as conn:
             conn.execute(
                 self.dashboardClientsPasswordResetLinkTable.update().values({
                     "ExpiryDate": datetime.datetime.now()
@@ -448,7 +449,7 @@ class DashboardClients:
         c = self.GetClient(ClientID)
         if c is None:
             return False
-        with self.engine.connect() as conn:
+        with UnitOfWork.Connect(self.engine) as conn:
             t = conn.execute(
                 self.dashboardClientsPasswordResetLinkTable.select().where(
                     db.and_(self.dashboardClientsPasswordResetLinkTable.c.ClientID == ClientID,
@@ -460,7 +461,7 @@ class DashboardClients:
         return t is not None
     
     def RevokeClientPasswordResetToken(self, ClientID, Token):
-        with self.engine.begin() as conn:
+        with UnitOfWork.Begin(self.engine) as conn:
             conn.execute(
                 self.dashboardClientsPasswordResetLinkTable.update().values({
                     "ExpiryDate": datetime.datetime.now()
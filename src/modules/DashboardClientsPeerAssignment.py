@@ -3,6 +3,8 @@ import uuid
 
 from .ConnectionString import ConnectionString
 from .DashboardLogger import DashboardLogger
+from .Utilities import BytesToGigabytes
+from .UnitOfWork import UnitOfWork
 import sqlalchemy as db
 from .WireguardConfiguration import WireguardConfiguration
 
@@ -52,7 +54,7 @@ class DashboardClientsPeerAssignment:
         self.__getAssignments()
         
     def __getAssignments(self):
-        with self.engine.connect() as conn:
+        with UnitOfWork.Connect(self.engine) as conn:
             assignments = []
             get = conn.execute(
                 self.dashboardClientsPeerAssignmentTable.select().where(
@@ -76,7 +78,7 @@ class DashboardClientsPeerAssignment:
                 config = self.wireguardConfigurations.get(ConfigurationName)
                 peer = list(filter(lambda x : x.id == PeerID, config.Peers))
                 if len(peer) == 1:
-                    with self.engine.begin() as conn:
+                    with UnitOfWork.Begin(self.engine) as conn:
                         data = {
                             "AssignmentID": str(uuid.uuid4()),
                             "ClientID": ClientID,
@@ -97,7 +99,7 @@ class DashboardClientsPeerAssignment:
         )
         if not existing:
             return False
-        with self.engine.begin() as conn:
+        with UnitOfWork.Begin(self.engine) as conn:
             conn.execute(
                 self.dashboardClientsPeerAssignmentTable.update().values({
                     "UnassignedDate": datetime.datetime.now()
@@ -109,7 +111,7 @@ class DashboardClientsPeerAssignment:
             return True
         
     def UnassignPeers(self, ClientID):
-        with self.engine.begin() as conn:
+        with UnitOfWork.Begin(self.engine) as conn:
             conn.execute(
                 self.dashboardClientsPeerAssignmentTable.update().values({
                     "UnassignedDate": datetime.datetime.now()
@@ -146,9 +148,9 @@ class DashboardClientsPeerAssignment:
                     'id': p.id,
                     'private_key': p.private_key,
                     'name': p.name,
-                    'received_data': p.total_receive + p.cumu_receive,
-                    'sent_data': p.total_sent + p.cumu_sent,
-                    'data': p.total_data + p.cumu_data,
+                    'received_data': BytesToGigabytes(p.total_receive + p.cumu_receive),
+                    'sent_data': BytesToGigabytes(p.total_sent + p.cumu_sent),
+                    'data': BytesToGigabytes(p.total_data + p.cumu_data),
                     'status': p.status,
                     'latest_handshake': p.latest_handshake,
                     'allowed_ip': p.allowed_ip,
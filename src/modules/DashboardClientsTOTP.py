@@ -4,6 +4,7 @@ import uuid
 
 import sqlalchemy as db
 from .ConnectionString import ConnectionString
+from .UnitOfWork import UnitOfWork
 
 
 class DashboardClientsTOTP:
@@ -24,7 +25,7 @@ class DashboardClientsTOTP:
         
     def GenerateToken(self, ClientID) -> str:
         token = hashlib.sha512(f"{ClientID}_{datetime.datetime.now()}_{uuid.uuid4()}".encode()).hexdigest()
-        with self.engine.begin() as conn:
+        with UnitOfWork.Begin(self.engine) as conn:
             conn.execute(
                 self.dashboardClientsTOTPTable.update().values({
                     "ExpireTime": datetime.datetime.now()
@@ -43,7 +44,7 @@ class DashboardClientsTOTP:
     
     def RevokeToken(self, Token) -> bool:
         try:
-            with self.engine.begin() as conn:
+            with UnitOfWork.Begin(self.engine) as conn:
                 conn.execute(
                     self.dashboardClientsTOTPTable.update().values({
                         "ExpireTime": datetime.datetime.now()
@@ -56,7 +57,7 @@ class DashboardClientsTOTP:
         return True
     
     def GetTotp(self, token: str) -> tuple[bool, dict] or tuple[bool, None]:
-        with self.engine.connect() as conn:
+        with UnitOfWork.Connect(self.engine) as conn:
             totp = conn.execute(
                 db.select(
                     self.dashboardClientsTable.c.ClientID,
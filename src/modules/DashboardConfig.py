@@ -1,7 +1,7 @@
 """
 Dashboard Configuration
 """
-import configparser, secrets, os, pyotp, ipaddress, bcrypt
+import configparser, secrets, os, pyotp, ipaddress, bcrypt, hashlib, heapq, threading
 from sqlalchemy_utils import database_exists, create_database
 import sqlalchemy as db
 from datetime import datetime
@@ -12,6 +12,7 @@ from .Utilities import (
     GetRemoteEndpoint, ValidateDNSAddress
 )
 from .DashboardAPIKey import DashboardAPIKey
+from .UnitOfWork import UnitOfWork
 
 
 
@@ -47,7 +48,12 @@ class DashboardConfig:
                 "dashboard_sort": "status",
                 "dashboard_theme": "dark",
                 "dashboard_api_key": "false",
-                "dashboard_language": "en-US"
+                "dashboard_language": "en-US",
+                "response_compression": "true",
+                "response_compression_level": "6",
+                "response_compression_min_size": "1024",
+                "system_status_interval": "5",
+                "system_status_process_interval": "30"
             },
             "Peers": {
                 "peer_global_DNS": "1.1.1.1",
@@ -55,7 +61,8 @@ class DashboardConfig:
                 "peer_display_mode": "grid",
                 "remote_endpoint": GetRemoteEndpoint(),
                 "peer_MTU": "1420",
-                "peer_keep_alive": "21"
+                "peer_keep_alive": "21",
+                "peer_key_pool_size": "0"
             },
             "Other": {
                 "welcome_session": "true"
@@ -98,6 +105,12 @@ class DashboardConfig:
         self.engine = db.create_engine(ConnectionString('wgdashboard'))
         self.dbMetadata = db.MetaData()
         self.__createAPIKeyTable()
+        self.__apiKeyIndex: dict[str, DashboardAPIKey] = {}
+        self.__apiKeyExpiry: list[tuple[datetime, str]] = []
+        # Guards the index and the expiry heap, request threads expire keys concurrently
+        self.__apiKeyLock = threading.Lock()
+        self.__apiKeyUsage: dict[str, int] = {}
+        self.__apiKeyUsageLock = threading.Lock()
         self.DashboardAPIKeys = self.__getAPIKeys()
         self.APIAccessed = False
         self.SetConfig("Server", "version", DashboardConfig.DashboardVersion)
@@ -130,23 +143,87 @@ class DashboardConfig:
                                               )
                                     )
         self.dbMetadata.create_all(self.engine)
+    def reload(self):
+        """
+        Re-read the configuration file and API keys after another worker changed them
+        """
+        self.reloadSettings()
+        self.DashboardAPIKeys = self.__getAPIKeys()
+
+    def reloadSettings(self):
+        """
+        Re-read only the configuration file, e.g. before checking a login against credentials another worker changed
+        """
+        config = configparser.RawConfigParser(strict=False)
+        with open(DashboardConfig.ConfigurationFilePath, "r") as f:
+            config.read_file(f)
+        self.__config = config
+
     def __getAPIKeys(self) -> list[DashboardAPIKey]:
         try:
-            with self.engine.connect() as conn:
+            with UnitOfWork.Connect(self.engine) as conn:
                 keys = conn.execute(self.apiKeyTable.select().where(
                     db.or_(self.apiKeyTable.columns.ExpiredAt.is_(None), self.apiKeyTable.columns.ExpiredAt > datetime.now())
                 )).fetchall()
                 fKeys = []
                 for k in keys:
                     fKeys.append(DashboardAPIKey(k[0], k[1].strftime("%Y-%m-%d %H:%M:%S"), (k[2].strftime("%Y-%m-%d %H:%M:%S") if k[2] else None)))
+                self.__indexAPIKeys(fKeys)
                 return fKeys
         except Exception as e:
             current_app.logger.error("API Keys error", e)
+        self.__indexAPIKeys([])
         return []
 
+    @staticmethod
+    def __hashAPIKey(key: str) -> str:
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def __indexAPIKeys(self, keys: list[DashboardAPIKey]):
+        index = {self.__hashAPIKey(k.Key): k for k in keys}
+        expiry = [(datetime.strptime(k.ExpiredAt, "%Y-%m-%d %H:%M:%S"), h) for h, k in index.items() if k.ExpiredAt]
+        heapq.heapify(expiry)
+        with self.__apiKeyLock:
+            self.__apiKeyIndex, self.__apiKeyExpiry = index, expiry
+
+    def __expireAPIKeys(self):
+        with self.__apiKeyLock:
+            now = datetime.now()
+            if len(self.__apiKeyExpiry) == 0 or self.__apiKeyExpiry[0][0] > now:
+                return
+            index = dict(self.__apiKeyIndex)
+            while len(self.__apiKeyExpiry) > 0 and self.__apiKeyExpiry[0][0] <= now:
+                _, h = heapq.heappop(self.__apiKeyExpiry)
+                index.pop(h, None)
+            self.__apiKeyIndex = index
+            self.DashboardAPIKeys = list(index.values())
+
+    def validateAPIKey(self, key: str) -> bool:
+        """
+        Check an API key against the keys that are not expired and count the access
+        @param key: API key sent by the client
+        @return: Whether the key exists
+        """
+        self.__expireAPIKeys()
+        h = self.__hashAPIKey(key)
+        if h not in self.__apiKeyIndex:
+            return False
+        with self.__apiKeyUsageLock:
+            self.__apiKeyUsage[h] = self.__apiKeyUsage.get(h, 0) + 1
+        return True
+
+    def flushAPIKeyUsage(self) -> list[tuple[str, int]]:
+        """
+        Take the per key access counters collected since the last flush
+        @return: List of (shortened key, number of accesses)
+        """
+        with self.__apiKeyUsageLock:
+            usage, self.__apiKeyUsage = self.__apiKeyUsage, {}
+        return [(f"{self.__apiKeyIndex[h].Key[:6]}...", c) for h, c in usage.items() if h in self.__apiKeyIndex]
+
     def createAPIKeys(self, ExpiredAt = None):
         newKey = secrets.token_urlsafe(32)
-        with self.engine.begin() as conn:
+        with UnitOfWork.Begin(self.engine) as conn:
             conn.execute(
                 self.apiKeyTable.insert().values({
                     "Key": newKey,
@@ -157,7 +234,7 @@ class DashboardConfig:
         self.DashboardAPIKeys = self.__getAPIKeys()
 
     def deleteAPIKey(self, key):
-        with self.engine.begin() as conn:
+        with UnitOfWork.Begin(self.engine) as conn:
             conn.execute(
                 self.apiKeyTable.update().values({
                     "ExpiredAt": datetime.now(),
@@ -181,6 +258,9 @@ class DashboardConfig:
                     ipaddress.ip_network(i, strict=False)
                 except Exception as e:
                     return False, str(e)
+        if section == "Peers" and key == "peer_key_pool_size":
+            if not str(value).isnumeric() or int(value) > 10000:
+                return False, "Key pair pool size must be a number between 0 and 10000"
         if section == "Server" and key == "wg_conf_path":
             if not os.path.exists(value):
                 return False, f"{value} is not a valid path"
@@ -9,6 +9,7 @@ import requests
 from pydantic import BaseModel, field_serializer
 import sqlalchemy as db
 from .ConnectionString import ConnectionString
+from .UnitOfWork import UnitOfWork
 from flask import current_app
 
 WebHookActions = ['peer_created', 'peer_deleted', 'peer_updated']
@@ -78,7 +79,7 @@ class DashboardWebHooks:
         self.metadata.create_all(self.engine)
         self.WebHooks: list[WebHook] = []
         
-        with self.engine.begin() as conn:
+        with UnitOfWork.Begin(self.engine) as conn:
            conn.execute(
                self.webHookSessionsTable.update().values({
                    "EndDate": datetime.now(),
@@ -91,7 +92,7 @@ class DashboardWebHooks:
         self.__getWebHooks()
         
     def __getWebHooks(self):
-        with self.engine.connect() as conn:
+        with UnitOfWork.Connect(self.engine) as conn:
             webhooks = conn.execute(
                 self.webHooksTable.select().order_by(
                     self.webHooksTable.c.CreationDate
@@ -105,7 +106,7 @@ class DashboardWebHooks:
         return list(map(lambda x : x.model_dump(), self.WebHooks))
     
     def GetWebHookSessions(self, webHook: WebHook):
-        with self.engine.connect() as conn:
+        with UnitOfWork.Connect(self.engine) as conn:
             sessions = conn.execute(
                 self.webHookSessionsTable.select().where(
                     self.webHookSessionsTable.c.WebHookID == webHook.WebHookID
@@ -145,7 +146,7 @@ class DashboardWebHooks:
                 return False, "Content Type is invalid"
             
             
-            with self.engine.begin() as conn:
+            with UnitOfWork.Begin(self.engine) as conn:
                 if self.SearchWebHook(webHook):
                     conn.execute(
                         self.webHooksTable.update().values(
@@ -169,7 +170,7 @@ class DashboardWebHooks:
     def DeleteWebHook(self, webHook) -> tuple[bool, str] | tuple[bool, None]:
         try:
             webHook = WebHook(**webHook)
-            with self.engine.begin() as conn:
+            with UnitOfWork.Begin(self.engine) as conn:
                 conn.execute(
                     self.webHooksTable.delete().where(
                         self.webHooksTable.c.WebHookID == webHook.WebHookID
@@ -184,6 +185,8 @@ class DashboardWebHooks:
         try:
             if action not in WebHookActions:
                 return False
+            # Sessions are written from their own threads, commit the request's changes first
+            UnitOfWork.Flush(self.engine)
             self.__getWebHooks()
             subscribedWebHooks = filter(lambda webhook: action in webhook.SubscribedActions and webhook.IsActive, 
                                         self.WebHooks)
@@ -0,0 +1,122 @@
+"""
+Interface Traffic Sampler
+"""
+import threading
+import time
+from collections import deque
+
+import psutil
+
+
+class InterfaceTrafficSampler:
+    """
+    Samples the byte counters of every network interface once per interval into per-interface ring buffers, so
+    realtime throughput can be answered from memory instead of sleeping inside a request. The sampler thread is
+    started by the first reader and stops itself once nobody read from it for idleTimeout seconds.
+    """
+    def __init__(self, interval: float = 1, historySize: int = 300, idleTimeout: float = 300):
+        self.interval = interval
+        self.historySize = historySize
+        self.idleTimeout = idleTimeout
+        self.__samples: dict[str, deque[tuple[float, int, int]]] = {}
+        self.__counters: dict[str, dict] = {}
+        self.__lastRead: float = 0
+        self.__thread: threading.Thread | None = None
+        self.__lock = threading.Lock()
+
+    def __ensureRunning(self):
+        with self.__lock:
+            self.__lastRead = time.monotonic()
+            if self.__thread is not None and self.__thread.is_alive():
+                return
+            self.__thread = threading.Thread(target=self.__run, daemon=True)
+            self.__thread.start()
+        # The first reader would have nothing to compare against otherwise
+        if not self.__samples:
+            self.sample()
+
+    def __run(self):
+        while True:
+            self.sample()
+            time.sleep(self.interval)
+            with self.__lock:
+                if time.monotonic() - self.__lastRead > self.idleTimeout:
+                    self.__thread = None
+                    self.__samples.clear()
+                    self.__counters.clear()
+                    return
+
+    def sample(self):
+        try:
+            counters = psutil.net_io_counters(pernic=True, nowrap=True)
+        except Exception:
+            return
+        now = time.monotonic()
+        with self.__lock:
+            for name in list(self.__samples.keys()):
+                if name not in counters:
+                    self.__samples.pop(name)
+                    self.__counters.pop(name, None)
+            for name, counter in counters.items():
+                if name not in self.__samples:
+                    self.__samples[name] = deque(maxlen=self.historySize)
+                samples = self.__samples[name]
+                if len(samples) > 0 and now - samples[-1][0] < self.interval / 2:
+                    continue
+                samples.append((now, counter.bytes_sent, counter.bytes_recv))
+                self.__counters[name] = counter._asdict()
+
+    @staticmethod
+    def __rate(previous: tuple[float, int, int], current: tuple[float, int, int]) -> dict:
+        elapsed = current[0] - previous[0]
+        if elapsed <= 0:
+            return {"sent": 0, "recv": 0}
+        return {
+            "sent": round(max(0, current[1] - previous[1]) / elapsed / 1024 / 1024, 4),
+            "recv": round(max(0, current[2] - previous[2]) / elapsed / 1024 / 1024, 4)
+        }
+
+    def getRate(self, interface: str) -> dict:
+        """
+        Throughput of an interface between the two latest samples
+        @param interface: Interface name
+        @return: Sent and received MB per second, zero if the interface is unknown or has one sample only
+        """
+        self.__ensureRunning()
+        with self.__lock:
+            samples = self.__samples.get(interface)
+            if samples is None or len(samples) < 2:
+                return {"sent": 0, "recv": 0}
+            return self.__rate(samples[-2], samples[-1])
+
+    def getHistory(self, interface: str, seconds: int) -> list[dict]:
+        """
+        Throughput of an interface for every sample in the last seconds
+        @param interface: Interface name
+        @param seconds: How far to look back, capped by the ring buffer size
+        @return: List of sent and received MB per second, oldest first, with the age of each sample in seconds
+        """
+        self.__ensureRunning()
+        with self.__lock:
+            samples = list(self.__samples.get(interface, ()))
+        now = time.monotonic()
+        history = []
+        for previous, current in zip(samples, samples[1:]):
+            if now - current[0] <= seconds:
+                history.append({"age": round(now - current[0], 1), **self.__rate(previous, current)})
+        return history
+
+    def getInterfaces(self) -> dict[str, dict]:
+        """
+        Latest counters of every interface with their current throughput under "realtime"
+        """
+        self.__ensureRunning()
+        with self.__lock:
+            interfaces = {}
+            for name, counters in self.__counters.items():
+                samples = self.__samples[name]
+                interfaces[name] = {
+                    **counters,
+                    "realtime": self.__rate(samples[-2], samples[-1]) if len(samples) >= 2 else {"sent": 0, "recv": 0}
+                }
+            return interfaces
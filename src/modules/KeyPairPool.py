@@ -0,0 +1,100 @@
+"""
+Key Pair Pool
+"""
+import threading
+import time
+from collections import deque
+
+from .DashboardConfig import DashboardConfig
+from .Utilities import GenerateWireguardPrivateKey, GenerateWireguardPublicKey
+
+# Upper bound of peer_key_pool_size, the pool holds private keys in memory and should stay small
+MaximumSize = 10000
+
+
+class KeyPairPool:
+    """
+    Key pairs generated ahead of time by a background thread, so adding a peer does not wait on key generation.
+    The pool holds at most peer_key_pool_size pairs, only in memory, and every pair is handed out once. With a size
+    of 0, the default, keys are generated when they are asked for, as before.
+    """
+    def __init__(self, config: DashboardConfig):
+        self.config = config
+        self.__pairs: deque[tuple[str, str]] = deque()
+        self.__thread: threading.Thread | None = None
+        self.__wake = threading.Event()
+        self.__lock = threading.Lock()
+
+    def size(self) -> int:
+        value = self.config.GetConfig("Peers", "peer_key_pool_size")[1]
+        # GetConfig turns "0" and "1" into booleans
+        if type(value) is bool:
+            return int(value)
+        try:
+            return min(max(0, int(value)), MaximumSize)
+        except (TypeError, ValueError):
+            return 0
+
+    def start(self):
+        """
+        Start the refill thread if the pool is enabled, or wake it up to pick up a new size
+        """
+        with self.__lock:
+            if self.__thread is not None and self.__thread.is_alive():
+                self.__wake.set()
+                return
+            if self.size() == 0:
+                self.__pairs.clear()
+                return
+            self.__thread = threading.Thread(target=self.__run, daemon=True)
+            self.__thread.start()
+
+    def __run(self):
+        while True:
+            size = self.size()
+            with self.__lock:
+                while len(self.__pairs) > size:
+                    self.__pairs.popleft()
+                if size == 0:
+                    self.__thread = None
+                    return
+                missing = size - len(self.__pairs)
+            if missing == 0:
+                self.__wake.wait(30)
+                self.__wake.clear()
+                continue
+            pair = self.__generate()
+            if pair is not None:
+                with self.__lock:
+                    self.__pairs.append(pair)
+            # Give request threads the interpreter between two keys, refilling is never urgent
+            time.sleep(0.005)
+
+    @staticmethod
+    def __generate() -> tuple[str, str] | None:
+        status, privateKey = GenerateWireguardPrivateKey()
+        if not status:
+            return None
+        # Fresh keys are derived once, keep them out of the public key cache
+        status, publicKey = GenerateWireguardPublicKey(privateKey, cache=False)
+        if not status:
+            return None
+        return privateKey, publicKey
+
+    def get(self) -> tuple[bool, str, str] | tuple[bool, None, None]:
+        """
+        Take a key pair from the pool, generating one on the spot if the pool is empty
+        @return: Status, private key and public key
+        """
+        with self.__lock:
+            pair = self.__pairs.popleft() if len(self.__pairs) > 0 else None
+        self.start()
+        if pair is None:
+            pair = self.__generate()
+        if pair is None:
+            return False, None, None
+        return True, pair[0], pair[1]
+
+    def available(self) -> int:
+        with self.__lock:
+            return len(self.__pairs)
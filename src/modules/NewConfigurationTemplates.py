@@ -3,6 +3,7 @@ import uuid
 from pydantic import BaseModel, field_serializer
 import sqlalchemy as db
 from .ConnectionString import ConnectionString
+from .UnitOfWork import UnitOfWork
 
 
 class NewConfigurationTemplate(BaseModel):
@@ -33,7 +34,7 @@ class NewConfigurationTemplates:
         return list(map(lambda x : x.model_dump(), self.Templates))
     
     def __getTemplates(self):
-        with self.engine.connect() as conn:
+        with UnitOfWork.Connect(self.engine) as conn:
             templates = conn.execute(
                 self.templatesTable.select()
             ).mappings().fetchall()
@@ -53,7 +54,7 @@ class NewConfigurationTemplates:
     def UpdateTemplate(self, template: dict[str, str]) -> tuple[bool, str] | tuple[bool, None]:
         try:
             template = NewConfigurationTemplate(**template)
-            with self.engine.begin() as conn:
+            with UnitOfWork.Begin(self.engine) as conn:
                 if self.SearchTemplate(template):
                     conn.execute(
                         self.templatesTable.update().values(
@@ -76,7 +77,7 @@ class NewConfigurationTemplates:
     def DeleteTemplate(self, template: dict[str, str]) -> tuple[bool, str] | tuple[bool, None]:
         try:
             template = NewConfigurationTemplate(**template)
-            with self.engine.begin() as conn:
+            with UnitOfWork.Begin(self.engine) as conn:
                 conn.execute(
                     self.templatesTable.delete().where(
                         self.templatesTable.c.TemplateID == template.TemplateID
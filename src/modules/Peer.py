@@ -11,10 +11,24 @@ import jinja2
 import sqlalchemy as db
 from .PeerJob import PeerJob
 from .PeerShareLink import PeerShareLink
-from .Utilities import GenerateWireguardPublicKey, ValidateIPAddressesWithRange, ValidateDNSAddress
+from .UnitOfWork import UnitOfWork
+from .Utilities import GenerateWireguardPublicKey, ValidateIPAddressesWithRange, ValidateDNSAddress, BytesToGigabytes
+
+DataUsageFields = ['total_receive', 'total_sent', 'total_data', 'cumu_receive', 'cumu_sent', 'cumu_data']
 
 
 class Peer:
+    # Settings a user can change through updatePeer() or WireguardConfiguration.updatePeers()
+    SettingsFields = ['name', 'private_key', 'preshared_key', 'DNS', 'allowed_ip', 'endpoint_allowed_ip', 'mtu',
+                      'keepalive']
+    # Fields returned by toJson(), the configuration is reduced to what peer views need
+    SerializedFields = ['id', 'private_key', 'DNS', 'endpoint_allowed_ip', 'name', 'total_receive', 'total_sent',
+                        'total_data', 'endpoint', 'status', 'latest_handshake', 'allowed_ip', 'cumu_receive',
+                        'cumu_sent', 'cumu_data', 'mtu', 'keepalive', 'remote_endpoint', 'preshared_key', 'jobs',
+                        'ShareLink']
+    # Left out of projected peer lists unless asked for by name
+    SecretFields = ['private_key', 'preshared_key']
+
     def __init__(self, tableData, configuration):
         self.configuration = configuration
         self.id = tableData["id"]
@@ -41,14 +55,80 @@ class Peer:
         self.getJobs()
         self.getShareLink()
 
-    def toJson(self):
+    def toJson(self, fields: list[str] = None):
         # self.getJobs()
         # self.getShareLink()
-        return self.__dict__
+        if fields is None:
+            fields = self.SerializedFields + ['configuration']
+        data = {}
+        for field in fields:
+            if field == 'configuration':
+                data[field] = {
+                    "Name": self.configuration.Name,
+                    "Protocol": self.configuration.Protocol,
+                    "ListenPort": self.configuration.ListenPort
+                }
+            elif field in DataUsageFields:
+                data[field] = BytesToGigabytes(getattr(self, field))
+            else:
+                data[field] = getattr(self, field)
+        return data
+
+    def getFingerprint(self) -> int:
+        """
+        Hash of every field returned by toJson(), used to detect peers that changed between two reads
+        """
+        return hash((
+            tuple((k, v) for k, v in self.__dict__.items() if k not in ("configuration", "jobs", "ShareLink")),
+            tuple(str(j.toJson()) for j in self.jobs),
+            tuple(str(l.toJson()) for l in self.ShareLink)
+        ))
 
     def __repr__(self):
         return str(self.toJson())
 
+    def validateSettings(self, settings: dict) -> tuple[bool, str] | tuple[bool, None]:
+        """
+        Validate and normalize the values of SettingsFields in place. Whether allowed IPs are taken by another
+        peer is left to the caller.
+        @param settings: Peer settings
+        @return: Whether the settings are valid, and the reason if not
+        """
+        for field in ['name', 'private_key', 'preshared_key', 'DNS', 'allowed_ip', 'endpoint_allowed_ip']:
+            if type(settings[field]) is not str:
+                return False, f"{field} must be a string"
+        for field in ['mtu', 'keepalive']:
+            if settings[field] is not None and type(settings[field]) not in (int, str):
+                return False, f"{field} must be a number"
+
+        if not ValidateIPAddressesWithRange(settings['endpoint_allowed_ip']):
+            return False, f"Endpoint Allowed IPs format is incorrect"
+
+        if len(settings['DNS']) > 0 and not ValidateDNSAddress(settings['DNS']):
+            return False, f"DNS format is incorrect"
+
+        if type(settings['mtu']) is str or settings['mtu'] is None:
+            settings['mtu'] = 0
+
+        if settings['mtu'] < 0 or settings['mtu'] > 1460:
+            return False, "MTU format is not correct"
+
+        if type(settings['keepalive']) is str or settings['keepalive'] is None:
+            settings['keepalive'] = 0
+
+        if settings['keepalive'] < 0:
+            return False, "Persistent Keepalive format is not correct"
+
+        settings['allowed_ip'] = settings['allowed_ip'].replace(" ", "")
+        if not re.match(r"^[0-9a-fA-F\.\,:/ ]+$", settings['allowed_ip']):
+            return False, "Allowed IPs entry format is incorrect"
+
+        if len(settings['private_key']) > 0:
+            pubKey = GenerateWireguardPublicKey(settings['private_key'])
+            if not pubKey[0] or pubKey[1] != self.id:
+                return False, "Private key does not match with the public key"
+        return True, None
+
     def updatePeer(self, name: str, private_key: str,
                    preshared_key: str,
                    dns_addresses: str, allowed_ip: str, endpoint_allowed_ip: str, mtu: int,
@@ -56,35 +136,18 @@ class Peer:
         if not self.configuration.getStatus():
             self.configuration.toggleConfiguration()
 
-        existingAllowedIps = [item for row in list(
-            map(lambda x: [q.strip() for q in x.split(',')],
-                map(lambda y: y.allowed_ip,
-                    list(filter(lambda k: k.id != self.id, self.configuration.getPeersList()))))) for item in row]
-
-        if allowed_ip in existingAllowedIps:
+        if allowed_ip.replace(" ", "") != self.allowed_ip.replace(" ", "") and \
+                len(self.configuration.getAllowedIPsIndex().overlaps(allowed_ip, self.id)) > 0:
             return False, "Allowed IP already taken by another peer"
-        
-        if not ValidateIPAddressesWithRange(endpoint_allowed_ip):
-            return False, f"Endpoint Allowed IPs format is incorrect"
-        
-        if len(dns_addresses) > 0 and not ValidateDNSAddress(dns_addresses):
-            return False, f"DNS format is incorrect"
-        
-        if type(mtu) is str or mtu is None:
-            mtu = 0
-        
-        if mtu < 0 or mtu > 1460:
-            return False, "MTU format is not correct"
-        
-        if type(keepalive) is str or keepalive is None:
-            keepalive = 0
-        
-        if keepalive < 0:
-            return False, "Persistent Keepalive format is not correct"
-        if len(private_key) > 0:
-            pubKey = GenerateWireguardPublicKey(private_key)
-            if not pubKey[0] or pubKey[1] != self.id:
-                return False, "Private key does not match with the public key"
+
+        settings = {
+            "name": name, "private_key": private_key, "preshared_key": preshared_key, "DNS": dns_addresses,
+            "allowed_ip": allowed_ip, "endpoint_allowed_ip": endpoint_allowed_ip, "mtu": mtu, "keepalive": keepalive
+        }
+        valid, msg = self.validateSettings(settings)
+        if not valid:
+            return False, msg
+        mtu, keepalive = settings['mtu'], settings['keepalive']
         try:
             rd = random.Random()
             uid = str(uuid.UUID(int=rd.getrandbits(128), version=4))
@@ -93,10 +156,7 @@ class Peer:
             if pskExist:
                 with open(uid, "w+") as f:
                     f.write(preshared_key)
-            newAllowedIPs = allowed_ip.replace(" ", "")
-            if not re.match(r"^[0-9a-fA-F\.\,:/ ]+$", newAllowedIPs):
-                    return False, "Allowed IPs entry format is incorrect"
-                
+            newAllowedIPs = settings['allowed_ip']
             command = [self.configuration.Protocol, "set", self.configuration.Name, "peer", self.id, "allowed-ips", newAllowedIPs, "preshared-key", uid if pskExist else "/dev/null"]
             updateAllowedIp = subprocess.check_output(command, stderr=subprocess.STDOUT)
 
@@ -111,7 +171,7 @@ class Peer:
             if f"wg showconf {self.configuration.Name}" not in saveConfig.decode().strip('\n'):
                 current_app.logger.error("Update peer failed when saving the configuration")
                 return False, "Internal server error"
-            with self.configuration.engine.begin() as conn:
+            with UnitOfWork.Begin(self.configuration.engine) as conn:
                 conn.execute(
                     self.configuration.peersTable.update().values({
                         "name": name,
@@ -232,7 +292,7 @@ class Peer:
 
     def resetDataUsage(self, mode: str):
         try:
-            with self.configuration.engine.begin() as conn:
+            with UnitOfWork.Begin(self.configuration.engine) as conn:
                 if mode == "total":
                     conn.execute(
                         self.configuration.peersTable.update().values({
@@ -283,7 +343,7 @@ class Peer:
     
     def getEndpoints(self):
         result = []
-        with self.configuration.engine.connect() as conn:
+        with UnitOfWork.Connect(self.configuration.engine) as conn:
             result = conn.execute(
                 db.select(
                     self.configuration.peersHistoryEndpointTable.c.endpoint
@@ -303,7 +363,7 @@ class Peer:
             endDate = endDate.replace(hour=23, minute=59, second=59, microsecond=999999)
             startDate = startDate.replace(hour=0, minute=0, second=0, microsecond=0)
 
-        with self.configuration.engine.connect() as conn:
+        with UnitOfWork.Connect(self.configuration.engine) as conn:
             result = conn.execute(
                 db.select(
                     self.configuration.peersTransferTable.c.cumu_data,
@@ -323,7 +383,10 @@ class Peer:
                     self.configuration.peersTransferTable.c.time
                 )
             ).mappings().fetchall()
-        return list(result)
+        return [{
+            **row,
+            **{field: BytesToGigabytes(row[field]) for field in DataUsageFields}
+        } for row in result]
             
     
     def getSessions(self, startDate: datetime.datetime = None, endDate: datetime.datetime = None):
@@ -337,7 +400,7 @@ class Peer:
         startDate = startDate.replace(hour=0, minute=0, second=0, microsecond=0)
             
 
-        with self.configuration.engine.connect() as conn:
+        with UnitOfWork.Connect(self.configuration.engine) as conn:
             result = conn.execute(
                 db.select(
                     self.configuration.peersTransferTable.c.time
@@ -0,0 +1,39 @@
+"""
+Peer Change Log
+"""
+import threading
+from collections import deque
+
+
+class PeerChangeLog:
+    """
+    Bounded in-memory log of which peers changed at which state version of a configuration
+    """
+    def __init__(self, maxLength: int = 10000):
+        self.__changes: deque[tuple[int, str, str]] = deque(maxlen=maxLength)
+        self.__lock = threading.Lock()
+        self.TrimmedVersion: int = 0
+
+    def record(self, version: int, changes: list[tuple[str, str]]):
+        """
+        Record changed peers
+        @param version: State version the changes belong to
+        @param changes: List of (peer ID, kind), kind is one of added, updated or removed
+        """
+        with self.__lock:
+            for peerId, kind in changes:
+                if len(self.__changes) == self.__changes.maxlen:
+                    self.TrimmedVersion = self.__changes[0][0]
+                self.__changes.append((version, peerId, kind))
+
+    def since(self, version: int) -> tuple[bool, list[str]]:
+        """
+        Collect the peers changed after a version
+        @param version: Version the client last saw
+        @return: False if changes after version were already trimmed, and the changed peer IDs
+        """
+        with self.__lock:
+            if version < self.TrimmedVersion:
+                return False, []
+            peerIds = list(dict.fromkeys(c[1] for c in self.__changes if c[0] > version))
+        return True, peerIds
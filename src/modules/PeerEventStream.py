@@ -0,0 +1,103 @@
+"""
+Peer Event Stream
+"""
+import queue
+import threading
+import time
+
+
+class PeerEventSubscriber:
+    def __init__(self, configurationName: str, maxQueueSize: int):
+        self.ConfigurationName = configurationName
+        self.Queue: queue.Queue = queue.Queue(maxsize=maxQueueSize)
+        self.Dropped: bool = False
+
+
+class PeerEventStream:
+    """
+    Fans out peer status and traffic updates produced by the background collector to Server-Sent Events subscribers.
+    Every subscriber has its own bounded queue, a subscriber that falls behind is dropped instead of blocking the
+    collector.
+    """
+    def __init__(self, maxSubscribers: int = 4, maxQueueSize: int = 16):
+        self.maxSubscribers = maxSubscribers
+        self.maxQueueSize = maxQueueSize
+        self.__subscribers: dict[str, set[PeerEventSubscriber]] = {}
+        self.__lastSamples: dict[str, dict[str, tuple]] = {}
+        self.__lock = threading.Lock()
+
+    def subscribe(self, configurationName: str) -> PeerEventSubscriber | None:
+        with self.__lock:
+            if sum(len(s) for s in self.__subscribers.values()) >= self.maxSubscribers:
+                return None
+            subscriber = PeerEventSubscriber(configurationName, self.maxQueueSize)
+            self.__subscribers.setdefault(configurationName, set()).add(subscriber)
+            return subscriber
+
+    def unsubscribe(self, subscriber: PeerEventSubscriber):
+        with self.__lock:
+            subscribers = self.__subscribers.get(subscriber.ConfigurationName, set())
+            subscribers.discard(subscriber)
+            if len(subscribers) == 0:
+                self.__subscribers.pop(subscriber.ConfigurationName, None)
+                self.__lastSamples.pop(subscriber.ConfigurationName, None)
+
+    def hasSubscribers(self, configurationName: str) -> bool:
+        return len(self.__subscribers.get(configurationName, ())) > 0
+
+    def publish(self, configurationName: str, event: dict):
+        with self.__lock:
+            subscribers = list(self.__subscribers.get(configurationName, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.Queue.put_nowait(event)
+            except queue.Full:
+                subscriber.Dropped = True
+                self.unsubscribe(subscriber)
+
+    def snapshot(self, configuration) -> list[dict]:
+        """
+        Current state of every peer of a configuration, without rates
+        """
+        return [self.__peerState(p) for p in configuration.Peers]
+
+    def publishConfiguration(self, configuration):
+        """
+        Publish one coalesced event with the peers whose status, handshake, endpoint or rates changed since the
+        previous call for this configuration
+        @param configuration: WireguardConfiguration the collector just refreshed
+        """
+        if not self.hasSubscribers(configuration.Name):
+            return
+        now = time.monotonic()
+        previousSamples = self.__lastSamples.get(configuration.Name, {})
+        samples = {}
+        peers = []
+        for p in configuration.Peers:
+            state = self.__peerState(p)
+            sent = (p.total_sent or 0) + (p.cumu_sent or 0)
+            receive = (p.total_receive or 0) + (p.cumu_receive or 0)
+            previous = previousSamples.get(p.id)
+            rates = (0, 0)
+            if previous is not None and now > previous[0]:
+                rates = (max(0, round((sent - previous[1]) / (now - previous[0]))),
+                         max(0, round((receive - previous[2]) / (now - previous[0]))))
+            samples[p.id] = (now, sent, receive, state, rates)
+            if previous is None or previous[3] != state or previous[4] != rates:
+                peers.append({**state, "sent_rate": rates[0], "receive_rate": rates[1]})
+        removed = [i for i in previousSamples.keys() if i not in samples]
+        self.__lastSamples[configuration.Name] = samples
+        if len(peers) > 0 or len(removed) > 0:
+            self.publish(configuration.Name, {
+                "peers": peers,
+                "removedPeers": removed
+            })
+
+    @staticmethod
+    def __peerState(peer) -> dict:
+        return {
+            "id": peer.id,
+            "status": peer.status,
+            "latest_handshake": peer.latest_handshake,
+            "endpoint": peer.endpoint
+        }
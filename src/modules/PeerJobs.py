@@ -6,6 +6,8 @@ import sqlalchemy
 from .ConnectionString import ConnectionString
 from .PeerJob import PeerJob
 from .PeerJobLogger import PeerJobLogger
+from .UnitOfWork import UnitOfWork
+from .Utilities import GigabytesToBytes
 import sqlalchemy as db
 from datetime import datetime
 from flask import current_app
@@ -33,9 +35,12 @@ class PeerJobs:
         self.AllPeerShareLinks = AllPeerShareLinks
         self.cleanJob(init=True)
 
+    def reload(self):
+        self.__getJobs()
+
     def __getJobs(self):
         self.Jobs.clear()
-        with self.engine.connect() as conn:
+        with UnitOfWork.Connect(self.engine) as conn:
             jobs = conn.execute(self.peerJobTable.select().where(
                 self.peerJobTable.columns.ExpireDate.is_(None)
             )).mappings().fetchall()
@@ -46,7 +51,7 @@ class PeerJobs:
 
     def getAllJobs(self, configuration: str = None):
         if configuration is not None:
-            with self.engine.connect() as conn:
+            with UnitOfWork.Connect(self.engine) as conn:
                 jobs = conn.execute(self.peerJobTable.select().where(
                     self.peerJobTable.columns.Configuration == configuration
                 )).mappings().fetchall()
@@ -70,7 +75,7 @@ class PeerJobs:
     def saveJob(self, Job: PeerJob) -> tuple[bool, list] | tuple[bool, str]:
         import traceback
         try:
-            with self.engine.begin() as conn:
+            with UnitOfWork.Begin(self.engine) as conn:
                 currentJob = self.searchJobById(Job.JobID)
                 if len(currentJob) == 0:
                     conn.execute(
@@ -112,7 +117,7 @@ class PeerJobs:
         try:
             if len(self.searchJobById(Job.JobID)) == 0:
                 return False, "Job does not exist"
-            with self.engine.begin() as conn:
+            with UnitOfWork.Begin(self.engine) as conn:
                 conn.execute(
                     self.peerJobTable.update().values(
                         {
@@ -129,7 +134,7 @@ class PeerJobs:
 
     def updateJobConfigurationName(self, ConfigurationName: str, NewConfigurationName: str) -> tuple[bool, str] | tuple[bool, None]:
         try:
-            with self.engine.begin() as conn:
+            with UnitOfWork.Begin(self.engine) as conn:
                 conn.execute(
                     self.peerJobTable.update().values({
                         "Configuration": NewConfigurationName
@@ -155,8 +160,8 @@ class PeerJobs:
                 if f:
                     if job.Field in ["total_receive", "total_sent", "total_data"]:
                         s = job.Field.split("_")[1]
-                        x: float = getattr(fp, f"total_{s}") + getattr(fp, f"cumu_{s}")
-                        y: float = float(job.Value)
+                        x: int = getattr(fp, f"total_{s}") + getattr(fp, f"cumu_{s}")
+                        y: int = GigabytesToBytes(job.Value)
                     else:
                         x: datetime = datetime.now()
                         y: datetime = datetime.strptime(job.Value, "%Y-%m-%d %H:%M:%S")
@@ -193,7 +198,7 @@ class PeerJobs:
             
     def cleanJob(self, init = False):
         failingJobs = self.JobLogger.getFailingJobs()
-        with self.engine.begin() as conn:
+        with UnitOfWork.Begin(self.engine) as conn:
             for job in failingJobs:
                 conn.execute(
                     self.peerJobTable.update().values(
@@ -205,6 +210,7 @@ class PeerJobs:
                 self.JobLogger.deleteLogs(JobID=job.get('JobID'))
                 self.JobLogger.log(job.get('JobID'), Message=f"Job is removed due to being stale.")
         
+        UnitOfWork.Flush(self.engine)
         with self.engine.connect() as conn:
             if init and conn.dialect.name == 'sqlite':
                 print("[WGDashboard] SQLite Vacuuming PeerJobs Database")
@@ -1,4 +1,5 @@
 from .ConnectionString import ConnectionString
+from .UnitOfWork import UnitOfWork
 from .PeerShareLink import PeerShareLink
 import sqlalchemy as db
 from datetime import datetime
@@ -26,7 +27,7 @@ class PeerShareLinks:
         self.wireguardConfigurations = WireguardConfigurations
     def __getSharedLinks(self):
         self.Links.clear()
-        with self.engine.connect() as conn:
+        with UnitOfWork.Connect(self.engine) as conn:
             allLinks = conn.execute(
                 self.peerShareLinksTable.select().where(
                     db.or_(self.peerShareLinksTable.columns.ExpireDate.is_(None), self.peerShareLinksTable.columns.ExpireDate > datetime.now())
@@ -48,7 +49,7 @@ class PeerShareLinks:
     def addLink(self, Configuration: str, Peer: str, ExpireDate: datetime = None) -> tuple[bool, str]:
         try:
             newShareID = str(uuid.uuid4())
-            with self.engine.begin() as conn:
+            with UnitOfWork.Begin(self.engine) as conn:
                 if len(self.getLink(Configuration, Peer)) > 0:
                     conn.execute(
                         self.peerShareLinksTable.update().values(
@@ -75,7 +76,7 @@ class PeerShareLinks:
         return True, newShareID
 
     def updateLinkExpireDate(self, ShareID, ExpireDate: datetime = None) -> tuple[bool, str]:
-        with self.engine.begin() as conn:
+        with UnitOfWork.Begin(self.engine) as conn:
             updated = conn.execute(
                 self.peerShareLinksTable.update().values(
                     {
@@ -0,0 +1,141 @@
+"""
+Prefix Trie
+"""
+import ipaddress
+import threading
+
+# Node layout: [child for bit 0, child for bit 1, {peer ID: count} of prefixes ending here, prefixes in the subtree]
+Zero, One, Owners, Count = 0, 1, 2, 3
+
+
+class PrefixTrie:
+    """
+    Binary trie of the AllowedIPs assigned to a configuration's peers, one per IP version. Finding the assigned
+    prefixes that contain a given one takes O(prefix length), collecting those inside it adds the size of the subtree
+    below it, which for a broad prefix can be every assigned prefix of that IP version.
+    """
+    def __init__(self):
+        self.Version = None
+        self.__roots = {4: [None, None, None, 0], 6: [None, None, None, 0]}
+        self.__owners: dict[str, tuple[str, list]] = {}
+        self.__lock = threading.RLock()
+
+    @staticmethod
+    def Parse(allowedIp: str) -> list[ipaddress.IPv4Network | ipaddress.IPv6Network]:
+        networks = []
+        for entry in allowedIp.split(','):
+            entry = entry.strip()
+            if len(entry) == 0:
+                continue
+            try:
+                networks.append(ipaddress.ip_network(entry, False))
+            except ValueError:
+                pass
+        return networks
+
+    @staticmethod
+    def __bits(network) -> list[int]:
+        address = int(network.network_address)
+        return [(address >> (network.max_prefixlen - 1 - i)) & 1 for i in range(network.prefixlen)]
+
+    def __insert(self, network, peerId: str):
+        node = self.__roots[network.version]
+        node[Count] += 1
+        for bit in self.__bits(network):
+            if node[bit] is None:
+                node[bit] = [None, None, None, 0]
+            node = node[bit]
+            node[Count] += 1
+        if node[Owners] is None:
+            node[Owners] = {}
+        node[Owners][peerId] = node[Owners].get(peerId, 0) + 1
+
+    def __remove(self, network, peerId: str):
+        path = [self.__roots[network.version]]
+        for bit in self.__bits(network):
+            if path[-1][bit] is None:
+                return
+            path.append(path[-1][bit])
+        owners = path[-1][Owners]
+        if owners is None or peerId not in owners:
+            return
+        owners[peerId] -= 1
+        if owners[peerId] == 0:
+            owners.pop(peerId)
+        if len(owners) == 0:
+            path[-1][Owners] = None
+        for node in path:
+            node[Count] -= 1
+        # Drop the branches that became empty
+        for depth, bit in reversed(list(enumerate(self.__bits(network)))):
+            if path[depth + 1][Count] == 0:
+                path[depth][bit] = None
+
+    def assign(self, peerId: str, allowedIp: str):
+        """
+        Record a peer's allowed IPs, replacing what the peer had before
+        """
+        with self.__lock:
+            owner = self.__owners.get(peerId)
+            if owner is not None and owner[0] == allowedIp:
+                return
+            self.release(peerId)
+            networks = self.Parse(allowedIp)
+            for network in networks:
+                self.__insert(network, peerId)
+            self.__owners[peerId] = (allowedIp, networks)
+
+    def release(self, peerId: str):
+        with self.__lock:
+            owner = self.__owners.pop(peerId, None)
+            if owner is not None:
+                for network in owner[1]:
+                    self.__remove(network, peerId)
+
+    def sync(self, peers: list):
+        """
+        Bring the trie in line with a full list of peers, only peers whose allowed IPs changed are touched
+        """
+        with self.__lock:
+            ids = set()
+            for peer in peers:
+                ids.add(peer.id)
+                self.assign(peer.id, peer.allowed_ip)
+            for peerId in [k for k in self.__owners.keys() if k not in ids]:
+                self.release(peerId)
+
+    def overlaps(self, allowedIp: str, exclude: str = None) -> list[str]:
+        """
+        Find the peers whose allowed IPs overlap any of the given ones
+        @param allowedIp: Comma separated allowed IPs
+        @param exclude: Peer to ignore, e.g. the peer being updated
+        @return: IDs of the overlapping peers
+        """
+        found = set()
+        with self.__lock:
+            excluded = self.__owners.get(exclude, (None, []))[1] if exclude is not None else []
+            for network in self.Parse(allowedIp):
+                node = self.__roots[network.version]
+                for bit in self.__bits(network):
+                    # Assigned prefixes containing this one end on the way down
+                    if node[Owners] is not None:
+                        found.update(node[Owners].keys())
+                    node = node[bit]
+                    if node is None:
+                        break
+                if node is None:
+                    continue
+                # Assigned prefixes equal to or inside this one end in the subtree
+                ownSubtree = sum(1 for e in excluded if e.version == network.version and e.subnet_of(network))
+                if node[Count] > ownSubtree:
+                    self.__collect(node, found)
+        found.discard(exclude)
+        return sorted(found)
+
+    def __collect(self, node, found: set):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node[Owners] is not None:
+                found.update(node[Owners].keys())
+            stack.extend(child for child in (node[Zero], node[One]) if child is not None)
@@ -0,0 +1,133 @@
+"""
+Response Compression
+"""
+import zlib
+from typing import Iterable, Iterator
+
+from flask import Response
+from werkzeug.datastructures import Accept, ETags
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CompressibleMimeTypes = ['application/json', 'application/x-ndjson', 'application/javascript', 'text/csv',
+                         'text/plain', 'text/html', 'text/css']
+
+
+class ResponseCompression:
+    """
+    Negotiates and applies gzip, brotli or zstd content encoding. brotli and zstd are only offered when their
+    modules are installed.
+    """
+    def __init__(self, level: int = 6, minimumSize: int = 1024):
+        self.level = 6
+        self.minimumSize = 1024
+        self.configure(level, minimumSize)
+
+    def configure(self, level, minimumSize):
+        """
+        Apply the compression settings, values that are not numbers keep the current setting
+        @param level: Compression level, clamped to 1-9
+        @param minimumSize: Bodies smaller than this many bytes are sent uncompressed
+        """
+        try:
+            self.level = min(max(int(level), 1), 9)
+        except (TypeError, ValueError):
+            pass
+        try:
+            self.minimumSize = max(int(minimumSize), 0)
+        except (TypeError, ValueError):
+            pass
+
+    @staticmethod
+    def Encodings() -> list[str]:
+        return (["zstd"] if zstandard is not None else []) + (["br"] if brotli is not None else []) + ["gzip"]
+
+    @staticmethod
+    def MatchETag(etag: str, ifNoneMatch: ETags) -> str | None:
+        """
+        Find etag, or one of its compressed variants, in If-None-Match
+        @param etag: Strong ETag value without quotes
+        @param ifNoneMatch: request.if_none_match
+        @return: The matching ETag, or None
+        """
+        for e in [etag] + [f"{etag}-{encoding}" for encoding in ResponseCompression.Encodings()]:
+            if ifNoneMatch.contains(e):
+                return e
+        return None
+
+    def compressResponse(self, response: Response, acceptEncodings: Accept) -> Response:
+        """
+        Compress a 200 response with a compressible type if the client accepts an encoding. Streamed responses are
+        gzipped as they are sent, others only when they are at least minimumSize bytes.
+        @param response: Response to compress in place
+        @param acceptEncodings: request.accept_encodings
+        @return: The response
+        """
+        if (response.status_code != 200 or response.direct_passthrough or "Content-Encoding" in response.headers
+                or response.mimetype not in CompressibleMimeTypes):
+            return response
+        response.vary.add("Accept-Encoding")
+        if response.is_streamed:
+            encoding = self.negotiate(acceptEncodings, streamed=True)
+            if encoding is None:
+                return response
+            response.response = self.compressStream(response.response)
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < self.minimumSize:
+                return response
+            encoding = self.negotiate(acceptEncodings)
+            if encoding is None:
+                return response
+            response.set_data(self.compress(data, encoding))
+        response.headers["Content-Encoding"] = encoding
+        # A strong ETag must differ between encodings of the same resource
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(f"{etag}-{encoding}", weak)
+        return response
+
+    def negotiate(self, acceptEncodings: Accept, streamed: bool = False) -> str | None:
+        """
+        Pick the encoding the client gives the highest q-value, our order of preference breaks ties
+        @param acceptEncodings: request.accept_encodings
+        @param streamed: Streamed responses only use gzip, which every client supports and can be flushed per chunk
+        @return: Encoding name, or None if the client accepts none of them
+        """
+        # max() keeps the first of equal values
+        encoding = max(["gzip"] if streamed else self.Encodings(), key=acceptEncodings.quality)
+        return encoding if acceptEncodings.quality(encoding) > 0 else None
+
+    def compress(self, data: bytes, encoding: str) -> bytes:
+        if encoding == "zstd":
+            return zstandard.ZstdCompressor(level=self.level).compress(data)
+        if encoding == "br":
+            return brotli.compress(data, quality=self.level)
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+
+    def compressStream(self, chunks: Iterable[bytes | str], flushSize: int = 65536) -> Iterator[bytes]:
+        """
+        gzip a streamed body, flushing every flushSize input bytes so clients receive data as it is produced
+        """
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        pending = 0
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            data = compressor.compress(chunk)
+            pending += len(chunk)
+            if pending >= flushSize:
+                data += compressor.flush(zlib.Z_SYNC_FLUSH)
+                pending = 0
+            if len(data) > 0:
+                yield data
+        yield compressor.flush()
@@ -1,26 +1,70 @@
 import shutil, subprocess, time, threading, psutil
 from flask import current_app
+from .DashboardConfig import DashboardConfig
+from .InterfaceTrafficSampler import InterfaceTrafficSampler
 
 class SystemStatus:
-    def __init__(self):
+    """
+    Samples CPU, memory, disks and network interfaces every system_status_interval seconds in a background thread,
+    processes and route priorities every system_status_process_interval seconds. Requests read the latest snapshot.
+    The thread is started by the first request and stops itself once nobody asked for the status for idleTimeout
+    seconds.
+    """
+    def __init__(self, config: DashboardConfig, interfaceTraffic: InterfaceTrafficSampler, idleTimeout: float = 300):
+        self.config = config
+        self.idleTimeout = idleTimeout
         self.CPU = CPU()
         self.MemoryVirtual = Memory('virtual')
         self.MemorySwap = Memory('swap')
         self.Disks = Disks()
-        self.NetworkInterfaces = NetworkInterfaces()
+        self.NetworkInterfaces = NetworkInterfaces(interfaceTraffic)
         self.Processes = Processes()
+        self.__lastRead: float = 0
+        self.__lastProcessScan: float = 0
+        self.__thread: threading.Thread | None = None
+        self.__lock = threading.Lock()
+
+    def __interval(self, key: str, default: float) -> float:
+        try:
+            return max(1.0, float(self.config.GetConfig("Server", key)[1]))
+        except (TypeError, ValueError):
+            return default
+
+    def __ensureRunning(self):
+        with self.__lock:
+            self.__lastRead = time.monotonic()
+            if self.__thread is not None and self.__thread.is_alive():
+                return
+            firstRun = self.__lastProcessScan == 0
+            app = current_app._get_current_object()
+            self.__thread = threading.Thread(target=self.__run, args=(app, ), daemon=True)
+            self.__thread.start()
+        if firstRun:
+            self.sample()
+
+    def __run(self, app):
+        with app.app_context():
+            while True:
+                time.sleep(self.__interval("system_status_interval", 5))
+                with self.__lock:
+                    if time.monotonic() - self.__lastRead > self.idleTimeout:
+                        self.__thread = None
+                        return
+                self.sample()
+
+    def sample(self):
+        self.CPU.getData()
+        self.MemoryVirtual.getData()
+        self.MemorySwap.getData()
+        self.Disks.getData()
+        self.NetworkInterfaces.getData()
+        if time.monotonic() - self.__lastProcessScan >= self.__interval("system_status_process_interval", 30):
+            self.__lastProcessScan = time.monotonic()
+            self.Processes.getData()
+            self.NetworkInterfaces.getInterfacePriorities()
+
     def toJson(self):
-        process = [
-            threading.Thread(target=self.CPU.getCPUPercent), 
-            threading.Thread(target=self.CPU.getPerCPUPercent),
-            threading.Thread(target=self.NetworkInterfaces.getData)
-        ]
-        for p in process:
-            p.start()
-        for p in process:
-            p.join()
-        
-        
+        self.__ensureRunning()
         return {
             "CPU": self.CPU,
             "Memory": {
@@ -29,28 +73,26 @@ class SystemStatus:
             },
             "Disks": self.Disks,
             "NetworkInterfaces": self.NetworkInterfaces,
-            "NetworkInterfacesPriority": self.NetworkInterfaces.getInterfacePriorities(),
+            "NetworkInterfacesPriority": self.NetworkInterfaces.priorities,
             "Processes": self.Processes
         }
-        
+
 
 class CPU:
     def __init__(self):
         self.cpu_percent: float = 0
         self.cpu_percent_per_cpu: list[float] = []
-        
-    def getCPUPercent(self):
+        # Non-blocking cpu_percent() compares against the previous call, the first one only starts the measurement
+        psutil.cpu_percent(interval=None)
+        psutil.cpu_percent(interval=None, percpu=True)
+
+    def getData(self):
         try:
-            self.cpu_percent = psutil.cpu_percent(interval=1)
+            self.cpu_percent = psutil.cpu_percent(interval=None)
+            self.cpu_percent_per_cpu = psutil.cpu_percent(interval=None, percpu=True)
         except Exception as e:
             current_app.logger.error("Get CPU Percent error", e)
-    
-    def getPerCPUPercent(self):
-        try:
-            self.cpu_percent_per_cpu = psutil.cpu_percent(interval=1, percpu=True)
-        except Exception as e:
-            current_app.logger.error("Get Per CPU Percent error", e)
-    
+
     def toJson(self):
         return self.__dict__
 
@@ -69,12 +111,11 @@ class Memory:
                 memory = psutil.swap_memory()
                 self.available = memory.free
             self.total = memory.total
-            
+
             self.percent = memory.percent
         except Exception as e:
             current_app.logger.error("Get Memory percent error", e)
     def toJson(self):
-        self.getData()
         return self.__dict__
 
 class Disks:
@@ -82,11 +123,13 @@ class Disks:
         self.disks : list[Disk] = []
     def getData(self):
         try:
-            self.disks = list(map(lambda x : Disk(x.mountpoint), psutil.disk_partitions()))
+            disks = list(map(lambda x : Disk(x.mountpoint), psutil.disk_partitions()))
+            for disk in disks:
+                disk.getData()
+            self.disks = disks
         except Exception as e:
             current_app.logger.error("Get Disk percent error", e)
     def toJson(self):
-        self.getData()
         return self.disks
 
 class Disk:
@@ -106,40 +149,34 @@ class Disk:
         except Exception as e:
             current_app.logger.error("Get Disk percent error", e)
     def toJson(self):
-        self.getData()
         return self.__dict__
-    
+
 class NetworkInterfaces:
-    def __init__(self):
+    def __init__(self, interfaceTraffic: InterfaceTrafficSampler):
         self.interfaces = {}
-        
+        self.priorities = {}
+        self.interfaceTraffic = interfaceTraffic
+
     def getInterfacePriorities(self):
-        if shutil.which("ip"):
-            result = subprocess.check_output(["ip", "route", "show"]).decode()
-            priorities = {}
-            for line in result.splitlines():
-                if "metric" in line and "dev" in line:
-                    parts = line.split()
-                    dev = parts[parts.index("dev")+1]
-                    metric = int(parts[parts.index("metric")+1])
-                    if dev not in priorities:
-                        priorities[dev] = metric
-            return priorities
-        return {}
+        try:
+            if shutil.which("ip"):
+                result = subprocess.check_output(["ip", "route", "show"]).decode()
+                priorities = {}
+                for line in result.splitlines():
+                    if "metric" in line and "dev" in line:
+                        parts = line.split()
+                        dev = parts[parts.index("dev")+1]
+                        metric = int(parts[parts.index("metric")+1])
+                        if dev not in priorities:
+                            priorities[dev] = metric
+                self.priorities = priorities
+        except Exception as e:
+            current_app.logger.error("Get interface priorities error", e)
+        return self.priorities
 
     def getData(self):
-        self.interfaces.clear()
         try:
-            network = psutil.net_io_counters(pernic=True, nowrap=True)
-            for i in network.keys():
-                self.interfaces[i] = network[i]._asdict()
-            time.sleep(1)
-            network = psutil.net_io_counters(pernic=True, nowrap=True)
-            for i in network.keys():
-                self.interfaces[i]['realtime'] = {
-                    'sent': round((network[i].bytes_sent - self.interfaces[i]['bytes_sent']) / 1024 / 1024, 4),
-                    'recv': round((network[i].bytes_recv - self.interfaces[i]['bytes_recv']) / 1024 / 1024, 4)
-                }
+            self.interfaces = self.interfaceTraffic.getInterfaces()
         except Exception as e:
             current_app.logger.error("Get network error", e)
 
@@ -161,44 +198,37 @@ class Processes:
         self.Memory_Top_10_Processes: list[Process] = []
     def getData(self):
         try:
-            processes = list(psutil.process_iter())
-
-            cpu_processes = []
-            memory_processes = []
-
-            for proc in processes:
-                try:
-                    name = proc.name()
-                    cmdline = " ".join(proc.cmdline())
-                    pid = proc.pid
-                    cpu_percent = proc.cpu_percent()
-                    mem_percent = proc.memory_percent()
-
-                    # Create Process object for CPU and memory tracking
-                    cpu_process = Process(name, cmdline, pid, cpu_percent)
-                    mem_process = Process(name, cmdline, pid, mem_percent)
-
-                    cpu_processes.append(cpu_process)
-                    memory_processes.append(mem_process)
-
-                except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                    # Skip processes we can’t access or that no longer exist
-                    continue
-
-            # Sort by CPU and memory usage (descending order)
-            cpu_sorted = sorted(cpu_processes, key=lambda p: p.percent, reverse=True)
-            mem_sorted = sorted(memory_processes, key=lambda p: p.percent, reverse=True)
-
-            # Get top 20 processes for each
-            self.CPU_Top_10_Processes = cpu_sorted[:20]
-            self.Memory_Top_10_Processes = mem_sorted[:20]
+            # process_iter() keeps its Process instances between calls, so cpu_percent is measured since the
+            # previous scan without blocking
+            processes = list(psutil.process_iter(['name', 'cpu_percent', 'memory_percent']))
+            processes = [p for p in processes if p.info['cpu_percent'] is not None
+                         and p.info['memory_percent'] is not None]
+
+            # Sort by CPU and memory usage (descending order) and get top 20 processes for each
+            cpu_sorted = sorted(processes, key=lambda p: p.info['cpu_percent'], reverse=True)[:20]
+            mem_sorted = sorted(processes, key=lambda p: p.info['memory_percent'], reverse=True)[:20]
+
+            # Command lines are only read for the processes that are shown
+            commands = {}
+            for proc in cpu_sorted + mem_sorted:
+                if proc.pid not in commands:
+                    try:
+                        commands[proc.pid] = " ".join(proc.cmdline())
+                    except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                        commands[proc.pid] = ""
+
+            self.CPU_Top_10_Processes = [
+                Process(p.info['name'], commands[p.pid], p.pid, p.info['cpu_percent']) for p in cpu_sorted
+            ]
+            self.Memory_Top_10_Processes = [
+                Process(p.info['name'], commands[p.pid], p.pid, p.info['memory_percent']) for p in mem_sorted
+            ]
 
         except Exception as e:
             current_app.logger.error("Get processes error", e)
 
     def toJson(self):
-        self.getData()
         return {
             "cpu_top_10": self.CPU_Top_10_Processes,
             "memory_top_10": self.Memory_Top_10_Processes
-        }
\ No newline at end of file
+        }
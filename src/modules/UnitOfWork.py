@@ -0,0 +1,156 @@
+"""
+Unit of Work
+"""
+import contextlib
+import sqlalchemy
+from flask import g, has_app_context, current_app
+
+
+class UnitOfWork:
+    """
+    Request scoped database session. Modules joining it share one connection and one transaction per database,
+    which is committed once when the request finishes. Outside a request (background threads, startup), or once
+    the request has finished, the helpers fall back to the engine passed in.
+    """
+    def __init__(self):
+        self.__connections: dict[str, sqlalchemy.Connection] = {}
+        self.Closed: bool = False
+
+    @staticmethod
+    def __key(engine: sqlalchemy.Engine) -> str:
+        return engine.url.render_as_string(hide_password=False)
+
+    def connection(self, engine: sqlalchemy.Engine) -> sqlalchemy.Connection:
+        key = self.__key(engine)
+        if key not in self.__connections:
+            conn = engine.connect()
+            if conn.dialect.name == 'sqlite':
+                # pysqlite begins transactions on its own only before DML, never before a SAVEPOINT. The unit of work
+                # takes over: reads run in autocommit mode, the first write block begins the transaction itself.
+                dbapiConnection = conn.connection.dbapi_connection
+                conn.info['isolation_level'] = dbapiConnection.isolation_level
+                dbapiConnection.isolation_level = None
+            self.__connections[key] = conn
+        return self.__connections[key]
+
+    @staticmethod
+    def __beginSQLite(conn: sqlalchemy.Connection):
+        if not conn.connection.dbapi_connection.in_transaction:
+            conn.exec_driver_sql("BEGIN")
+
+    def commit(self, engine: sqlalchemy.Engine = None):
+        for key, conn in self.__items(engine):
+            if conn.in_transaction():
+                try:
+                    conn.commit()
+                except Exception:
+                    # The driver can still be inside the failed transaction and hold its locks, the pool would not
+                    # roll it back on return since SQLAlchemy considers it ended
+                    conn.invalidate()
+                    raise
+
+    def rollback(self, engine: sqlalchemy.Engine = None):
+        for key, conn in self.__items(engine):
+            if conn.in_transaction():
+                conn.rollback()
+
+    def close(self):
+        self.Closed = True
+        for key, conn in self.__items():
+            if not conn.closed and not conn.invalidated and 'isolation_level' in conn.info:
+                try:
+                    conn.connection.dbapi_connection.isolation_level = conn.info.pop('isolation_level')
+                except Exception:
+                    conn.invalidate()
+            conn.close()
+        self.__connections.clear()
+
+    def __items(self, engine: sqlalchemy.Engine = None) -> list[tuple[str, sqlalchemy.Connection]]:
+        if engine is None:
+            return list(self.__connections.items())
+        key = self.__key(engine)
+        return [(key, self.__connections[key])] if key in self.__connections else []
+
+    @staticmethod
+    def Start():
+        g.unitOfWork = UnitOfWork()
+
+    @staticmethod
+    def Current() -> 'UnitOfWork | None':
+        if not has_app_context():
+            return None
+        unitOfWork = g.get('unitOfWork')
+        if unitOfWork is None or unitOfWork.Closed:
+            return None
+        return unitOfWork
+
+    @staticmethod
+    def Finish(success: bool) -> bool:
+        """
+        Commit or roll back the current unit of work and release its connections
+        @param success: Commit when true, roll back otherwise
+        @return: False if the commit failed
+        """
+        unitOfWork = UnitOfWork.Current()
+        if unitOfWork is None:
+            return True
+        try:
+            if success:
+                unitOfWork.commit()
+            else:
+                unitOfWork.rollback()
+        except Exception as e:
+            current_app.logger.error("Committing unit of work failed", exc_info=e)
+            unitOfWork.rollback()
+            return False
+        finally:
+            unitOfWork.close()
+        return True
+
+    @staticmethod
+    def Discard():
+        if has_app_context():
+            unitOfWork = g.pop('unitOfWork', None)
+            if unitOfWork is not None and not unitOfWork.Closed:
+                unitOfWork.rollback()
+                unitOfWork.close()
+
+    @staticmethod
+    @contextlib.contextmanager
+    def Begin(engine: sqlalchemy.Engine):
+        """
+        Replacement for engine.begin(). Inside a unit of work the block runs in a savepoint of the shared
+        transaction, a failing block only rolls back its own writes and raises like engine.begin() would.
+        """
+        unitOfWork = UnitOfWork.Current()
+        if unitOfWork is None:
+            with engine.begin() as conn:
+                yield conn
+            return
+        conn = unitOfWork.connection(engine)
+        if conn.dialect.name == 'sqlite':
+            UnitOfWork.__beginSQLite(conn)
+        with conn.begin_nested():
+            yield conn
+
+    @staticmethod
+    @contextlib.contextmanager
+    def Connect(engine: sqlalchemy.Engine):
+        """
+        Replacement for engine.connect(), reads see what the unit of work wrote so far
+        """
+        unitOfWork = UnitOfWork.Current()
+        if unitOfWork is None:
+            with engine.connect() as conn:
+                yield conn
+            return
+        yield unitOfWork.connection(engine)
+
+    @staticmethod
+    def Flush(engine: sqlalchemy.Engine):
+        """
+        Commit pending work on the engine's database, required before DDL or VACUUM run on their own connection
+        """
+        unitOfWork = UnitOfWork.Current()
+        if unitOfWork is not None:
+            unitOfWork.commit(engine)
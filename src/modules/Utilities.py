@@ -1,5 +1,13 @@
 import re, ipaddress
-import subprocess
+import base64, binascii, hashlib, os
+import subprocess, threading
+from collections import OrderedDict
+
+try:
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+except ImportError:
+    X25519PrivateKey = None
 
 
 def RegexMatch(regex, text) -> bool:
@@ -33,6 +41,22 @@ def StringToBoolean(value: str):
     return (value.strip().replace(" ", "").lower() in 
             ("yes", "true", "t", "1", 1))
 
+def BytesToGigabytes(value: int | None) -> float:
+    """
+    Convert a byte counter to gigabytes for serialization
+    @param value: Number of bytes
+    @return: Number of gigabytes
+    """
+    return (value or 0) / (1024 ** 3)
+
+def GigabytesToBytes(value: str | float) -> int:
+    """
+    Convert a gigabyte amount entered by the user to a byte counter
+    @param value: Number of gigabytes
+    @return: Number of bytes
+    """
+    return round(float(value) * (1024 ** 3))
+
 def ValidateIPAddressesWithRange(ips: str) -> bool:
     s = ips.replace(" ", "").split(",")
     for ip in s:
@@ -68,22 +92,103 @@ def ValidateEndpointAllowedIPs(IPs) -> tuple[bool, str] | tuple[bool, None]:
             return False, str(e)
     return True, None
 
-def GenerateWireguardPublicKey(privateKey: str) -> tuple[bool, str] | tuple[bool, None]:
+def X25519(scalar: bytes, u: bytes) -> bytes:
+    """
+    X25519 function from RFC 7748, used when the cryptography package is not installed. It is not constant time,
+    which is acceptable for deriving keys on the dashboard host.
+    @param scalar: 32 bytes scalar, clamped here
+    @param u: 32 bytes u-coordinate
+    @return: 32 bytes result
+    """
+    p = 2 ** 255 - 19
+    k = bytearray(scalar)
+    k[0] &= 248
+    k[31] &= 127
+    k[31] |= 64
+    k = int.from_bytes(k, "little")
+    x1 = int.from_bytes(u, "little") & ((1 << 255) - 1)
+    x2, z2, x3, z3, swap = 1, 0, x1, 1, 0
+    for t in reversed(range(255)):
+        bit = (k >> t) & 1
+        swap ^= bit
+        if swap:
+            x2, x3, z2, z3 = x3, x2, z3, z2
+        swap = bit
+        a, b = (x2 + z2) % p, (x2 - z2) % p
+        aa, bb = a * a % p, b * b % p
+        e = (aa - bb) % p
+        da, cb = (x3 - z3) * a % p, (x3 + z3) * b % p
+        x3, z3 = (da + cb) ** 2 % p, x1 * (da - cb) ** 2 % p
+        x2, z2 = aa * bb % p, e * (aa + 121665 * e) % p
+    if swap:
+        x2, z2 = x3, z3
+    return (x2 * pow(z2, p - 2, p) % p).to_bytes(32, "little")
+
+def DeriveX25519PublicKey(privateKey: bytes) -> bytes:
+    if X25519PrivateKey is not None:
+        return X25519PrivateKey.from_private_bytes(privateKey).public_key().public_bytes(
+            serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+    return X25519(privateKey, (9).to_bytes(32, "little"))
+
+# Derived public keys by keyed hash of the private key, the private keys themselves are never stored
+PublicKeyCacheSize = 256
+_PublicKeyCache: OrderedDict[bytes, str] = OrderedDict()
+_PublicKeyCacheSalt = os.urandom(32)
+_PublicKeyCacheLock = threading.Lock()
+
+def GenerateWireguardPublicKey(privateKey: str, cache: bool = True) -> tuple[bool, str] | tuple[bool, None]:
+    """
+    Derive the public key of a private key in process, same output as wg pubkey
+    @param privateKey: Base64 encoded private key
+    @param cache: Remember the result, for keys derived again and again like the configurations' own keys
+    @return: Base64 encoded public key
+    """
     try:
-        publicKey = subprocess.check_output(f"wg pubkey", input=privateKey.encode(), shell=True,
-                                            stderr=subprocess.STDOUT)
-        return True, publicKey.decode().strip('\n')
-    except subprocess.CalledProcessError:
+        key = base64.b64decode(privateKey.strip(), validate=True)
+    except (binascii.Error, ValueError):
         return False, None
-    
-def GenerateWireguardPrivateKey() -> tuple[bool, str] | tuple[bool, None]:
-    try:
-        publicKey = subprocess.check_output(f"wg genkey", shell=True,
-                                            stderr=subprocess.STDOUT)
-        return True, publicKey.decode().strip('\n')
-    except subprocess.CalledProcessError:
+    if len(key) != 32:
         return False, None
+    digest = hashlib.blake2b(key, key=_PublicKeyCacheSalt).digest()
+    with _PublicKeyCacheLock:
+        publicKey = _PublicKeyCache.get(digest)
+        if publicKey is not None:
+            _PublicKeyCache.move_to_end(digest)
+            return True, publicKey
+    try:
+        publicKey = base64.b64encode(DeriveX25519PublicKey(key)).decode()
+    except Exception:
+        try:
+            publicKey = subprocess.check_output(
+                ["wg", "pubkey"], input=privateKey.encode(), stderr=subprocess.STDOUT).decode().strip('\n')
+        except (subprocess.CalledProcessError, OSError):
+            return False, None
+    if cache:
+        with _PublicKeyCacheLock:
+            _PublicKeyCache[digest] = publicKey
+            _PublicKeyCache.move_to_end(digest)
+            while len(_PublicKeyCache) > PublicKeyCacheSize:
+                _PublicKeyCache.popitem(last=False)
+    return True, publicKey
     
+def GenerateWireguardPrivateKey() -> tuple[bool, str] | tuple[bool, None]:
+    """
+    Generate a private key in process, clamped like wg genkey does
+    @return: Base64 encoded private key
+    """
+    key = bytearray(os.urandom(32))
+    key[0] &= 248
+    key[31] &= 127
+    key[31] |= 64
+    return True, base64.b64encode(bytes(key)).decode()
+
+def GenerateWireguardPresharedKey() -> tuple[bool, str] | tuple[bool, None]:
+    """
+    Generate a preshared key, 32 random bytes like wg genpsk
+    @return: Base64 encoded preshared key
+    """
+    return True, base64.b64encode(os.urandom(32)).decode()
+
 def ValidatePasswordStrength(password: str) -> tuple[bool, str] | tuple[bool, None]:
     # Rules:
     #     - Must be over 8 characters & numbers
@@ -1,27 +1,94 @@
 """
 WireGuard Configuration
 """
-from typing import Any
+from typing import Any, Iterator
 
 import jinja2
-import sqlalchemy, random, shutil, configparser, ipaddress, os, subprocess, time, re, uuid, psutil, traceback
+import sqlalchemy, random, shutil, configparser, ipaddress, os, subprocess, time, re, uuid, psutil, traceback, threading
 from zipfile import ZipFile
 from datetime import datetime, timedelta
-from itertools import islice
+from itertools import count
 from flask import current_app
 
 from .ConnectionString import ConnectionString
 from .DashboardConfig import DashboardConfig
-from .Peer import Peer
+from .Peer import Peer, DataUsageFields
 from .PeerJobs import PeerJobs
+from .PeerChangeLog import PeerChangeLog
 from .PeerShareLinks import PeerShareLinks
 from .Utilities import StringToBoolean, GenerateWireguardPublicKey, RegexMatch, ValidateDNSAddress, \
-    ValidateEndpointAllowedIPs
+    ValidateEndpointAllowedIPs, BytesToGigabytes
 from .WireguardConfigurationInfo import WireguardConfigurationInfo, PeerGroupsClass
 from .DashboardWebHooks import DashboardWebHooks
+from .UnitOfWork import UnitOfWork
+from .BackupIndex import BackupIndex
+from .AddressAllocator import AddressAllocator
+from .PrefixTrie import PrefixTrie
+from .InterfaceTrafficSampler import InterfaceTrafficSampler
 
 
 class WireguardConfiguration:
+    # Versions come from one process-wide counter so they never repeat across configurations, the token keeps
+    # ETags from a previous process, or from another gunicorn worker, from matching. ResetStateVersionToken runs in
+    # every forked child, so workers forked from the master never share a token.
+    StateVersionCounter = count(1)
+    StateVersionToken = uuid.uuid4().hex[:12]
+
+    @staticmethod
+    def ResetStateVersionToken():
+        WireguardConfiguration.StateVersionToken = uuid.uuid4().hex[:12]
+
+    # Names of the network interfaces and when they were read, shared by every configuration
+    __interfaceNames: tuple[float, set[str]] = (0, set())
+
+    @staticmethod
+    def InterfaceNames(maxAge: float = 0) -> set[str]:
+        """
+        Names of the network interfaces that are up
+        @param maxAge: Seconds an earlier answer stays good for, 0 always asks psutil
+        """
+        readAt, names = WireguardConfiguration.__interfaceNames
+        if maxAge <= 0 or time.monotonic() - readAt > maxAge:
+            names = set(psutil.net_if_addrs().keys())
+            WireguardConfiguration.__interfaceNames = (time.monotonic(), names)
+        return names
+
+    # Rows per multi-row INSERT ... VALUES statement, keeps each statement under MySQL's max_allowed_packet
+    BulkInsertChunkSize = 1000
+
+    @staticmethod
+    def BulkInsert(conn: sqlalchemy.Connection, table: sqlalchemy.Table, rows: list[dict], method: str = None):
+        """
+        Insert many rows with the fastest path the database dialect offers
+        @param conn: Connection with an active transaction
+        @param table: Table to insert into
+        @param rows: Rows to insert, all with the same keys
+        @param method: copy, values or executemany, None picks COPY on PostgreSQL, multi-row VALUES on MySQL and
+        executemany elsewhere. copy falls back to executemany when the driver is not psycopg 3
+        """
+        if len(rows) == 0:
+            return
+        if method is None:
+            method = {'postgresql': 'copy', 'mysql': 'values'}.get(conn.dialect.name, 'executemany')
+        if method == 'copy':
+            columns = list(rows[0].keys())
+            preparer = conn.dialect.identifier_preparer
+            copyStatement = (f'COPY {preparer.format_table(table)} '
+                             f'({", ".join(preparer.quote(c) for c in columns)}) FROM STDIN')
+            with conn.connection.driver_connection.cursor() as cursor:
+                # Only psycopg 3 cursors have copy
+                if hasattr(cursor, "copy"):
+                    with cursor.copy(copyStatement) as copy:
+                        for row in rows:
+                            copy.write_row(tuple(row[c] for c in columns))
+                    return
+        elif method == 'values':
+            size = WireguardConfiguration.BulkInsertChunkSize
+            for i in range(0, len(rows), size):
+                conn.execute(table.insert().values(rows[i:i + size]))
+            return
+        conn.execute(table.insert(), rows)
+
     class InvalidConfigurationFileException(Exception):
         def __init__(self, m):
             self.message = m
@@ -40,6 +107,16 @@ class WireguardConfiguration:
                  wg: bool = True
                  ):
         self.Peers = []
+        self.PeersIndex: dict[str, Peer] = {}
+        self.RestrictedPeers = []
+        self.StateVersion: int = next(WireguardConfiguration.StateVersionCounter)
+        # Held while peers are replaced together with their version and changes, and while getPeerChanges reads them
+        self.__stateVersionLock = threading.RLock()
+        self.__peerFingerprints: dict[bool, dict[str, int]] = {False: {}, True: {}}
+        self.PeerChangeLog: PeerChangeLog = PeerChangeLog()
+        self.__addressAllocator: AddressAllocator | None = None
+        self.__allowedIPsIndex: PrefixTrie | None = None
+        self.__peerIndexesLock = threading.Lock()
         self.__parser: configparser.ConfigParser = configparser.RawConfigParser(strict=False)
         self.__parser.optionxform = str
         self.__configFileModifiedTime = None
@@ -215,9 +292,11 @@ class WireguardConfiguration:
             if self.PrivateKey:
                 self.PublicKey = self.__getPublicKey()
             self.Status = self.getStatus()
+            self.bumpStateVersion()
 
     def __dropDatabase(self):
         existingTables = [self.Name, f'{self.Name}_restrict_access', f'{self.Name}_transfer', f'{self.Name}_deleted']
+        UnitOfWork.Flush(self.engine)
         try:
             with self.engine.begin() as conn:
                 for t in existingTables:
@@ -241,16 +320,16 @@ class WireguardConfiguration:
             sqlalchemy.Column('DNS', sqlalchemy.Text),
             sqlalchemy.Column('endpoint_allowed_ip', sqlalchemy.Text),
             sqlalchemy.Column('name', sqlalchemy.Text),
-            sqlalchemy.Column('total_receive', sqlalchemy.Float),
-            sqlalchemy.Column('total_sent', sqlalchemy.Float),
-            sqlalchemy.Column('total_data', sqlalchemy.Float),
+            sqlalchemy.Column('total_receive', sqlalchemy.BigInteger),
+            sqlalchemy.Column('total_sent', sqlalchemy.BigInteger),
+            sqlalchemy.Column('total_data', sqlalchemy.BigInteger),
             sqlalchemy.Column('endpoint', sqlalchemy.String(255)),
             sqlalchemy.Column('status', sqlalchemy.String(255)),
             sqlalchemy.Column('latest_handshake', sqlalchemy.String(255)),
             sqlalchemy.Column('allowed_ip', sqlalchemy.String(255)),
-            sqlalchemy.Column('cumu_receive', sqlalchemy.Float),
-            sqlalchemy.Column('cumu_sent', sqlalchemy.Float),
-            sqlalchemy.Column('cumu_data', sqlalchemy.Float),
+            sqlalchemy.Column('cumu_receive', sqlalchemy.BigInteger),
+            sqlalchemy.Column('cumu_sent', sqlalchemy.BigInteger),
+            sqlalchemy.Column('cumu_data', sqlalchemy.BigInteger),
             sqlalchemy.Column('mtu', sqlalchemy.Integer),
             sqlalchemy.Column('keepalive', sqlalchemy.Integer),
             sqlalchemy.Column('remote_endpoint', sqlalchemy.String(255)),
@@ -264,16 +343,16 @@ class WireguardConfiguration:
             sqlalchemy.Column('DNS', sqlalchemy.Text),
             sqlalchemy.Column('endpoint_allowed_ip', sqlalchemy.Text),
             sqlalchemy.Column('name', sqlalchemy.Text),
-            sqlalchemy.Column('total_receive', sqlalchemy.Float),
-            sqlalchemy.Column('total_sent', sqlalchemy.Float),
-            sqlalchemy.Column('total_data', sqlalchemy.Float),
+            sqlalchemy.Column('total_receive', sqlalchemy.BigInteger),
+            sqlalchemy.Column('total_sent', sqlalchemy.BigInteger),
+            sqlalchemy.Column('total_data', sqlalchemy.BigInteger),
             sqlalchemy.Column('endpoint', sqlalchemy.String(255)),
             sqlalchemy.Column('status', sqlalchemy.String(255)),
             sqlalchemy.Column('latest_handshake', sqlalchemy.String(255)),
             sqlalchemy.Column('allowed_ip', sqlalchemy.String(255)),
-            sqlalchemy.Column('cumu_receive', sqlalchemy.Float),
-            sqlalchemy.Column('cumu_sent', sqlalchemy.Float),
-            sqlalchemy.Column('cumu_data', sqlalchemy.Float),
+            sqlalchemy.Column('cumu_receive', sqlalchemy.BigInteger),
+            sqlalchemy.Column('cumu_sent', sqlalchemy.BigInteger),
+            sqlalchemy.Column('cumu_data', sqlalchemy.BigInteger),
             sqlalchemy.Column('mtu', sqlalchemy.Integer),
             sqlalchemy.Column('keepalive', sqlalchemy.Integer),
             sqlalchemy.Column('remote_endpoint', sqlalchemy.String(255)),
@@ -283,12 +362,12 @@ class WireguardConfiguration:
         self.peersTransferTable = sqlalchemy.Table(
             f'{dbName}_transfer', self.metadata,
             sqlalchemy.Column('id', sqlalchemy.String(255), nullable=False),
-            sqlalchemy.Column('total_receive', sqlalchemy.Float),
-            sqlalchemy.Column('total_sent', sqlalchemy.Float),
-            sqlalchemy.Column('total_data', sqlalchemy.Float),
-            sqlalchemy.Column('cumu_receive', sqlalchemy.Float),
-            sqlalchemy.Column('cumu_sent', sqlalchemy.Float),
-            sqlalchemy.Column('cumu_data', sqlalchemy.Float),
+            sqlalchemy.Column('total_receive', sqlalchemy.BigInteger),
+            sqlalchemy.Column('total_sent', sqlalchemy.BigInteger),
+            sqlalchemy.Column('total_data', sqlalchemy.BigInteger),
+            sqlalchemy.Column('cumu_receive', sqlalchemy.BigInteger),
+            sqlalchemy.Column('cumu_sent', sqlalchemy.BigInteger),
+            sqlalchemy.Column('cumu_data', sqlalchemy.BigInteger),
             sqlalchemy.Column('time', (sqlalchemy.DATETIME if self.DashboardConfig.GetConfig("Database", "type")[1] == 'sqlite' else sqlalchemy.TIMESTAMP),
                               server_default=sqlalchemy.func.now()),
             extend_existing=True
@@ -310,16 +389,16 @@ class WireguardConfiguration:
             sqlalchemy.Column('DNS', sqlalchemy.Text),
             sqlalchemy.Column('endpoint_allowed_ip', sqlalchemy.Text),
             sqlalchemy.Column('name', sqlalchemy.Text),
-            sqlalchemy.Column('total_receive', sqlalchemy.Float),
-            sqlalchemy.Column('total_sent', sqlalchemy.Float),
-            sqlalchemy.Column('total_data', sqlalchemy.Float),
+            sqlalchemy.Column('total_receive', sqlalchemy.BigInteger),
+            sqlalchemy.Column('total_sent', sqlalchemy.BigInteger),
+            sqlalchemy.Column('total_data', sqlalchemy.BigInteger),
             sqlalchemy.Column('endpoint', sqlalchemy.String(255)),
             sqlalchemy.Column('status', sqlalchemy.String(255)),
             sqlalchemy.Column('latest_handshake', sqlalchemy.String(255)),
             sqlalchemy.Column('allowed_ip', sqlalchemy.String(255)),
-            sqlalchemy.Column('cumu_receive', sqlalchemy.Float),
-            sqlalchemy.Column('cumu_sent', sqlalchemy.Float),
-            sqlalchemy.Column('cumu_data', sqlalchemy.Float),
+            sqlalchemy.Column('cumu_receive', sqlalchemy.BigInteger),
+            sqlalchemy.Column('cumu_sent', sqlalchemy.BigInteger),
+            sqlalchemy.Column('cumu_data', sqlalchemy.BigInteger),
             sqlalchemy.Column('mtu', sqlalchemy.Integer),
             sqlalchemy.Column('keepalive', sqlalchemy.Integer),
             sqlalchemy.Column('remote_endpoint', sqlalchemy.String(255)),
@@ -333,10 +412,51 @@ class WireguardConfiguration:
             extend_existing=True
         )
 
+        UnitOfWork.Flush(self.engine)
         self.metadata.create_all(self.engine)
+        self.migrateDataUsageColumns()
+
+    def migrateDataUsageColumns(self):
+        """
+        Convert data usage columns created by older versions from Float gigabytes to BigInteger bytes
+        """
+        columns = ['total_receive', 'total_sent', 'total_data', 'cumu_receive', 'cumu_sent', 'cumu_data']
+        inspector = sqlalchemy.inspect(self.engine)
+        for table in [self.peersTable, self.peersRestrictedTable, self.peersTransferTable, self.peersDeletedTable]:
+            existing = {c['name']: c['type'] for c in inspector.get_columns(table.name)}
+            legacy = [c for c in columns if c in existing.keys() and isinstance(existing[c], sqlalchemy.Float)]
+            if len(legacy) == 0:
+                continue
+            current_app.logger.info(f"Converting data usage columns of {table.name} from GB to bytes")
+            with self.engine.begin() as conn:
+                q = conn.dialect.identifier_preparer.quote
+                tableName = q(table.name)
+                if conn.dialect.name == 'postgresql':
+                    for c in legacy:
+                        conn.execute(sqlalchemy.text(
+                            f'ALTER TABLE {tableName} ALTER COLUMN {q(c)} TYPE BIGINT '
+                            f'USING ROUND({q(c)} * 1073741824)::BIGINT'
+                        ))
+                elif conn.dialect.name == 'mysql':
+                    for c in legacy:
+                        conn.execute(sqlalchemy.text(f'ALTER TABLE {tableName} MODIFY COLUMN {q(c)} DOUBLE'))
+                        conn.execute(sqlalchemy.text(f'UPDATE {tableName} SET {q(c)} = ROUND({q(c)} * 1073741824)'))
+                        conn.execute(sqlalchemy.text(f'ALTER TABLE {tableName} MODIFY COLUMN {q(c)} BIGINT'))
+                else:
+                    # SQLite cannot alter a column type, rebuild the table instead
+                    legacyTableName = q(f'{table.name}_legacy')
+                    conn.execute(sqlalchemy.text(f'ALTER TABLE {tableName} RENAME TO {legacyTableName}'))
+                    table.create(conn)
+                    copyColumns = [c.name for c in table.columns if c.name in existing.keys()]
+                    conn.execute(sqlalchemy.text(
+                        f'INSERT INTO {tableName} ({", ".join(q(c) for c in copyColumns)}) '
+                        f'SELECT {", ".join((f"CAST(ROUND({q(c)} * 1073741824) AS INTEGER)" if c in legacy else q(c)) for c in copyColumns)} '
+                        f'FROM {legacyTableName}'
+                    ))
+                    conn.execute(sqlalchemy.text(f'DROP TABLE {legacyTableName}'))
 
     def __dumpDatabase(self):
-        with self.engine.connect() as conn:
+        with UnitOfWork.Connect(self.engine) as conn:
             tables = [self.peersTable, self.peersRestrictedTable, self.peersTransferTable, self.peersDeletedTable]
             for i in tables:
                 rows = conn.execute(i.select()).mappings().fetchall()
@@ -350,7 +470,7 @@ class WireguardConfiguration:
         self.createDatabase()
         if not os.path.exists(sqlFilePath):
             return False
-        with self.engine.begin() as conn:
+        with UnitOfWork.Begin(self.engine) as conn:
             with open(sqlFilePath, 'r') as f:
                 for l in f.readlines():
                     l = l.rstrip("\n")
@@ -361,10 +481,82 @@ class WireguardConfiguration:
     def __getPublicKey(self) -> str:
         return GenerateWireguardPublicKey(self.PrivateKey)[1]
 
-    def getStatus(self) -> bool:
-        self.Status = self.Name in psutil.net_if_addrs().keys()
+    def getStatus(self, maxAge: float = 0) -> bool:
+        """
+        Whether the interface of the configuration is up
+        @param maxAge: Seconds a previous interface listing may be reused for, see InterfaceNames()
+        """
+        status = self.Name in WireguardConfiguration.InterfaceNames(maxAge)
+        if status != self.Status:
+            self.bumpStateVersion()
+        self.Status = status
         return self.Status
 
+    def bumpStateVersion(self):
+        with self.__stateVersionLock:
+            self.StateVersion = next(WireguardConfiguration.StateVersionCounter)
+
+    def getETag(self) -> str:
+        """
+        Strong ETag of the configuration and its peers, changes whenever the state version is bumped
+        @return: ETag value without quotes
+        """
+        # Polls of every configuration share one interface listing per second
+        self.getStatus(1)
+        return f"{WireguardConfiguration.StateVersionToken}-{self.StateVersion}"
+
+    def trackPeerChanges(self, peers: list[Peer], restricted: bool = False):
+        """
+        Compare the peers against their fingerprints from the last call and bump the state version on any difference
+        @param peers: Current peers or restricted peers
+        @param restricted: Whether peers is the restricted peers list
+        """
+        fingerprints = {p.id: p.getFingerprint() for p in peers}
+        with self.__stateVersionLock:
+            previous = self.__peerFingerprints[restricted]
+            if fingerprints == previous:
+                return
+            self.__peerFingerprints[restricted] = fingerprints
+            changes = [(k, "added" if k not in previous else "updated")
+                       for k, v in fingerprints.items() if previous.get(k) != v]
+            changes += [(k, "removed") for k in previous.keys() if k not in fingerprints]
+            # The changes must be in the log before anyone can see the version they belong to
+            version = next(WireguardConfiguration.StateVersionCounter)
+            self.PeerChangeLog.record(version, changes)
+            self.StateVersion = version
+
+    def getPeerChanges(self, since: str) -> dict:
+        """
+        Peers that were added, changed, restricted or removed after a version returned by an earlier call
+        @param since: Version string from a previous response for this configuration, anything else asks for a full
+        resync
+        @return: Changed peers, changed restricted peers, removed peer IDs and the current version
+        """
+        prefix = f"{WireguardConfiguration.StateVersionToken}-{self.Name}"
+        sincePrefix, _, sinceVersion = (since or "").rpartition("-")
+        with self.__stateVersionLock:
+            currentVersion = f"{prefix}-{self.StateVersion}"
+            complete, peerIds = False, []
+            # Versions of another configuration, process or worker are not comparable, they get a full resync
+            if sincePrefix == prefix and sinceVersion.isdigit():
+                complete, peerIds = self.PeerChangeLog.since(int(sinceVersion))
+            if not complete:
+                return {
+                    "version": currentVersion,
+                    "fullResync": True,
+                    "configurationPeers": list(self.Peers),
+                    "configurationRestrictedPeers": list(self.RestrictedPeers),
+                    "removedPeers": []
+                }
+            restrictedIndex = {p.id: p for p in self.RestrictedPeers}
+            return {
+                "version": currentVersion,
+                "fullResync": False,
+                "configurationPeers": [self.PeersIndex[i] for i in peerIds if i in self.PeersIndex],
+                "configurationRestrictedPeers": [restrictedIndex[i] for i in peerIds if i in restrictedIndex],
+                "removedPeers": [i for i in peerIds if i not in self.PeersIndex and i not in restrictedIndex]
+            }
+
     def getAutostartStatus(self):
         s, d = self.DashboardConfig.GetConfig("WireGuardConfiguration", "autostart")
         return self.Name in d
@@ -382,11 +574,27 @@ class WireguardConfiguration:
             self.DashboardConfig.SetConfig("WireGuardConfiguration", "autostart", d)
 
     def getRestrictedPeers(self):
-        self.RestrictedPeers = []
-        with self.engine.connect() as conn:
+        restrictedPeers = []
+        with UnitOfWork.Connect(self.engine) as conn:
             restricted = conn.execute(self.peersRestrictedTable.select()).mappings().fetchall()
             for i in restricted:
-                self.RestrictedPeers.append(Peer(i, self))
+                restrictedPeers.append(Peer(i, self))
+        self.publishPeers(restrictedPeers, True)
+
+    def publishPeers(self, peers: list[Peer], restricted: bool = False):
+        """
+        Replace the peers, with the public key index used by searchPeer() and queryPeers(), or the restricted peers.
+        The list, its index and the state version change in one step, getPeerChanges never sees them half updated.
+        @param peers: New peers or restricted peers
+        @param restricted: Whether peers is the restricted peers list
+        """
+        with self.__stateVersionLock:
+            if restricted:
+                self.RestrictedPeers = peers
+            else:
+                self.Peers = peers
+                self.PeersIndex = {p.id: p for p in peers}
+            self.trackPeerChanges(peers, restricted)
 
     def configurationFileChanged(self) :
         mt = os.path.getmtime(self.configPath)
@@ -427,7 +635,7 @@ class WireguardConfiguration:
                     
                     for i in p:
                         if "PublicKey" in i.keys():
-                            with self.engine.connect() as conn:
+                            with UnitOfWork.Connect(self.engine) as conn:
                                 tempPeer = conn.execute(
                                     self.peersTable.select().where(
                                         self.peersTable.columns.id == i['PublicKey']
@@ -457,12 +665,12 @@ class WireguardConfiguration:
                                     "remote_endpoint": self.DashboardConfig.GetConfig("Peers", "remote_endpoint")[1],
                                     "preshared_key": i["PresharedKey"] if "PresharedKey" in i.keys() else ""
                                 }
-                                with self.engine.begin() as conn:
+                                with UnitOfWork.Begin(self.engine) as conn:
                                     conn.execute(
                                         self.peersTable.insert().values(tempPeer)
                                     )                                    
                             else:
-                                with self.engine.begin() as conn:
+                                with UnitOfWork.Begin(self.engine) as conn:
                                     conn.execute(
                                         self.peersTable.update().values({
                                             "allowed_ip": i.get("AllowedIPs", "N/A")
@@ -474,31 +682,31 @@ class WireguardConfiguration:
                 except Exception as e:
                     current_app.logger.error(f"{self.Name} getPeers() Error", e)
         else:
-            with self.engine.connect() as conn:
+            with UnitOfWork.Connect(self.engine) as conn:
                 existingPeers = conn.execute(self.peersTable.select()).mappings().fetchall()
                 for i in existingPeers:
                     tmpList.append(Peer(i, self))
-        self.Peers = tmpList
+        self.publishPeers(tmpList)
     
     def logPeersTraffic(self):
-        with self.engine.begin() as conn:
-            for tempPeer in self.Peers:
-                if tempPeer.status == "running":
-                    conn.execute(
-                        self.peersTransferTable.insert().values({
-                            "id": tempPeer.id,
-                            "total_receive": tempPeer.total_receive,
-                            "total_sent": tempPeer.total_sent,
-                            "total_data": tempPeer.total_data,
-                            "cumu_sent": tempPeer.cumu_sent,
-                            "cumu_receive": tempPeer.cumu_receive,
-                            "cumu_data": tempPeer.cumu_data,
-                            "time": datetime.now()
-                        })
-                    )
-    
+        now = datetime.now()
+        rows = [{
+            "id": tempPeer.id,
+            "total_receive": tempPeer.total_receive,
+            "total_sent": tempPeer.total_sent,
+            "total_data": tempPeer.total_data,
+            "cumu_receive": tempPeer.cumu_receive,
+            "cumu_sent": tempPeer.cumu_sent,
+            "cumu_data": tempPeer.cumu_data,
+            "time": now
+        } for tempPeer in self.Peers if tempPeer.status == "running"]
+        if len(rows) == 0:
+            return
+        with UnitOfWork.Begin(self.engine) as conn:
+            WireguardConfiguration.BulkInsert(conn, self.peersTransferTable, rows)
+
     def logPeersHistoryEndpoint(self):
-        with self.engine.begin() as conn:
+        with UnitOfWork.Begin(self.engine) as conn:
             for tempPeer in self.Peers:
                 if tempPeer.status == "running":
                     endpoint = tempPeer.endpoint.rsplit(":", 1)    
@@ -526,7 +734,7 @@ class WireguardConfiguration:
             "peers": []
         }
         try:
-            with self.engine.begin() as conn:
+            with UnitOfWork.Begin(self.engine) as conn:
                 for i in peers:
                     newPeer = {
                         "id": i['id'],
@@ -574,6 +782,7 @@ class WireguardConfiguration:
 
             command = [f"{self.Protocol}-quick", "save", self.Name]
             subprocess.check_output(command, stderr=subprocess.STDOUT)
+            self.assignPeerAddresses(peers)
             self.getPeers()
             for p in peers:
                 p = self.searchPeer(p['id'])
@@ -588,54 +797,297 @@ class WireguardConfiguration:
             return False, [], "Internal server error"
         return True, result['peers'], ""
 
+    def updatePeers(self, operations: list, atomic: bool = False) -> tuple[bool, list[dict]]:
+        """
+        Update the settings of many peers with one wg set per chunk of peers, one save and one database transaction
+        @param operations: List of dicts with the peer's id and the SettingsFields to change, fields left out keep
+        their current value
+        @param atomic: Apply nothing if any operation is invalid or the interface rejects a change, chunks already
+        set on the interface are set back to the peers' previous values. In either mode a failed save sets every
+        chunk back, and their operations fail
+        @return: Whether every operation was applied, and one {id, status, message} result per operation
+        """
+        def normalizeAllowedIPs(allowedIPs: str) -> str:
+            return ",".join(ip.strip() for ip in (allowedIPs or "").split(",") if len(ip.strip()) > 0)
+
+        results = []
+        pending: list[tuple[Peer, dict, dict]] = []
+        seenIds = set()
+        allowedIps = {p.id: p.allowed_ip for p in self.getPeersList()}
+        for operation in operations:
+            result = {"id": operation.get('id') if isinstance(operation, dict) else None, "status": False,
+                      "message": None}
+            results.append(result)
+            if not isinstance(operation, dict) or type(operation.get('id')) is not str or len(operation['id']) == 0:
+                result['id'] = None
+                result['message'] = "Peer ID is required"
+                continue
+            if result['id'] in seenIds:
+                result['message'] = "Peer appears more than once in this batch"
+                continue
+            seenIds.add(result['id'])
+            foundPeer, peer = self.searchPeer(result['id'])
+            if not foundPeer:
+                result['message'] = "Peer does not exist"
+                continue
+            unknownFields = [k for k in operation.keys() if k != 'id' and k not in peer.SettingsFields]
+            if len(unknownFields) > 0:
+                result['message'] = f"Unknown fields: {', '.join(unknownFields)}"
+                continue
+            settings = {f: operation.get(f, getattr(peer, f)) for f in peer.SettingsFields}
+            valid, msg = peer.validateSettings(settings)
+            if not valid:
+                result['message'] = msg
+                continue
+            allowedIps[peer.id] = settings['allowed_ip']
+            pending.append((peer, settings, result))
+
+        # Check changed allowed IPs against everyone's allowed IPs as they will be after this batch
+        changed = [p for p in pending
+                   if normalizeAllowedIPs(p[1]['allowed_ip']) != normalizeAllowedIPs(p[0].allowed_ip)]
+        if len(changed) > 0:
+            proposed = PrefixTrie()
+            for peerId, ips in allowedIps.items():
+                proposed.assign(peerId, ips)
+            for peer in self.getRestrictedPeersList():
+                proposed.assign(peer.id, peer.allowed_ip)
+            for peer, settings, result in changed:
+                if len(proposed.overlaps(settings['allowed_ip'], peer.id)) > 0:
+                    result['message'] = "Allowed IP already taken by another peer"
+        pending = [p for p in pending if p[2]['message'] is None]
+
+        if atomic and len(pending) < len(results):
+            for peer, settings, result in pending:
+                result['message'] = "Not applied, another operation in this batch is invalid"
+            return False, results
+        if len(pending) == 0:
+            return False, results
+
+        if not self.getStatus():
+            self.toggleConfiguration()
+
+        interfaceChanges = [p for p in pending
+                            if normalizeAllowedIPs(p[1]['allowed_ip']) != normalizeAllowedIPs(p[0].allowed_ip)
+                            or p[1]['preshared_key'] != p[0].preshared_key]
+        failed, applied = [], []
+        for i in range(0, len(interfaceChanges), 100):
+            chunk = interfaceChanges[i:i + 100]
+            if self.__setInterfacePeers([(peer, settings['allowed_ip'], settings['preshared_key'])
+                                         for peer, settings, result in chunk]):
+                applied += chunk
+            else:
+                failed += chunk
+                if atomic:
+                    break
+
+        saveFailed = False
+        if len(applied) > 0 and (not atomic or len(failed) == 0):
+            try:
+                saveConfig = subprocess.check_output([f"{self.Protocol}-quick", "save", self.Name],
+                                                     stderr=subprocess.STDOUT)
+                if f"wg showconf {self.Name}" not in saveConfig.decode().strip('\n'):
+                    raise subprocess.CalledProcessError(0, "save", saveConfig)
+            except subprocess.CalledProcessError as exc:
+                current_app.logger.error(f"Update peers failed when saving the configuration:\n{exc.output.decode('UTF-8')}")
+                saveFailed = True
+
+        if saveFailed or (atomic and len(failed) > 0):
+            # Put the chunks that went through back, so the interface matches the configuration file and the results
+            for i in range(0, len(applied), 100):
+                self.__setInterfacePeers([(peer, peer.allowed_ip, peer.preshared_key)
+                                          for peer, settings, result in applied[i:i + 100]])
+            if saveFailed:
+                failed, applied = interfaceChanges, []
+
+        if atomic and len(failed) > 0:
+            for peer, settings, result in pending:
+                result['message'] = "Not applied, the interface rejected another operation in this batch"
+            for peer, settings, result in failed:
+                result['message'] = "Internal server error"
+            return False, results
+        for peer, settings, result in failed:
+            result['message'] = "Internal server error"
+        pending = [p for p in pending if p[2]['message'] is None]
+
+        if len(pending) > 0:
+            columns = [f for f in pending[0][0].SettingsFields if f != 'allowed_ip']
+            with UnitOfWork.Begin(self.engine) as conn:
+                conn.execute(
+                    self.peersTable.update().where(self.peersTable.c.id == sqlalchemy.bindparam('peer_id')),
+                    [{"peer_id": peer.id, **{c: settings[c] for c in columns}} for peer, settings, result in pending]
+                )
+            for peer, settings, result in pending:
+                result['status'] = True
+            self.getPeers()
+            self.DashboardWebHooks.RunWebHook("peer_updated", {
+                "configuration": self.Name,
+                "peers": [p[0].id for p in pending]
+            })
+        return len(pending) == len(results), results
+
+    def __setInterfacePeers(self, peers: list[tuple[Peer, str, str]]) -> bool:
+        """
+        Set allowed IPs and preshared keys of several peers with one wg set
+        @param peers: List of (peer, allowed IPs, preshared key), an empty preshared key removes it
+        @return: Whether wg accepted the change
+        """
+        command = [self.Protocol, "set", self.Name]
+        presharedKeyFiles = []
+        try:
+            for peer, allowedIp, presharedKey in peers:
+                presharedKeyFile = "/dev/null"
+                if len(presharedKey) > 0:
+                    rd = random.Random()
+                    presharedKeyFile = str(uuid.UUID(int=rd.getrandbits(128), version=4))
+                    with open(presharedKeyFile, "w+") as f:
+                        f.write(presharedKey)
+                    presharedKeyFiles.append(presharedKeyFile)
+                command += ["peer", peer.id, "allowed-ips", allowedIp, "preshared-key", presharedKeyFile]
+            output = subprocess.check_output(command, stderr=subprocess.STDOUT)
+            if len(output.decode().strip("\n")) != 0:
+                raise subprocess.CalledProcessError(0, command, output)
+            return True
+        except subprocess.CalledProcessError as exc:
+            current_app.logger.error(f"Update peers failed when updating Allowed IPs:\n{exc.output.decode('UTF-8')}")
+            return False
+        finally:
+            for presharedKeyFile in presharedKeyFiles:
+                os.remove(presharedKeyFile)
+
     def searchPeer(self, publicKey):
-        for i in self.Peers:
-            if i.id == publicKey:
-                return True, i
-        return False, None
+        peer = self.PeersIndex.get(publicKey)
+        if peer is None:
+            return False, None
+        return True, peer
+
+    def queryPeers(self, page: int = None, pageSize: int = 50, sort: str = "status", order: str = "asc",
+                   status: str = None, search: str = None) -> dict:
+        """
+        Filter, sort and page the peers and restricted peers together, the same way the peer list does in the UI
+        @param page: 1-based page number, None returns every matching peer
+        @param pageSize: Number of peers per page
+        @param sort: status, name, allowed_ip, restricted, id, latest_handshake or total_data
+        @param order: asc or desc
+        @param status: running, stopped or restricted, None matches all peers
+        @param search: Substring matched against name, public key and allowed IPs
+        @return: Matching peers, restricted peers and totals
+        """
+        # The caller refreshes RestrictedPeers before computing the ETag, use that list as is
+        peers = [(p, False) for p in self.Peers] + [(p, True) for p in self.RestrictedPeers]
+
+        if status == "restricted":
+            peers = [x for x in peers if x[1]]
+        elif status in ("running", "stopped"):
+            peers = [x for x in peers if not x[1] and x[0].status == status]
+
+        if search:
+            peers = [x for x in peers if search in (x[0].name or "") or search in x[0].id
+                     or search in (x[0].allowed_ip or "")]
+
+        def firstAllowedIP(allowedIP: str) -> int:
+            try:
+                return int(ipaddress.ip_network(allowedIP.replace(" ", "").split(",")[0], strict=False).network_address)
+            except (ValueError, AttributeError):
+                return 0
+
+        def handshakeSeconds(latestHandshake: str) -> int | None:
+            # Time since the handshake as written by getPeersLatestHandshake, "H:MM:SS" or "N days, H:MM:SS"
+            try:
+                days, _, clock = (latestHandshake or "").rpartition(", ")
+                hours, minutes, seconds = (int(v) for v in clock.split(":"))
+                return (int(days.split(" ")[0]) if days else 0) * 86400 + hours * 3600 + minutes * 60 + seconds
+            except ValueError:
+                return None
+
+        sortKeys = {
+            "status": lambda x: x[0].status or "",
+            "name": lambda x: x[0].name or "",
+            "allowed_ip": lambda x: firstAllowedIP(x[0].allowed_ip),
+            "restricted": lambda x: not x[1],
+            "id": lambda x: x[0].id,
+            "latest_handshake": lambda x: handshakeSeconds(x[0].latest_handshake),
+            "total_data": lambda x: (x[0].total_data or 0) + (x[0].cumu_data or 0)
+        }
+        if sort == "latest_handshake":
+            # Peers without a handshake ("N/A", "No Handshake") go last in either order
+            withHandshake = [x for x in peers if handshakeSeconds(x[0].latest_handshake) is not None]
+            withoutHandshake = [x for x in peers if handshakeSeconds(x[0].latest_handshake) is None]
+            withHandshake.sort(key=sortKeys[sort], reverse=(order == "desc"))
+            peers = withHandshake + withoutHandshake
+        else:
+            peers.sort(key=sortKeys.get(sort, sortKeys["status"]), reverse=(order == "desc"))
+
+        total = len(peers)
+        totalPages = 1
+        if page is not None:
+            totalPages = max(1, -(-total // pageSize))
+            peers = peers[(page - 1) * pageSize:page * pageSize]
+
+        return {
+            "configurationPeers": [p for p, restricted in peers if not restricted],
+            "configurationRestrictedPeers": [p for p, restricted in peers if restricted],
+            "pagination": {
+                "page": page if page is not None else 1,
+                "pageSize": pageSize if page is not None else total,
+                "totalPages": totalPages,
+                "total": total,
+                "totalPeers": len(self.Peers),
+                "totalRestrictedPeers": len(self.RestrictedPeers)
+            }
+        }
 
     def allowAccessPeers(self, listOfPublicKeys) -> tuple[bool, str]:
         if not self.getStatus():
             self.toggleConfiguration()
-        with self.engine.begin() as conn:
+        with UnitOfWork.Begin(self.engine) as conn:
+            # Check every peer before moving any of them, a rejected peer leaves the whole list restricted
+            restrictedPeers = []
+            batch = PrefixTrie()
             for i in listOfPublicKeys:
+                restrictedPeer = conn.execute(
+                    self.peersRestrictedTable.select().where(self.peersRestrictedTable.columns.id == i)
+                ).mappings().fetchone()
+                if restrictedPeer is None:
+                    return False, "Failed to allow access of peer " + i
+                if not re.match(r"^[0-9a-fA-F\.\,:/ ]+$", restrictedPeer['allowed_ip'].replace(" ", "")):
+                    return False, "Allowed IPs entry format is incorrect"
+                if not re.match(r"^[A-Za-z0-9+/]{42}[A-Ea-e0-9]=$", restrictedPeer["id"]):
+                    return False, "Peer key format is incorrect"
+                if (len(self.getAllowedIPsIndex().overlaps(restrictedPeer['allowed_ip'], restrictedPeer['id'])) > 0
+                        or len(batch.overlaps(restrictedPeer['allowed_ip'], restrictedPeer['id'])) > 0):
+                    return False, f"Allowed IPs of peer {i} overlap with another peer"
+                batch.assign(restrictedPeer['id'], restrictedPeer['allowed_ip'])
+                restrictedPeers.append(restrictedPeer)
+
+            for restrictedPeer in restrictedPeers:
                 stmt = self.peersRestrictedTable.select().where(
-                    self.peersRestrictedTable.columns.id == i
+                    self.peersRestrictedTable.columns.id == restrictedPeer['id']
                 )
-                restrictedPeer = conn.execute(stmt).mappings().fetchone()
-                if restrictedPeer is not None:
-                    conn.execute(
-                        self.peersTable.insert().from_select(
-                            [c.name for c in self.peersTable.columns],
-                            stmt
-                        )
+                conn.execute(
+                    self.peersTable.insert().from_select(
+                        [c.name for c in self.peersTable.columns],
+                        stmt
                     )
-                    conn.execute(
-                        self.peersRestrictedTable.delete().where(
-                            self.peersRestrictedTable.columns.id == i
-                        )
+                )
+                conn.execute(
+                    self.peersRestrictedTable.delete().where(
+                        self.peersRestrictedTable.columns.id == restrictedPeer['id']
                     )
+                )
 
-                    presharedKeyExist = len(restrictedPeer['preshared_key']) > 0
-                    rd = random.Random()
-                    uid = str(uuid.UUID(int=rd.getrandbits(128), version=4))
-                    if presharedKeyExist:
-                        with open(uid, "w+") as f:
-                            f.write(restrictedPeer['preshared_key'])
-
-                    newAllowedIPs = restrictedPeer['allowed_ip'].replace(" ", "")
-                    if not re.match(r"^[0-9a-fA-F\.\,:/ ]+$", newAllowedIPs):
-                        return False, "Allowed IPs entry format is incorrect"
-
-                    if not re.match(r"^[A-Za-z0-9+/]{42}[A-Ea-e0-9]=$", restrictedPeer["id"]):
-                        return False, "Peer key format is incorrect"
+                presharedKeyExist = len(restrictedPeer['preshared_key']) > 0
+                rd = random.Random()
+                uid = str(uuid.UUID(int=rd.getrandbits(128), version=4))
+                if presharedKeyExist:
+                    with open(uid, "w+") as f:
+                        f.write(restrictedPeer['preshared_key'])
 
-                    command = [self.Protocol, "set", self.Name, "peer", restrictedPeer["id"], "allowed-ips", newAllowedIPs, "preshared-key", uid if presharedKeyExist else ""]
+                newAllowedIPs = restrictedPeer['allowed_ip'].replace(" ", "")
+                command = [self.Protocol, "set", self.Name, "peer", restrictedPeer["id"], "allowed-ips", newAllowedIPs, "preshared-key", uid if presharedKeyExist else ""]
+                try:
                     subprocess.check_output(command, stderr=subprocess.STDOUT)
-
+                finally:
                     if presharedKeyExist: os.remove(uid)
-                else:
-                    return False, "Failed to allow access of peer " + i
         if not self.__wgSave():
             return False, "Failed to save configuration through WireGuard"
         self.getPeers()
@@ -647,7 +1099,7 @@ class WireguardConfiguration:
         if not self.getStatus():
             self.toggleConfiguration()
 
-        with self.engine.begin() as conn:
+        with UnitOfWork.Begin(self.engine) as conn:
             for p in listOfPublicKeys:
                 found, pf = self.searchPeer(p)
                 if found:
@@ -695,7 +1147,7 @@ class WireguardConfiguration:
         deleted = []
         if not self.getStatus():
             self.toggleConfiguration()
-        with self.engine.begin() as conn:
+        with UnitOfWork.Begin(self.engine) as conn:
             for p in listOfPublicKeys:
                 found, pf = self.searchPeer(p)
                 for job in pf.jobs:
@@ -713,6 +1165,10 @@ class WireguardConfiguration:
                         )
                         deleted.append(pf.id)
                         numOfDeletedPeers += 1
+                        if self.__addressAllocator is not None:
+                            self.__addressAllocator.release(pf.id)
+                        if self.__allowedIPsIndex is not None:
+                            self.__allowedIPsIndex.release(pf.id)
                     except Exception as e:
                         numOfFailedToDeletePeers += 1
 
@@ -755,7 +1211,7 @@ class WireguardConfiguration:
         now = datetime.now()
         time_delta = timedelta(minutes=3)
 
-        with self.engine.begin() as conn:
+        with UnitOfWork.Begin(self.engine) as conn:
             for _ in range(int(len(latestHandshake) / 2)):
                 minus = now - datetime.fromtimestamp(int(latestHandshake[count + 1]))
                 if minus < time_delta:
@@ -792,7 +1248,7 @@ class WireguardConfiguration:
         
         data_usage = [p.split("\t") for p in data_usage]
         cur_i = None
-        with self.engine.begin() as conn:
+        with UnitOfWork.Begin(self.engine) as conn:
             for i in range(len(data_usage)):
                 if len(data_usage[i]) == 3:
                     cur_i = conn.execute(
@@ -805,8 +1261,8 @@ class WireguardConfiguration:
                         total_sent = cur_i['total_sent']
                         # print(cur_i is None)
                         total_receive = cur_i['total_receive']
-                        cur_total_sent = float(data_usage[i][2]) / (1024 ** 3)
-                        cur_total_receive = float(data_usage[i][1]) / (1024 ** 3)
+                        cur_total_sent = int(data_usage[i][2])
+                        cur_total_receive = int(data_usage[i][1])
                         cumulative_receive = cur_i['cumu_receive'] + total_receive
                         cumulative_sent = cur_i['cumu_sent'] + total_sent
                         if total_sent <= cur_total_sent and total_receive <= cur_total_receive:
@@ -850,7 +1306,7 @@ class WireguardConfiguration:
             return "stopped"
         data_usage = data_usage.decode("UTF-8").split()
         count = 0
-        with self.engine.begin() as conn:
+        with UnitOfWork.Begin(self.engine) as conn:
             for _ in range(int(len(data_usage) / 2)):
                 conn.execute(
                     self.peersTable.update().values({
@@ -888,6 +1344,17 @@ class WireguardConfiguration:
         self.getRestrictedPeers()
         return self.RestrictedPeers
 
+    def refresh(self):
+        """
+        Reload the configuration file, peers and configuration info after another worker changed them
+        """
+        self.__parseConfigurationFile()
+        self.getPeers()
+        self.getRestrictedPeers()
+        configurationInfoJson = self.readConfigurationInfo()
+        if configurationInfoJson:
+            self.configurationInfo = WireguardConfigurationInfo.model_validate_json(configurationInfoJson.get("Info"))
+
     def toJson(self):
         self.Status = self.getStatus()
         return {
@@ -903,9 +1370,9 @@ class WireguardConfiguration:
             "PostDown": self.PostDown,
             "SaveConfig": self.SaveConfig,
             "DataUsage": {
-                "Total": sum(list(map(lambda x: x.cumu_data + x.total_data, self.Peers))),
-                "Sent": sum(list(map(lambda x: x.cumu_sent + x.total_sent, self.Peers))),
-                "Receive": sum(list(map(lambda x: x.cumu_receive + x.total_receive, self.Peers)))
+                "Total": BytesToGigabytes(sum(list(map(lambda x: x.cumu_data + x.total_data, self.Peers)))),
+                "Sent": BytesToGigabytes(sum(list(map(lambda x: x.cumu_sent + x.total_sent, self.Peers)))),
+                "Receive": BytesToGigabytes(sum(list(map(lambda x: x.cumu_receive + x.total_receive, self.Peers))))
             },
             "ConnectedPeers": len(list(filter(lambda x: x.status == "running", self.Peers))),
             "TotalPeers": len(self.Peers),
@@ -931,33 +1398,29 @@ class WireguardConfiguration:
             "backupDate": datetime.now().strftime("%Y%m%d%H%M%S")
         }
 
-    def getBackups(self, databaseContent: bool = False) -> list[dict[str, str]]:
+    def getBackups(self, databaseContent: bool = False, content: bool = True) -> list[dict[str, str]]:
+        """
+        List the backups of this configuration
+        @param databaseContent: Include the content of the database backups
+        @param content: Include the content of the configuration backups, only metadata is returned when false
+        """
         backups = []
-
         directory = os.path.join(self.__getProtocolPath(), 'WGDashboard_Backup')
-        files = [(file, os.path.getctime(os.path.join(directory, file)))
-                 for file in os.listdir(directory) if os.path.isfile(os.path.join(directory, file))]
-        files.sort(key=lambda x: x[1], reverse=True)
-
-        for f, ct in files:
-            if RegexMatch(f"^({self.Name})_(.*)\\.(conf)$", f):
-                s = re.search(f"^({self.Name})_(.*)\\.(conf)$", f)
-                date = s.group(2)
-                d = {
-                    "filename": f,
-                    "backupDate": date,
-                    "content": open(os.path.join(self.__getProtocolPath(), 'WGDashboard_Backup', f), 'r').read()
-                }
-                if f.replace(".conf", ".sql") in list(os.listdir(directory)):
-                    d['database'] = True
-                    if databaseContent:
-                        d['databaseContent'] = open(os.path.join(self.__getProtocolPath(), 'WGDashboard_Backup', f.replace(".conf", ".sql")), 'r').read()
-                backups.append(d)
-
+        for backup in BackupIndex.List(directory):
+            if backup['configuration'] != self.Name:
+                continue
+            d = {k: v for k, v in backup.items() if k != 'configuration'}
+            if content:
+                with open(os.path.join(directory, backup['filename']), 'r') as f:
+                    d['content'] = f.read()
+            if databaseContent and backup['database']:
+                with open(os.path.join(directory, backup['filename'].replace(".conf", ".sql")), 'r') as f:
+                    d['databaseContent'] = f.read()
+            backups.append(d)
         return backups
 
     def restoreBackup(self, backupFileName: str) -> bool:
-        backups = list(map(lambda x : x['filename'], self.getBackups()))
+        backups = list(map(lambda x : x['filename'], self.getBackups(content=False)))
         if backupFileName not in backups:
             return False
         if self.Status:
@@ -978,7 +1441,7 @@ class WireguardConfiguration:
         return True
 
     def deleteBackup(self, backupFileName: str) -> bool:
-        backups = list(map(lambda x : x['filename'], self.getBackups()))
+        backups = list(map(lambda x : x['filename'], self.getBackups(content=False)))
         if backupFileName not in backups:
             return False
         try:
@@ -988,7 +1451,7 @@ class WireguardConfiguration:
         return True
 
     def downloadBackup(self, backupFileName: str) -> tuple[bool, str] | tuple[bool, None]:
-        backup = list(filter(lambda x : x['filename'] == backupFileName, self.getBackups()))
+        backup = list(filter(lambda x : x['filename'] == backupFileName, self.getBackups(content=False)))
         if len(backup) == 0:
             return False, None
         zip = f'{str(uuid.UUID(int=random.Random().getrandbits(128), version=4))}.zip'
@@ -1063,7 +1526,7 @@ class WireguardConfiguration:
             if self.getStatus():
                 self.toggleConfiguration()
             self.createDatabase(newConfigurationName)
-            with self.engine.begin() as conn:
+            with UnitOfWork.Begin(self.engine) as conn:
                 def doRenameStatement(suffix):
                     newConfig = f"{newConfigurationName}{suffix}"
                     oldConfig = f"{self.Name}{suffix}"
@@ -1090,99 +1553,72 @@ class WireguardConfiguration:
             return False, "Internal server error"
         return True, None
 
+    def getAddressAllocator(self) -> AddressAllocator:
+        """
+        Allocator of this configuration's addresses, rebuilt when Address or the IPv6 allocation mode changes and
+        synced with the peers only when they changed since the last call
+        """
+        ipv6Mode = self.configurationInfo.IPv6AllocationMode
+        with self.__peerIndexesLock:
+            if (self.__addressAllocator is None or self.__addressAllocator.Address != self.Address
+                    or self.__addressAllocator.IPv6Mode != ipv6Mode):
+                self.__addressAllocator = AddressAllocator(self.Address, ipv6Mode)
+            if self.__addressAllocator.Version != self.StateVersion:
+                peers = self.Peers + self.getRestrictedPeersList()
+                self.__addressAllocator.sync(peers)
+                self.__addressAllocator.Version = self.StateVersion
+            return self.__addressAllocator
+
+    def assignPeerAddresses(self, peers: list[dict]):
+        """
+        Mark the addresses of newly added peers as used right away, without waiting for the next sync
+        @param peers: Peers with id and allowed_ip
+        """
+        for index in (self.__addressAllocator, self.__allowedIPsIndex):
+            if index is not None:
+                for p in peers:
+                    index.assign(p['id'], p['allowed_ip'])
+
+    def getAllowedIPsIndex(self) -> PrefixTrie:
+        """
+        Prefix trie of the allowed IPs of every peer, restricted ones included, synced with the peers only when they
+        changed since the last call
+        """
+        with self.__peerIndexesLock:
+            if self.__allowedIPsIndex is None:
+                self.__allowedIPsIndex = PrefixTrie()
+            if self.__allowedIPsIndex.Version != self.StateVersion:
+                self.__allowedIPsIndex.sync(self.Peers + self.getRestrictedPeersList())
+                self.__allowedIPsIndex.Version = self.StateVersion
+            return self.__allowedIPsIndex
+
     def getNumberOfAvailableIP(self):
         if len(self.Address) < 0:
             return False, None
-        existedAddress = set()
-        availableAddress = {}
-        for p in self.Peers + self.getRestrictedPeersList():
-            peerAllowedIP = p.allowed_ip.split(',')
-            for pip in peerAllowedIP:
-                ppip = pip.strip().split('/')
-                if len(ppip) == 2:
-                    try:
-                        check = ipaddress.ip_network(ppip[0])
-                        existedAddress.add(check)
-                    except Exception as e:
-                        current_app.logger.error(f"{self.Name} peer {p.id} have invalid ip", e)
-        configurationAddresses = self.Address.split(',')
-        for ca in configurationAddresses:
-            ca = ca.strip()
-            caSplit = ca.split('/')
-            try:
-                if len(caSplit) == 2:
-                    network = ipaddress.ip_network(ca, False)
-                    existedAddress.add(ipaddress.ip_network(caSplit[0]))
-                    availableAddress[ca] = network.num_addresses
-                    for p in existedAddress:
-                        if p.version == network.version and p.subnet_of(network):
-                            availableAddress[ca] -= 1
-            except Exception as e:
-                current_app.logger.error(f"Error: Failed to parse IP address {ca} from {self.Name}", e)
-        return True, availableAddress
+        return True, self.getAddressAllocator().getNumberOfAvailable()
 
     def getAvailableIP(self, threshold = 255):
         if len(self.Address) < 0:
             return False, None
-        existedAddress = set()
-        availableAddress = {}
-        for p in self.Peers + self.getRestrictedPeersList():
-            peerAllowedIP = p.allowed_ip.split(',')
-            for pip in peerAllowedIP:
-                ppip = pip.strip().split('/')
-                if len(ppip) == 2:
-                    try:
-                        check = ipaddress.ip_network(ppip[0])
-                        existedAddress.add(check.compressed)
-                    except Exception as e:
-                        current_app.logger.error(f"{self.Name} peer {p.id} have invalid ip", e)
-        configurationAddresses = self.Address.split(',')
-        for ca in configurationAddresses:
-            ca = ca.strip()
-            caSplit = ca.split('/')
-            try:
-                if len(caSplit) == 2:
-                    network = ipaddress.ip_network(ca, False)
-                    existedAddress.add(ipaddress.ip_network(caSplit[0]).compressed)
-                    if threshold == -1:
-                        availableAddress[ca] = filter(lambda ip : ip not in existedAddress,
-                                                      map(lambda iph : ipaddress.ip_network(iph).compressed, network.hosts()))
-                    else:
-                        availableAddress[ca] = list(islice(filter(lambda ip : ip not in existedAddress,
-                                                                  map(lambda iph : ipaddress.ip_network(iph).compressed, network.hosts())), threshold))
-            except Exception as e:
-                current_app.logger.error(f"Failed to parse IP address {ca} from {self.Name}", e)
-        return True, availableAddress
-
-    def getRealtimeTrafficUsage(self):
-        stats = psutil.net_io_counters(pernic=True, nowrap=True)
-        if self.Name in stats.keys():
-            stat = stats[self.Name]
-            recv1 = stat.bytes_recv
-            sent1 = stat.bytes_sent
-            time.sleep(1)
-            stats = psutil.net_io_counters(pernic=True, nowrap=True)
-            if self.Name in stats.keys():
-                stat = stats[self.Name]
-                recv2 = stat.bytes_recv
-                sent2 = stat.bytes_sent
-                net_in = round((recv2 - recv1) / 1024 / 1024, 3)
-                net_out = round((sent2 - sent1) / 1024 / 1024, 3)
-                return {
-                    "sent": net_out,
-                    "recv": net_in
-                }
-            else:
-                return { "sent": 0, "recv": 0 }
-        else:
-            return { "sent": 0, "recv": 0 }
+        return True, self.getAddressAllocator().getAvailable(threshold)
+
+    def getRealtimeTrafficUsage(self, interfaceTraffic: InterfaceTrafficSampler, history: int = 0):
+        """
+        Current throughput of the interface in MB/s, read from the background sampler
+        @param interfaceTraffic: Sampler shared by the dashboard
+        @param history: Also return the throughput of the last history seconds
+        """
+        usage = interfaceTraffic.getRate(self.Name)
+        if history > 0:
+            usage["history"] = interfaceTraffic.getHistory(self.Name, history)
+        return usage
     
     '''
     Manager WireGuard Configuration Information
     '''
     
     def readConfigurationInfo(self):
-        with self.engine.connect() as conn:
+        with UnitOfWork.Connect(self.engine) as conn:
             result = conn.execute(
                 self.infoTable.select().where(
                     self.infoTable.c.ID == self.Name
@@ -1191,7 +1627,7 @@ class WireguardConfiguration:
         return result
     
     def initConfigurationInfo(self):
-        with self.engine.begin() as conn:
+        with UnitOfWork.Begin(self.engine) as conn:
             conn.execute(
                 self.infoTable.insert().values(
                     {
@@ -1203,7 +1639,7 @@ class WireguardConfiguration:
     
     def storeConfigurationInfo(self):
         try:
-            with self.engine.begin() as conn:
+            with UnitOfWork.Begin(self.engine) as conn:
                 conn.execute(
                     self.infoTable.update().values(
                         {
@@ -1213,6 +1649,7 @@ class WireguardConfiguration:
                         self.infoTable.c.ID == self.Name
                     )
                 )
+            self.bumpStateVersion()
         except Exception as e:
             return False
         
@@ -1239,6 +1676,10 @@ class WireguardConfiguration:
             self.configurationInfo.PeerTrafficTracking = value
         elif key == "PeerHistoricalEndpointTracking":
             self.configurationInfo.PeerHistoricalEndpointTracking = value
+        elif key == "IPv6AllocationMode":
+            if value not in ["sequential", "hashed"]:
+                return False, "IPv6 allocation mode can only be sequential or hashed", key
+            self.configurationInfo.IPv6AllocationMode = value
         else: 
             return False, "Key does not exist", None
         self.storeConfigurationInfo()
@@ -1259,39 +1700,65 @@ class WireguardConfiguration:
         return status, msg
         
     def getTransferTableSize(self):
-        with self.engine.connect() as db:
+        with UnitOfWork.Connect(self.engine) as db:
             row_count = db.execute(
                 sqlalchemy.select(sqlalchemy.func.count()).select_from(self.peersTransferTable)
             ).scalar()
             return int(row_count)
 
     def getHistoricalEndpointTableSize(self):
-        with self.engine.connect() as db:
+        with UnitOfWork.Connect(self.engine) as db:
             row_count = db.execute(
                 sqlalchemy.select(sqlalchemy.func.count()).select_from(self.peersHistoryEndpointTable)
             ).scalar()
             return int(row_count)
         
-    def downloadTransferTable(self):
-        with self.engine.connect() as db:
-            data = db.execute(
-                self.peersTransferTable.select()
-            ).mappings().fetchall()
-            return data
-
-    def downloadHistoricalEndpointTable(self):
-        with self.engine.connect() as db:
-            data = db.execute(
-                self.peersHistoryEndpointTable.select()
-            ).mappings().fetchall()
-            return data
-    
+    def __trackingTable(self, table: str) -> sqlalchemy.Table:
+        return self.peersTransferTable if table == 'TrafficTrackingTable' else self.peersHistoryEndpointTable
+
+    def trackingTableColumns(self, table: str) -> list[str]:
+        """
+        Column names of a tracking table, in the order downloadTrackingTable yields them
+        @param table: TrafficTrackingTable or HistoricalTrackingTable
+        @return: Column names
+        """
+        return list(self.__trackingTable(table).columns.keys())
+
+    def downloadTrackingTable(self, table: str, since: datetime = None, until: datetime = None, peerId: str = None,
+                              batchSize: int = 1000) -> Iterator[dict]:
+        """
+        Stream the rows of a tracking table through a server side cursor, so memory use does not grow with the table
+        @param table: TrafficTrackingTable or HistoricalTrackingTable
+        @param since: Only rows recorded at or after this time
+        @param until: Only rows recorded before this time
+        @param peerId: Only rows of this peer
+        @param batchSize: Rows fetched from the database at a time
+        @return: Rows, traffic counters are in GB
+        """
+        trackingTable = self.__trackingTable(table)
+        query = trackingTable.select()
+        if since is not None:
+            query = query.where(trackingTable.c.time >= since)
+        if until is not None:
+            query = query.where(trackingTable.c.time < until)
+        if peerId is not None:
+            query = query.where(trackingTable.c.id == peerId)
+        # The response is streamed after the request's unit of work finished, so use a connection of our own
+        with self.engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=batchSize).execute(query)
+            for row in result.mappings():
+                if trackingTable is self.peersTransferTable:
+                    yield {**row, **{field: BytesToGigabytes(row[field]) for field in DataUsageFields}}
+                else:
+                    yield dict(row)
+
     def deleteTransferTable(self):
         try:
-            with self.engine.begin() as db:
+            with UnitOfWork.Begin(self.engine) as db:
                 db.execute(
                     self.peersTransferTable.delete()
             )
+            UnitOfWork.Flush(self.engine)
             with self.engine.connect() as conn:
                 if conn.dialect.name == 'sqlite':
                     print("[WGDashboard] SQLite Vacuuming Database")
@@ -1302,10 +1769,11 @@ class WireguardConfiguration:
 
     def deleteHistoryEndpointTable(self):
         try:
-            with self.engine.begin() as db:
+            with UnitOfWork.Begin(self.engine) as db:
                 db.execute(
                     self.peersHistoryEndpointTable.delete()
                 )
+            UnitOfWork.Flush(self.engine)
             with self.engine.connect() as conn:
                 if conn.dialect.name == 'sqlite':
                     print("[WGDashboard] SQLite Vacuuming Database")
@@ -1313,3 +1781,6 @@ class WireguardConfiguration:
         except Exception as e:
             return False
         return True
+
+
+os.register_at_fork(after_in_child=WireguardConfiguration.ResetStateVersionToken)
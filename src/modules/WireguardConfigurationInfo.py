@@ -20,4 +20,5 @@ class WireguardConfigurationInfo(BaseModel):
     OverridePeerSettings: OverridePeerSettingsClass = OverridePeerSettingsClass(**{})
     PeerGroups: dict[str, PeerGroupsClass] = {}
     PeerTrafficTracking: bool = True
-    PeerHistoricalEndpointTracking: bool = True
\ No newline at end of file
+    PeerHistoricalEndpointTracking: bool = True
+    IPv6AllocationMode: str = 'sequential'
@@ -0,0 +1,175 @@
+"""
+Worker Coordinator
+"""
+import fcntl
+import os
+import threading
+from sqlalchemy import event, exc
+from sqlalchemy.pool import Pool
+
+
+def RegisterForkSafePool():
+    """
+    Discard pooled connections that were opened by another process, e.g. by the gunicorn master before it forked
+    the workers. Must run before any engine connects.
+    """
+    @event.listens_for(Pool, "connect")
+    def connect(dbapi_connection, connection_record):
+        connection_record.info["pid"] = os.getpid()
+
+    @event.listens_for(Pool, "checkout")
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        if connection_record.info.get("pid") != os.getpid():
+            connection_record.dbapi_connection = connection_proxy.dbapi_connection = None
+            raise exc.DisconnectionError(
+                f"Connection record belongs to pid {connection_record.info.get('pid')}, "
+                f"attempting to check out in pid {os.getpid()}"
+            )
+
+
+# Changes kept in the generation file, a worker that fell further behind reloads everything
+GenerationLogSize = 256
+
+
+class WorkerCoordinator:
+    """
+    Coordinates gunicorn workers sharing one dashboard. A file lock elects the leader that runs the background
+    threads, and a generation counter file tells the other workers what to reload after a mutation: the counter
+    on the first line, then one line per change with its generation and the name of what changed.
+    The peer tables the leader's collector writes to are the snapshot followers serve reads from, a second counter
+    file tells them when the leader finished writing a new one.
+    """
+    def __init__(self, path: str, workers: int = 1):
+        self.Workers = workers
+        self.IsLeader = False
+        self.__lockPath = os.path.join(path, "wgdashboard_leader.lock")
+        self.__generationPath = os.path.join(path, "wgdashboard_generation")
+        self.__snapshotPath = os.path.join(path, "wgdashboard_snapshot")
+        self.__lockFile = None
+        self.__seenGeneration = self.__readCounter(self.__generationPath)
+        self.__seenSnapshot = self.__readCounter(self.__snapshotPath)
+        self.__lock = threading.Lock()
+
+    def tryAcquireLeadership(self) -> bool:
+        """
+        Take the leader lock if no other worker holds it. The lock is released by the OS when the worker exits.
+        @return: Whether this worker is the leader
+        """
+        if self.IsLeader:
+            return True
+        f = open(self.__lockPath, "a+")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        f.seek(0)
+        f.truncate()
+        f.write(str(os.getpid()))
+        f.flush()
+        self.__lockFile = f
+        self.IsLeader = True
+        return True
+
+    @staticmethod
+    def __readLines(path: str) -> list[str]:
+        try:
+            with open(path, "r") as f:
+                return f.read().splitlines()
+        except FileNotFoundError:
+            return []
+
+    @staticmethod
+    def __readCounter(path: str) -> int:
+        lines = WorkerCoordinator.__readLines(path)
+        try:
+            return int(lines[0].strip() or 0) if len(lines) > 0 else 0
+        except ValueError:
+            return 0
+
+    @staticmethod
+    def __incrementCounter(path: str, changes: list[str] = None) -> int:
+        with open(path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                lines = f.read().splitlines()
+                try:
+                    value = int(lines[0].strip() or 0) + 1 if len(lines) > 0 else 1
+                except ValueError:
+                    value = 1
+                # A name that would span lines cannot be logged, it stands for everything instead
+                log = lines[1:] + [f"{value} {change if len(change.splitlines()) == 1 else '*'}"
+                                   for change in (changes or [])]
+                f.seek(0)
+                f.truncate()
+                f.write("\n".join([str(value)] + log[-GenerationLogSize:]) + "\n")
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return value
+
+    def bumpGeneration(self, changes: list[str]):
+        """
+        Tell the other workers that shared state changed
+        @param changes: Names of what changed, see changedState
+        """
+        if self.Workers <= 1:
+            return
+        value = self.__incrementCounter(self.__generationPath, changes)
+        with self.__lock:
+            # Only skip our own bump, a bump from another worker in between still needs a reload
+            if self.__seenGeneration == value - 1:
+                self.__seenGeneration = value
+
+    def changedState(self) -> set[str]:
+        """
+        What other workers changed since the last call. Reading the counter file is the only cost when nothing did.
+        @return: Names passed to bumpGeneration, {"*"} if the changes are no longer in the log, empty if none
+        """
+        if self.Workers <= 1:
+            return set()
+        lines = self.__readLines(self.__generationPath)
+        try:
+            value = int(lines[0].strip() or 0) if len(lines) > 0 else 0
+        except ValueError:
+            value = 0
+        with self.__lock:
+            seen = self.__seenGeneration
+            if value == seen:
+                return set()
+            self.__seenGeneration = value
+        changes = set()
+        covered = value
+        for line in lines[1:]:
+            generation, _, change = line.partition(" ")
+            if not generation.isdigit():
+                continue
+            covered = min(covered, int(generation))
+            if int(generation) > seen:
+                changes.add(change)
+        # Generations between seen and the oldest entry left in the log were dropped, or the counter was reset
+        if value < seen or covered > seen + 1 or len(changes) == 0:
+            return {"*"}
+        return changes
+
+    def publishSnapshot(self):
+        """
+        Tell the followers that the leader finished writing peer data to the database
+        """
+        if self.Workers <= 1 or not self.IsLeader:
+            return
+        self.__seenSnapshot = self.__incrementCounter(self.__snapshotPath)
+
+    def snapshotChanged(self) -> bool:
+        """
+        Check whether the leader published a new snapshot since the last call
+        """
+        if self.Workers <= 1:
+            return False
+        value = self.__readCounter(self.__snapshotPath)
+        with self.__lock:
+            if value == self.__seenSnapshot:
+                return False
+            self.__seenSnapshot = value
+        return True
@@ -0,0 +1,44 @@
+"""
+Zip Stream
+"""
+import io
+import zipfile
+from typing import Iterable, Iterator
+
+
+class ZipStream(io.RawIOBase):
+    """
+    Write-only, unseekable file that hands out whatever zipfile wrote to it so far, so an archive can be sent while
+    it is being built. zipfile falls back to data descriptors when it cannot seek back to patch entry headers.
+    """
+    def __init__(self):
+        super().__init__()
+        self.__chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self.__chunks.append(bytes(b))
+        return len(b)
+
+    def pop(self) -> bytes:
+        data = b"".join(self.__chunks)
+        self.__chunks.clear()
+        return data
+
+    @staticmethod
+    def Stream(files: Iterable[tuple[str, str | bytes]]) -> Iterator[bytes]:
+        """
+        Build a ZIP archive entry by entry
+        @param files: (file name, content) pairs, consumed lazily
+        @return: Archive bytes, one chunk per entry plus the central directory
+        """
+        buffer = ZipStream()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            for name, content in files:
+                archive.writestr(name, content)
+                data = buffer.pop()
+                if len(data) > 0:
+                    yield data
+        yield buffer.pop()
@@ -0,0 +1,77 @@
+"""
+Benchmark of CustomJsonEncoder on a peer list, with orjson and with the stdlib json fallback
+Run from src: python3 -m tests.benchmark_Serialization [--peers 10000] [--rounds 5]
+"""
+import argparse
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from unittest import mock
+
+from flask import Flask
+
+from modules import CustomJsonEncoder as CustomJsonEncoderModule
+from modules.CustomJsonEncoder import CustomJsonEncoder
+from modules.Peer import Peer
+
+
+def PeerListPayload(count: int) -> dict:
+    """
+    Response data of getWireguardConfigurationInfo for a configuration with count peers
+    """
+    configuration = SimpleNamespace(Name="wg0", Protocol="wg", ListenPort="51820")
+    peers = []
+    with mock.patch.object(Peer, "getJobs"), mock.patch.object(Peer, "getShareLink"):
+        for i in range(count):
+            peers.append(Peer({
+                "id": f"{i:043d}=",
+                "private_key": f"{count - i:043d}=",
+                "DNS": "1.1.1.1",
+                "endpoint_allowed_ip": "0.0.0.0/0, ::/0",
+                "name": f"Peer ✓ {i}",
+                "total_receive": i * 1024 ** 2,
+                "total_sent": i * 3 * 1024 ** 2,
+                "total_data": i * 4 * 1024 ** 2,
+                "endpoint": f"203.0.113.{i % 256}:{1024 + i % 60000}",
+                "status": "running" if i % 3 else "stopped",
+                "latest_handshake": f"0:{i % 60:02d}:{i % 60:02d}" if i % 3 else "No Handshake",
+                "allowed_ip": f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}/32",
+                "cumu_receive": i * 7,
+                "cumu_sent": i * 11,
+                "cumu_data": i * 18,
+                "mtu": 1420,
+                "keepalive": 21 if i % 2 else None,
+                "remote_endpoint": "vpn.example.com",
+                "preshared_key": "" if i % 2 else f"{i:043d}="
+            }, configuration))
+    return {
+        "status": True,
+        "message": None,
+        "data": {
+            "configurationInfo": {"Name": "wg0", "Status": True, "Updated": datetime(2026, 1, 2, 3, 4, 5)},
+            "configurationPeers": peers,
+            "configurationRestrictedPeers": []
+        }
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--peers', type=int, default=10000)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+    payload = PeerListPayload(args.peers)
+    encoders = [("stdlib json", None)]
+    if CustomJsonEncoderModule.orjson is not None:
+        encoders.insert(0, (f"orjson {CustomJsonEncoderModule.orjson.__version__}", CustomJsonEncoderModule.orjson))
+    for name, encoder in encoders:
+        provider = CustomJsonEncoder(Flask(__name__))
+        with mock.patch.object(CustomJsonEncoderModule, "orjson", encoder):
+            timings = []
+            for _ in range(args.rounds):
+                start = time.perf_counter()
+                size = len(provider.dumps(payload))
+                timings.append(time.perf_counter() - start)
+        timings.sort()
+        print(f"{name:<16}{args.peers:>8} peers  {size / 1024 ** 2:6.1f} MiB  "
+              f"best {timings[0] * 1000:8.1f} ms  median {timings[len(timings) // 2] * 1000:8.1f} ms")
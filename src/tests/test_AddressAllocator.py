@@ -0,0 +1,201 @@
+"""
+AddressAllocator hands out the host addresses of a configuration's subnets that no peer uses
+Run from src: python3 -m unittest discover -s tests -t .
+"""
+import unittest
+from ipaddress import ip_address, ip_network
+from types import SimpleNamespace
+
+from modules.AddressAllocator import AddressAllocator, BitmapAddressPool, SparseAddressPool, HostRange
+
+
+def Peer(peerId: str, allowedIp: str) -> SimpleNamespace:
+    return SimpleNamespace(id=peerId, allowed_ip=allowedIp)
+
+
+class HostRangeTest(unittest.TestCase):
+    def test_ipv4_excludes_network_and_broadcast(self):
+        first, last = HostRange(ip_network("10.0.0.0/29"))
+        self.assertEqual((ip_address(first), ip_address(last)), (ip_address("10.0.0.1"), ip_address("10.0.0.6")))
+
+    def test_ipv4_point_to_point(self):
+        self.assertEqual([ip_address(a) for a in HostRange(ip_network("10.0.0.0/31"))],
+                         [ip_address("10.0.0.0"), ip_address("10.0.0.1")])
+        self.assertEqual([ip_address(a) for a in HostRange(ip_network("10.0.0.5/32"))],
+                         [ip_address("10.0.0.5"), ip_address("10.0.0.5")])
+
+    def test_ipv6_only_excludes_the_subnet_router_anycast_address(self):
+        first, last = HostRange(ip_network("fd00::/126"))
+        self.assertEqual((ip_address(first), ip_address(last)), (ip_address("fd00::1"), ip_address("fd00::3")))
+
+
+class BitmapAllocatorTest(unittest.TestCase):
+    def available(self, allocator: AddressAllocator, threshold: int = 255) -> list[str]:
+        return next(iter(allocator.getAvailable(threshold).values()))
+
+    def test_pool_types(self):
+        allocator = AddressAllocator("10.0.0.1/24, 10.0.0.1/7, fd00::1/64")
+        self.assertIsInstance(allocator.Pools["10.0.0.1/24"], BitmapAddressPool)
+        self.assertIsInstance(allocator.Pools["10.0.0.1/7"], SparseAddressPool)
+        self.assertIsInstance(allocator.Pools["fd00::1/64"], SparseAddressPool)
+
+    def test_network_broadcast_and_interface_are_never_handed_out(self):
+        allocator = AddressAllocator("10.0.0.1/29")
+        self.assertEqual(self.available(allocator), ["10.0.0.2/32", "10.0.0.3/32", "10.0.0.4/32", "10.0.0.5/32",
+                                                     "10.0.0.6/32"])
+        self.assertEqual(allocator.getNumberOfAvailable(), {"10.0.0.1/29": 5})
+
+    def test_interface_in_the_middle_of_the_subnet(self):
+        allocator = AddressAllocator("10.0.0.4/29")
+        self.assertEqual(self.available(allocator), ["10.0.0.1/32", "10.0.0.2/32", "10.0.0.3/32", "10.0.0.5/32",
+                                                     "10.0.0.6/32"])
+
+    def test_slash_31(self):
+        allocator = AddressAllocator("10.0.0.0/31")
+        self.assertEqual(self.available(allocator), ["10.0.0.1/32"])
+        allocator.assign("peer", "10.0.0.1/32")
+        self.assertEqual(self.available(allocator), [])
+
+    def test_slash_32(self):
+        allocator = AddressAllocator("10.0.0.5/32")
+        self.assertEqual(self.available(allocator), [])
+        self.assertEqual(allocator.getNumberOfAvailable(), {"10.0.0.5/32": 0})
+
+    def test_addresses_outside_the_subnets_are_ignored(self):
+        allocator = AddressAllocator("10.0.0.1/29")
+        allocator.assign("peer", "10.0.0.0/32, 10.0.0.7/32, 192.168.0.2/32, fd00::2/128, 10.0.0.2/32")
+        self.assertEqual(allocator.getNumberOfAvailable(), {"10.0.0.1/29": 4})
+        self.assertEqual(self.available(allocator, 1), ["10.0.0.3/32"])
+
+    def test_release_then_reallocate(self):
+        allocator = AddressAllocator("10.0.0.1/24")
+        for i in range(2, 12):
+            allocator.assign(f"peer{i}", f"10.0.0.{i}/32")
+        self.assertEqual(self.available(allocator, 1), ["10.0.0.12/32"])
+        allocator.release("peer3")
+        allocator.release("peer9")
+        self.assertEqual(self.available(allocator, 3), ["10.0.0.3/32", "10.0.0.9/32", "10.0.0.12/32"])
+        allocator.assign("new", "10.0.0.3/32")
+        self.assertEqual(self.available(allocator, 2), ["10.0.0.9/32", "10.0.0.12/32"])
+
+    def test_reassign_moves_the_peer(self):
+        allocator = AddressAllocator("10.0.0.1/29")
+        allocator.assign("peer", "10.0.0.2/32")
+        allocator.assign("peer", "10.0.0.3/32")
+        self.assertEqual(self.available(allocator, 2), ["10.0.0.2/32", "10.0.0.4/32"])
+
+    def test_shared_address_stays_used_until_the_last_peer_releases_it(self):
+        allocator = AddressAllocator("10.0.0.1/29")
+        allocator.assign("first", "10.0.0.2/32")
+        allocator.assign("second", "10.0.0.2/32")
+        allocator.release("first")
+        self.assertEqual(self.available(allocator, 1), ["10.0.0.3/32"])
+        allocator.release("second")
+        self.assertEqual(self.available(allocator, 1), ["10.0.0.2/32"])
+
+    def test_exhaustion(self):
+        allocator = AddressAllocator("10.0.0.1/28")
+        for i, address in enumerate(self.available(allocator)):
+            allocator.assign(f"peer{i}", address)
+        self.assertEqual(self.available(allocator), [])
+        self.assertEqual(allocator.getNumberOfAvailable(), {"10.0.0.1/28": 0})
+        allocator.release("peer12")
+        self.assertEqual(self.available(allocator), ["10.0.0.14/32"])
+
+    def test_last_bits_of_the_last_byte(self):
+        # 14 hosts, the second byte of the bitmap is only partly used
+        allocator = AddressAllocator("10.0.0.1/28")
+        for i in range(2, 14):
+            allocator.assign(f"peer{i}", f"10.0.0.{i}/32")
+        self.assertEqual(self.available(allocator), ["10.0.0.14/32"])
+
+    def test_threshold_and_lazy_iterators(self):
+        allocator = AddressAllocator("10.0.0.1/16")
+        self.assertEqual(len(self.available(allocator)), 255)
+        self.assertEqual(len(self.available(allocator, 10)), 10)
+        lazy = self.available(allocator, -1)
+        self.assertEqual(next(lazy), "10.0.0.2/32")
+        self.assertEqual(sum(1 for _ in lazy), 65534 - 2)
+
+    def test_sync(self):
+        allocator = AddressAllocator("10.0.0.1/29")
+        allocator.sync([Peer("a", "10.0.0.2/32"), Peer("b", "10.0.0.3/32")])
+        self.assertEqual(self.available(allocator, 1), ["10.0.0.4/32"])
+        allocator.sync([Peer("b", "10.0.0.3/32")])
+        # The interface address survives a sync without it
+        self.assertEqual(self.available(allocator), ["10.0.0.2/32", "10.0.0.4/32", "10.0.0.5/32", "10.0.0.6/32"])
+
+
+class HashedIPv6AllocatorTest(unittest.TestCase):
+    def free(self, pool: SparseAddressPool, count: int) -> list[int]:
+        return [a for a, _ in zip(pool.free(), range(count))]
+
+    def test_addresses_are_spread_over_the_network(self):
+        allocator = AddressAllocator("fd00::1/64", ipv6Mode="hashed")
+        addresses = [ip_address(a.split("/")[0]) for a in allocator.getAvailable(100)["fd00::1/64"]]
+        self.assertEqual(len(set(addresses)), 100)
+        self.assertTrue(all(a in ip_network("fd00::/64") for a in addresses))
+        self.assertNotIn(ip_address("fd00::1"), addresses)
+        # Sequential mode would start at fd00::2
+        self.assertNotEqual(addresses[:3], [ip_address(f"fd00::{i}") for i in range(2, 5)])
+
+    def test_order_is_stable_across_restarts(self):
+        first = AddressAllocator("fd00::1/64", ipv6Mode="hashed").getAvailable(50)
+        second = AddressAllocator("fd00::1/64", ipv6Mode="hashed").getAvailable(50)
+        self.assertEqual(first, second)
+        other = AddressAllocator("fd01::1/64", ipv6Mode="hashed").getAvailable(50)["fd01::1/64"]
+        self.assertNotEqual([a.replace("fd01:", "fd00:") for a in other], first["fd00::1/64"])
+
+    def test_used_addresses_are_probed_past(self):
+        pool = SparseAddressPool(ip_network("fd00::/64"), "hashed")
+        order = self.free(pool, 10)
+        for address in order[:3] + order[5:6]:
+            pool.mark(address)
+        self.assertEqual(self.free(pool, 5), order[3:5] + order[6:9])
+        # A restarted pool with the same peers picks the same addresses
+        restarted = SparseAddressPool(ip_network("fd00::/64"), "hashed")
+        for address in order[:3] + order[5:6]:
+            restarted.mark(address)
+        self.assertEqual(self.free(restarted, 5), order[3:5] + order[6:9])
+
+    def test_released_address_is_handed_out_again(self):
+        pool = SparseAddressPool(ip_network("fd00::/64"), "hashed")
+        order = self.free(pool, 4)
+        for address in order:
+            pool.mark(address)
+        self.assertNotIn(self.free(pool, 1)[0], order)
+        pool.unmark(order[1])
+        self.assertEqual(self.free(pool, 1), [order[1]])
+
+    def test_probe_collisions_in_a_small_network(self):
+        # 15 host addresses, the probe sequence repeats addresses long before it covers them all
+        pool = SparseAddressPool(ip_network("fd00::/124"), "hashed")
+        first, last = HostRange(ip_network("fd00::/124"))
+        addresses = list(pool.free())
+        self.assertEqual(len(addresses), 15)
+        self.assertEqual(sorted(addresses), list(range(first, last + 1)))
+
+    def test_exhaustion_falls_back_to_a_sequential_walk(self):
+        pool = SparseAddressPool(ip_network("fd00::/120"), "hashed")
+        first, last = HostRange(ip_network("fd00::/120"))
+        for address in range(first, last + 1):
+            if address != last - 7:
+                pool.mark(address)
+        self.assertEqual(pool.available(), 1)
+        self.assertEqual(list(pool.free()), [last - 7])
+        pool.mark(last - 7)
+        self.assertEqual(list(pool.free()), [])
+        self.assertEqual(pool.available(), 0)
+
+    def test_hashed_allocator_exhaustion(self):
+        allocator = AddressAllocator("fd00::1/125", ipv6Mode="hashed")
+        available = allocator.getAvailable()["fd00::1/125"]
+        self.assertEqual(len(available), 6)
+        for i, address in enumerate(available):
+            allocator.assign(f"peer{i}", address)
+        self.assertEqual(allocator.getAvailable()["fd00::1/125"], [])
+        self.assertEqual(allocator.getNumberOfAvailable(), {"fd00::1/125": 0})
+
+
+if __name__ == '__main__':
+    unittest.main()
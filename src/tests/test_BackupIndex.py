@@ -0,0 +1,115 @@
+"""
+BackupIndex lists the backups of a directory and caches the list until the directory changes
+Run from src: python3 -m unittest discover -s tests -t .
+"""
+import os
+import tempfile
+import time
+import unittest
+
+from modules.BackupIndex import BackupIndex
+
+
+class ListTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, filename: str, content: str = "[Interface]\n"):
+        with open(os.path.join(self.directory.name, filename), "w") as f:
+            f.write(content)
+
+    def remove(self, filename: str):
+        os.remove(os.path.join(self.directory.name, filename))
+
+    def setModified(self, modified: int):
+        os.utime(self.directory.name, ns=(modified, modified))
+
+    def age(self):
+        """
+        Move the directory's modification time well into the past, so its listing gets cached
+        """
+        self.setModified(time.time_ns() - 60_000_000_000)
+
+    def filenames(self) -> list[str]:
+        return sorted(b["filename"] for b in BackupIndex.List(self.directory.name))
+
+    def test_missing_directory(self):
+        self.assertEqual(BackupIndex.List(os.path.join(self.directory.name, "missing")), [])
+
+    def test_entries(self):
+        self.write("wg0_20240101000000.conf", "[Interface]\n" * 10)
+        self.write("wg0_20240101000000.sql", "INSERT\n" * 3)
+        self.write("wg_1_20240202000000.conf")
+        self.write("notes.txt")
+        self.write("nodate.conf")
+        self.write("_20240101000000.conf")
+        self.write("wg2_20240303000000.sql")
+        os.mkdir(os.path.join(self.directory.name, "wg3_20240404000000.conf"))
+        backups = {b["filename"]: b for b in BackupIndex.List(self.directory.name)}
+        self.assertEqual(sorted(backups.keys()), ["wg0_20240101000000.conf", "wg_1_20240202000000.conf"])
+        self.assertEqual(backups["wg0_20240101000000.conf"] | {"createdAt": 0}, {
+            "configuration": "wg0",
+            "filename": "wg0_20240101000000.conf",
+            "backupDate": "20240101000000",
+            "size": len("[Interface]\n" * 10),
+            "database": True,
+            "databaseSize": len("INSERT\n" * 3),
+            "createdAt": 0
+        })
+        self.assertEqual(backups["wg_1_20240202000000.conf"]["configuration"], "wg_1")
+        self.assertFalse(backups["wg_1_20240202000000.conf"]["database"])
+        self.assertEqual(backups["wg_1_20240202000000.conf"]["databaseSize"], 0)
+
+    def test_newest_first(self):
+        self.write("wg0_1.conf")
+        self.write("wg0_2.conf")
+        os.utime(os.path.join(self.directory.name, "wg0_1.conf"))
+        backups = BackupIndex.List(self.directory.name)
+        self.assertGreaterEqual(backups[0]["createdAt"], backups[1]["createdAt"])
+
+    def test_added_and_removed_backups(self):
+        self.write("wg0_1.conf")
+        self.age()
+        self.assertEqual(self.filenames(), ["wg0_1.conf"])
+        self.write("wg0_2.conf")
+        self.write("wg0_2.sql")
+        self.assertEqual(self.filenames(), ["wg0_1.conf", "wg0_2.conf"])
+        self.assertTrue(next(b for b in BackupIndex.List(self.directory.name) if b["filename"] == "wg0_2.conf")
+                        ["database"])
+        self.age()
+        self.remove("wg0_1.conf")
+        self.assertEqual(self.filenames(), ["wg0_2.conf"])
+        self.age()
+        self.remove("wg0_2.sql")
+        self.assertFalse(BackupIndex.List(self.directory.name)[0]["database"])
+        self.remove("wg0_2.conf")
+        self.assertEqual(self.filenames(), [])
+
+    def test_unchanged_directory_is_not_scanned_again(self):
+        self.write("wg0_1.conf")
+        self.age()
+        modified = os.stat(self.directory.name).st_mtime_ns
+        self.assertEqual(self.filenames(), ["wg0_1.conf"])
+        # A file appearing without the modification time moving is only seen once the directory changes
+        self.write("wg0_2.conf")
+        self.setModified(modified)
+        self.assertEqual(self.filenames(), ["wg0_1.conf"])
+        self.setModified(modified + 1)
+        self.assertEqual(self.filenames(), ["wg0_1.conf", "wg0_2.conf"])
+
+    def test_recently_changed_directory_is_not_cached(self):
+        self.write("wg0_1.conf")
+        modified = time.time_ns()
+        self.setModified(modified)
+        self.assertEqual(self.filenames(), ["wg0_1.conf"])
+        # A change within the same clock tick leaves the modification time as it was
+        self.write("wg0_2.conf")
+        self.setModified(modified)
+        self.assertEqual(self.filenames(), ["wg0_1.conf", "wg0_2.conf"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+"""
+WireguardConfiguration.BulkInsert, every path round-trips the rows it is given
+Run from src: python3 -m unittest discover -s tests -t .
+
+Set WGDASHBOARD_TEST_DATABASE_URLS to a comma separated list of database URLs to also run the round trips against
+PostgreSQL or MySQL, see tests/benchmark_BulkInsert.py for containers to use.
+"""
+import os
+import unittest
+from unittest import mock
+
+import sqlalchemy
+from sqlalchemy.dialects import postgresql
+
+from modules.WireguardConfiguration import WireguardConfiguration
+from tests.benchmark_BulkInsert import Methods, TransferTable, TransferRows
+
+
+class BulkInsertTestCase(unittest.TestCase):
+    url = "sqlite://"
+
+    def setUp(self):
+        self.engine = sqlalchemy.create_engine(self.url)
+        self.metadata = sqlalchemy.MetaData()
+        self.table = TransferTable(self.metadata, 'wgd_test_transfer')
+        self.metadata.create_all(self.engine)
+        self.statements = 0
+
+        @sqlalchemy.event.listens_for(self.engine, "before_cursor_execute")
+        def countStatements(*args):
+            self.statements += 1
+
+    def tearDown(self):
+        self.metadata.drop_all(self.engine)
+        self.engine.dispose()
+
+    def insert(self, rows: list[dict], method: str = None):
+        self.statements = 0
+        with self.engine.begin() as conn:
+            WireguardConfiguration.BulkInsert(conn, self.table, rows, method)
+
+    def stored(self) -> list[dict]:
+        with self.engine.connect() as conn:
+            return [dict(r) for r in conn.execute(self.table.select().order_by(self.table.c.id)).mappings()]
+
+    def roundTrip(self, method: str = None):
+        for count in [1, 999, 1000, 1001, 2500]:
+            with self.subTest(method=method, count=count):
+                with self.engine.begin() as conn:
+                    conn.execute(self.table.delete())
+                rows = TransferRows(count)
+                self.insert(rows, method)
+                self.assertEqual(self.stored(), rows)
+
+
+class SQLiteBulkInsertTest(BulkInsertTestCase):
+    def test_executemany_round_trip(self):
+        self.roundTrip('executemany')
+
+    def test_values_round_trip(self):
+        self.roundTrip('values')
+
+    def test_default_is_executemany(self):
+        self.roundTrip()
+        self.insert(TransferRows(1001))
+        self.assertEqual(self.statements, 1)
+
+    def test_values_chunk_boundary(self):
+        size = WireguardConfiguration.BulkInsertChunkSize
+        for count, statements in [(size - 1, 1), (size, 1), (size + 1, 2), (2 * size, 2), (2 * size + 1, 3)]:
+            with self.subTest(count=count):
+                self.insert(TransferRows(count), 'values')
+                self.assertEqual(self.statements, statements)
+
+    def test_no_rows(self):
+        for method in [None, 'executemany', 'values', 'copy']:
+            self.insert([], method)
+            self.assertEqual(self.statements, 0)
+        self.assertEqual(self.stored(), [])
+
+
+class CopyBulkInsertTest(unittest.TestCase):
+    """
+    The COPY path against a stand-in connection, the round trip itself needs a PostgreSQL server
+    """
+    def connection(self, cursor) -> mock.MagicMock:
+        conn = mock.MagicMock()
+        conn.dialect = postgresql.dialect()
+        conn.connection.driver_connection.cursor.return_value.__enter__.return_value = cursor
+        return conn
+
+    def test_copy_writes_every_row(self):
+        cursor = mock.MagicMock()
+        copy = cursor.copy.return_value.__enter__.return_value
+        conn = self.connection(cursor)
+        table = TransferTable(sqlalchemy.MetaData())
+        rows = TransferRows(3)
+        WireguardConfiguration.BulkInsert(conn, table, rows)
+        statement = cursor.copy.call_args.args[0]
+        self.assertTrue(statement.startswith('COPY wg0_transfer (id, total_receive, '))
+        self.assertTrue(statement.endswith(') FROM STDIN'))
+        self.assertEqual([c.args[0] for c in copy.write_row.call_args_list], [tuple(r.values()) for r in rows])
+        conn.execute.assert_not_called()
+
+    def test_copy_errors_propagate(self):
+        cursor = mock.MagicMock()
+        cursor.copy.return_value.__enter__.return_value.write_row.side_effect = RuntimeError("copy failed")
+        conn = self.connection(cursor)
+        with self.assertRaises(RuntimeError):
+            WireguardConfiguration.BulkInsert(conn, TransferTable(sqlalchemy.MetaData()), TransferRows(2))
+        conn.execute.assert_not_called()
+
+    def test_driver_without_copy_uses_executemany(self):
+        # psycopg2 cursors have no copy method
+        cursor = mock.MagicMock(spec=["execute", "executemany", "close"])
+        conn = self.connection(cursor)
+        table = TransferTable(sqlalchemy.MetaData())
+        rows = TransferRows(3)
+        WireguardConfiguration.BulkInsert(conn, table, rows)
+        conn.execute.assert_called_once()
+        self.assertEqual(conn.execute.call_args.args[1], rows)
+
+
+def load_tests(loader, tests, pattern):
+    for url in filter(None, os.environ.get("WGDASHBOARD_TEST_DATABASE_URLS", "").split(",")):
+        dialect = sqlalchemy.engine.make_url(url).get_backend_name()
+        methods = Methods.get(dialect, ['executemany']) + [None]
+        testCase = type(f"{dialect.capitalize()}BulkInsertTest", (BulkInsertTestCase,), {
+            "url": url,
+            **{f"test_{method or 'default'}_round_trip": (lambda m: lambda self: self.roundTrip(m))(method)
+               for method in methods}
+        })
+        tests.addTests(loader.loadTestsFromTestCase(testCase))
+    return tests
+
+
+if __name__ == '__main__':
+    unittest.main()
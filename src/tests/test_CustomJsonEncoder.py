@@ -0,0 +1,73 @@
+"""
+CustomJsonEncoder gives the same JSON through orjson as through the stdlib json fallback
+Run from src: python3 -m unittest discover -s tests -t .
+"""
+import json
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import sqlalchemy
+from flask import Flask
+
+from modules import CustomJsonEncoder as CustomJsonEncoderModule
+from modules.CustomJsonEncoder import CustomJsonEncoder
+from tests.benchmark_Serialization import PeerListPayload
+
+
+def RowMappings() -> list:
+    engine = sqlalchemy.create_engine("sqlite://")
+    with engine.connect() as conn:
+        return list(conn.execute(sqlalchemy.text("SELECT 'wg0' AS name, 51820 AS port")).mappings())
+
+
+@unittest.skipIf(CustomJsonEncoderModule.orjson is None, "orjson is not installed")
+class CustomJsonEncoderTest(unittest.TestCase):
+    def setUp(self):
+        self.provider = CustomJsonEncoder(Flask(__name__))
+
+    def encode(self, obj, useOrjson: bool, **kwargs) -> str:
+        with mock.patch.object(CustomJsonEncoderModule, "orjson",
+                               CustomJsonEncoderModule.orjson if useOrjson else None):
+            return self.provider.dumps(obj, **kwargs)
+
+    def assertSameJson(self, obj, **kwargs):
+        fast, fallback = self.encode(obj, True, **kwargs), self.encode(obj, False, **kwargs)
+        self.assertEqual(json.loads(fast), json.loads(fallback))
+        return fast, fallback
+
+    def test_large_peer_list(self):
+        payload = PeerListPayload(10000)
+        fast, fallback = self.assertSameJson(payload)
+        peers = json.loads(fast)["data"]["configurationPeers"]
+        self.assertEqual(len(peers), 10000)
+        self.assertEqual(peers[1]["name"], "Peer ✓ 1")
+        self.assertEqual(peers[1]["configuration"], {"Name": "wg0", "Protocol": "wg", "ListenPort": "51820"})
+        self.assertEqual(json.loads(fast)["data"]["configurationInfo"]["Updated"], "2026-01-02 03:04:05")
+
+    def test_keys_are_sorted_like_the_fallback(self):
+        fast, fallback = self.assertSameJson({"b": 1, "a": {"d": 2, "c": 3}})
+        keys = lambda pairs: [(k, v) for k, v in pairs]
+        self.assertEqual(json.loads(fast, object_pairs_hook=keys), json.loads(fallback, object_pairs_hook=keys))
+        self.assertEqual(json.loads(fast, object_pairs_hook=keys), [("a", [("c", 3), ("d", 2)]), ("b", 1)])
+
+    def test_row_mappings_and_datetimes(self):
+        fast, _ = self.assertSameJson({"rows": RowMappings(), "time": datetime(2026, 10, 19, 8, 0, 0)})
+        self.assertEqual(json.loads(fast), {"rows": [{"name": "wg0", "port": 51820}], "time": "2026-10-19 08:00:00"})
+
+    def test_indent(self):
+        self.assertSameJson({"a": [1, 2]}, indent=2)
+
+    def test_integers_beyond_64_bits_fall_back(self):
+        fast, fallback = self.assertSameJson({"value": 2 ** 70})
+        self.assertEqual(fast, fallback)
+
+    def test_loads(self):
+        text = self.encode(PeerListPayload(10), True)
+        with mock.patch.object(CustomJsonEncoderModule, "orjson", None):
+            fallback = self.provider.loads(text)
+        self.assertEqual(self.provider.loads(text), fallback)
+
+
+if __name__ == '__main__':
+    unittest.main()
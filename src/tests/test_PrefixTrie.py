@@ -0,0 +1,119 @@
+"""
+PrefixTrie finds the peers whose allowed IPs overlap a given list of allowed IPs
+Run from src: python3 -m unittest discover -s tests -t .
+"""
+import unittest
+from types import SimpleNamespace
+
+from modules.PrefixTrie import PrefixTrie
+
+
+def Peer(peerId: str, allowedIp: str) -> SimpleNamespace:
+    return SimpleNamespace(id=peerId, allowed_ip=allowedIp)
+
+
+class OverlapTest(unittest.TestCase):
+    def setUp(self):
+        self.trie = PrefixTrie()
+        self.trie.assign("host", "10.0.0.2/32")
+        self.trie.assign("subnet", "10.0.1.0/24")
+        self.trie.assign("v6", "fd00::2/128, fd00:1::/64")
+
+    def test_no_overlap(self):
+        self.assertEqual(self.trie.overlaps("10.0.0.3/32"), [])
+        self.assertEqual(self.trie.overlaps("10.0.2.0/24, fd00::3/128"), [])
+
+    def test_equal_prefixes(self):
+        self.assertEqual(self.trie.overlaps("10.0.0.2/32"), ["host"])
+        self.assertEqual(self.trie.overlaps("10.0.1.0/24"), ["subnet"])
+        self.assertEqual(self.trie.overlaps("fd00:1::/64"), ["v6"])
+
+    def test_assigned_prefix_contains_the_new_one(self):
+        self.assertEqual(self.trie.overlaps("10.0.1.7/32"), ["subnet"])
+        self.assertEqual(self.trie.overlaps("10.0.1.128/25"), ["subnet"])
+        self.assertEqual(self.trie.overlaps("fd00:1::5/128"), ["v6"])
+
+    def test_new_prefix_contains_assigned_ones(self):
+        self.assertEqual(self.trie.overlaps("10.0.0.0/16"), ["host", "subnet"])
+        self.assertEqual(self.trie.overlaps("10.0.0.0/30"), ["host"])
+        self.assertEqual(self.trie.overlaps("fd00::/16"), ["v6"])
+
+    def test_default_routes(self):
+        self.assertEqual(self.trie.overlaps("0.0.0.0/0"), ["host", "subnet"])
+        self.assertEqual(self.trie.overlaps("::/0"), ["v6"])
+        self.trie.assign("everything", "0.0.0.0/0")
+        self.assertEqual(self.trie.overlaps("192.168.0.1/32"), ["everything"])
+        self.assertEqual(self.trie.overlaps("fd00:2::1/128"), [])
+
+    def test_mixed_versions(self):
+        self.assertEqual(self.trie.overlaps("10.0.0.2/32, fd00:1::/48"), ["host", "v6"])
+        # IPv4-mapped IPv6 addresses are IPv6 prefixes of their own
+        self.assertEqual(self.trie.overlaps("::ffff:10.0.0.2/128"), [])
+
+    def test_host_bits_and_spaces_are_ignored(self):
+        self.assertEqual(self.trie.overlaps(" 10.0.1.9/24 ,  "), ["subnet"])
+
+    def test_invalid_entries_are_skipped(self):
+        self.assertEqual(self.trie.overlaps("not an address, 10.0.0.2/33, 10.0.0.2/32"), ["host"])
+
+    def test_exclude(self):
+        self.assertEqual(self.trie.overlaps("10.0.0.2/32", exclude="host"), [])
+        self.assertEqual(self.trie.overlaps("10.0.0.0/16", exclude="host"), ["subnet"])
+        self.assertEqual(self.trie.overlaps("10.0.1.0/24", exclude="subnet"), [])
+        self.assertEqual(self.trie.overlaps("10.0.0.0/8", exclude="unknown"), ["host", "subnet"])
+
+    def test_exclude_keeps_other_peers_in_the_subtree(self):
+        self.trie.assign("inside", "10.0.1.5/32")
+        self.assertEqual(self.trie.overlaps("10.0.1.0/24", exclude="subnet"), ["inside"])
+        self.assertEqual(self.trie.overlaps("10.0.1.0/24", exclude="inside"), ["subnet"])
+
+
+class RemovalTest(unittest.TestCase):
+    def test_release(self):
+        trie = PrefixTrie()
+        trie.assign("a", "10.0.0.0/24")
+        trie.assign("b", "10.0.0.5/32")
+        trie.release("a")
+        self.assertEqual(trie.overlaps("10.0.0.0/24"), ["b"])
+        self.assertEqual(trie.overlaps("10.0.0.6/32"), [])
+        trie.release("b")
+        self.assertEqual(trie.overlaps("0.0.0.0/0"), [])
+        trie.release("b")
+        trie.release("never assigned")
+
+    def test_reassign_replaces_the_previous_allowed_ips(self):
+        trie = PrefixTrie()
+        trie.assign("a", "10.0.0.2/32")
+        trie.assign("a", "10.0.0.3/32")
+        self.assertEqual(trie.overlaps("10.0.0.2/32"), [])
+        self.assertEqual(trie.overlaps("10.0.0.3/32"), ["a"])
+
+    def test_same_prefix_listed_twice(self):
+        trie = PrefixTrie()
+        trie.assign("a", "10.0.0.2/32, 10.0.0.2/32")
+        trie.assign("b", "10.0.0.2/32")
+        trie.release("b")
+        self.assertEqual(trie.overlaps("10.0.0.2/32"), ["a"])
+        trie.release("a")
+        self.assertEqual(trie.overlaps("10.0.0.0/8"), [])
+
+    def test_shared_prefix_stays_until_every_owner_is_released(self):
+        trie = PrefixTrie()
+        trie.assign("a", "fd00::/64")
+        trie.assign("b", "fd00::/64")
+        self.assertEqual(trie.overlaps("fd00::1/128"), ["a", "b"])
+        trie.release("a")
+        self.assertEqual(trie.overlaps("fd00::1/128"), ["b"])
+
+    def test_sync(self):
+        trie = PrefixTrie()
+        trie.sync([Peer("a", "10.0.0.2/32"), Peer("b", "10.0.0.3/32")])
+        self.assertEqual(trie.overlaps("10.0.0.0/24"), ["a", "b"])
+        trie.sync([Peer("b", "10.0.0.4/32"), Peer("c", "fd00::2/128")])
+        self.assertEqual(trie.overlaps("10.0.0.0/24"), ["b"])
+        self.assertEqual(trie.overlaps("10.0.0.3/32"), [])
+        self.assertEqual(trie.overlaps("::/0"), ["c"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+"""
+ResponseCompression negotiates an encoding, compresses responses and keeps their ETags apart per encoding
+Run from src: python3 -m unittest discover -s tests -t .
+"""
+import gzip
+import json
+import unittest
+from unittest import mock
+
+from flask import Flask, Response, request
+from werkzeug.datastructures import ETags
+from werkzeug.http import parse_accept_header, parse_etags
+
+from modules import ResponseCompression as ResponseCompressionModule
+from modules.ResponseCompression import ResponseCompression
+
+ETag = "0123456789ab-7"
+
+
+def Accept(header: str):
+    return parse_accept_header(header)
+
+
+def TestApp(compression: ResponseCompression) -> Flask:
+    """
+    Routes answering like the dashboard's: JSON with an ETag and 304s, a streamed CSV and a binary file
+    """
+    app = Flask(__name__)
+
+    @app.get("/json")
+    def jsonRoute():
+        matched = ResponseCompression.MatchETag(ETag, request.if_none_match)
+        if matched is not None:
+            response = app.response_class(status=304)
+        else:
+            response = app.response_class(json.dumps({"data": "x" * request.args.get("size", 2048, type=int)}),
+                                          mimetype="application/json")
+        response.set_etag(matched or ETag)
+        return response
+
+    @app.get("/stream")
+    def streamRoute():
+        return app.response_class((f"{i},peer{i}\n" for i in range(1000)), mimetype="text/csv")
+
+    @app.get("/binary")
+    def binaryRoute():
+        return app.response_class(b"\x89PNG" + b"\x00" * 4096, mimetype="image/png")
+
+    @app.after_request
+    def compressResponse(response):
+        return compression.compressResponse(response, request.accept_encodings)
+
+    return app
+
+
+class NegotiateTest(unittest.TestCase):
+    def setUp(self):
+        self.compression = ResponseCompression()
+        patcher = mock.patch.object(ResponseCompression, "Encodings", staticmethod(lambda: ["zstd", "br", "gzip"]))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_equal_q_values_use_our_preference(self):
+        self.assertEqual(self.compression.negotiate(Accept("gzip, deflate, br, zstd")), "zstd")
+        self.assertEqual(self.compression.negotiate(Accept("gzip, br")), "br")
+        self.assertEqual(self.compression.negotiate(Accept("gzip")), "gzip")
+
+    def test_highest_q_value_wins(self):
+        self.assertEqual(self.compression.negotiate(Accept("gzip;q=1.0, zstd;q=0.5, br;q=0.8")), "gzip")
+        self.assertEqual(self.compression.negotiate(Accept("gzip;q=0.2, br;q=0.9")), "br")
+
+    def test_wildcard(self):
+        self.assertEqual(self.compression.negotiate(Accept("*")), "zstd")
+        self.assertEqual(self.compression.negotiate(Accept("*;q=0.5, gzip")), "gzip")
+
+    def test_nothing_acceptable(self):
+        self.assertIsNone(self.compression.negotiate(Accept("")))
+        self.assertIsNone(self.compression.negotiate(Accept("identity")))
+        self.assertIsNone(self.compression.negotiate(Accept("gzip;q=0, deflate")))
+
+    def test_streamed_responses_only_use_gzip(self):
+        self.assertEqual(self.compression.negotiate(Accept("zstd, br, gzip;q=0.1"), streamed=True), "gzip")
+        self.assertIsNone(self.compression.negotiate(Accept("zstd, br"), streamed=True))
+
+
+class MatchETagTest(unittest.TestCase):
+    def test_plain_and_compressed_variants(self):
+        self.assertEqual(ResponseCompression.MatchETag(ETag, parse_etags(f'"{ETag}"')), ETag)
+        self.assertEqual(ResponseCompression.MatchETag(ETag, parse_etags(f'"other", "{ETag}-gzip"')), f"{ETag}-gzip")
+
+    def test_no_match(self):
+        self.assertIsNone(ResponseCompression.MatchETag(ETag, ETags()))
+        self.assertIsNone(ResponseCompression.MatchETag(ETag, parse_etags(f'"{ETag}-deflate", "{ETag}0"')))
+        self.assertIsNone(ResponseCompression.MatchETag(ETag, parse_etags(f'W/"{ETag}"')))
+
+
+class CompressResponseTest(unittest.TestCase):
+    def setUp(self):
+        self.compression = ResponseCompression(6, 1024)
+        self.client = TestApp(self.compression).test_client()
+
+    def get(self, path: str, **headers) -> Response:
+        return self.client.get(path, headers={"Accept-Encoding": "gzip", **headers})
+
+    def test_gzip(self):
+        response = self.get("/json")
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response.vary)
+        self.assertEqual(json.loads(gzip.decompress(response.data)), {"data": "x" * 2048})
+        self.assertEqual(response.get_etag(), (f"{ETag}-gzip", False))
+
+    def test_no_accepted_encoding(self):
+        response = self.client.get("/json", headers={"Accept-Encoding": "identity"})
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertIn("Accept-Encoding", response.vary)
+        self.assertEqual(response.get_etag(), (ETag, False))
+
+    def test_304_for_each_variant(self):
+        for sent in [ETag, f"{ETag}-gzip"]:
+            with self.subTest(etag=sent):
+                response = self.get("/json", **{"If-None-Match": f'"{sent}"'})
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.get_etag(), (sent, False))
+                self.assertNotIn("Content-Encoding", response.headers)
+                self.assertEqual(response.data, b"")
+
+    def test_minimum_size(self):
+        self.assertNotIn("Content-Encoding", self.get("/json?size=100").headers)
+        self.assertIn("Content-Encoding", self.get("/json?size=1024").headers)
+
+    def test_types_that_are_not_compressible(self):
+        response = self.get("/binary")
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertNotIn("Accept-Encoding", response.vary)
+
+    def test_streamed_responses_are_gzipped(self):
+        expected = "".join(f"{i},peer{i}\n" for i in range(1000)).encode()
+        response = self.get("/stream")
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertNotIn("Content-Length", response.headers)
+        self.assertEqual(gzip.decompress(response.data), expected)
+        response = self.get("/stream", **{"Accept-Encoding": "zstd, br"})
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(response.data, expected)
+
+    def test_settings_apply_without_a_restart(self):
+        self.assertNotIn("Content-Encoding", self.get("/json?size=100").headers)
+        self.compression.configure("9", "64")
+        self.assertEqual((self.compression.level, self.compression.minimumSize), (9, 64))
+        self.assertIn("Content-Encoding", self.get("/json?size=100").headers)
+        self.compression.configure(1, 4096)
+        self.assertNotIn("Content-Encoding", self.get("/json?size=2048").headers)
+
+    def test_invalid_settings_keep_the_current_ones(self):
+        self.compression.configure("fast", None)
+        self.assertEqual((self.compression.level, self.compression.minimumSize), (6, 1024))
+        self.compression.configure(42, -5)
+        self.assertEqual((self.compression.level, self.compression.minimumSize), (9, 0))
+
+    @unittest.skipIf(ResponseCompressionModule.zstandard is None, "zstandard is not installed")
+    def test_zstd(self):
+        response = self.get("/json", **{"Accept-Encoding": "gzip, zstd"})
+        self.assertEqual(response.headers["Content-Encoding"], "zstd")
+        self.assertEqual(response.get_etag(), (f"{ETag}-zstd", False))
+        body = ResponseCompressionModule.zstandard.ZstdDecompressor().decompressobj().decompress(response.data)
+        self.assertEqual(json.loads(body), {"data": "x" * 2048})
+
+    @unittest.skipIf(ResponseCompressionModule.brotli is None, "brotli is not installed")
+    def test_brotli(self):
+        response = self.get("/json", **{"Accept-Encoding": "gzip, br"})
+        self.assertEqual(response.headers["Content-Encoding"], "br")
+        self.assertEqual(json.loads(ResponseCompressionModule.brotli.decompress(response.data)), {"data": "x" * 2048})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+"""
+UnitOfWork shares one transaction per database across a request and commits it once when the request finishes
+Run from src: python3 -m unittest discover -s tests -t .
+"""
+import os
+import tempfile
+import unittest
+
+import sqlalchemy
+from flask import Flask
+
+from modules.UnitOfWork import UnitOfWork
+
+
+def TestApp() -> Flask:
+    """
+    App with the dashboard's unit of work hooks
+    """
+    app = Flask(__name__)
+
+    @app.before_request
+    def startUnitOfWork():
+        UnitOfWork.Start()
+
+    @app.after_request
+    def finishUnitOfWork(response):
+        if not UnitOfWork.Finish(response.status_code < 500):
+            return app.response_class("Database error", status=500)
+        return response
+
+    @app.teardown_request
+    def discardUnitOfWork(exception):
+        UnitOfWork.Discard()
+
+    return app
+
+
+class UnitOfWorkTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.engine = sqlalchemy.create_engine(f"sqlite:///{os.path.join(self.directory.name, 'test.db')}")
+        self.table = sqlalchemy.Table("Peers", sqlalchemy.MetaData(),
+                                      sqlalchemy.Column("id", sqlalchemy.String, primary_key=True))
+        self.table.metadata.create_all(self.engine)
+        self.commits = 0
+        sqlalchemy.event.listen(self.engine, "commit", self.countCommit)
+        self.app = TestApp()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.directory.cleanup()
+
+    def countCommit(self, conn):
+        self.commits += 1
+
+    def insert(self, conn, peerId: str):
+        conn.execute(self.table.insert().values(id=peerId))
+
+    def stored(self) -> list[str]:
+        with self.engine.connect() as conn:
+            return sorted(conn.execute(sqlalchemy.select(self.table.c.id)).scalars())
+
+    def test_request_is_committed_exactly_once(self):
+        @self.app.post("/peers")
+        def addPeers():
+            for peerId in ["a", "b", "c"]:
+                with UnitOfWork.Begin(self.engine) as conn:
+                    self.insert(conn, peerId)
+            with UnitOfWork.Connect(self.engine) as conn:
+                self.assertEqual(conn.execute(sqlalchemy.select(sqlalchemy.func.count()).select_from(self.table))
+                                 .scalar(), 3)
+            self.assertEqual(self.commits, 0)
+            return "ok"
+
+        self.assertEqual(self.client.post("/peers").status_code, 200)
+        self.assertEqual(self.commits, 1)
+        self.assertEqual(self.stored(), ["a", "b", "c"])
+        self.assertEqual(self.engine.pool.checkedout(), 0)
+
+    def test_failing_block_only_rolls_back_its_own_writes(self):
+        @self.app.post("/peers")
+        def addPeers():
+            with UnitOfWork.Begin(self.engine) as conn:
+                self.insert(conn, "a")
+            with self.assertRaises(sqlalchemy.exc.IntegrityError):
+                with UnitOfWork.Begin(self.engine) as conn:
+                    self.insert(conn, "b")
+                    self.insert(conn, "a")
+            return "ok"
+
+        self.assertEqual(self.client.post("/peers").status_code, 200)
+        self.assertEqual(self.stored(), ["a"])
+        self.assertEqual(self.commits, 1)
+
+    def test_nested_begin_rolls_back_the_inner_block(self):
+        @self.app.post("/peers")
+        def addPeers():
+            with UnitOfWork.Begin(self.engine) as outer:
+                self.insert(outer, "outer")
+                with self.assertRaises(ValueError):
+                    with UnitOfWork.Begin(self.engine) as inner:
+                        self.assertIs(inner, outer)
+                        self.insert(inner, "inner")
+                        raise ValueError
+                self.insert(outer, "after")
+            return "ok"
+
+        self.assertEqual(self.client.post("/peers").status_code, 200)
+        self.assertEqual(self.stored(), ["after", "outer"])
+
+    def test_server_error_rolls_back(self):
+        @self.app.post("/peers")
+        def addPeers():
+            with UnitOfWork.Begin(self.engine) as conn:
+                self.insert(conn, "a")
+            return "failed", 500
+
+        self.assertEqual(self.client.post("/peers").status_code, 500)
+        self.assertEqual(self.stored(), [])
+        self.assertEqual(self.commits, 0)
+
+    def test_unhandled_exception_is_discarded(self):
+        self.app.testing = True
+
+        @self.app.post("/peers")
+        def addPeers():
+            with UnitOfWork.Begin(self.engine) as conn:
+                self.insert(conn, "a")
+            raise RuntimeError("after the write")
+
+        # Exceptions propagate in testing mode, after_request never runs and only teardown cleans up
+        with self.assertRaises(RuntimeError):
+            self.client.post("/peers")
+        self.assertEqual(self.stored(), [])
+        self.assertEqual(self.commits, 0)
+        self.assertEqual(self.engine.pool.checkedout(), 0)
+
+    def test_failed_commit_returns_a_server_error(self):
+        engine = sqlalchemy.create_engine(self.engine.url, connect_args={"timeout": 0.1})
+        self.addCleanup(engine.dispose)
+
+        @self.app.post("/peers")
+        def addPeers():
+            with UnitOfWork.Begin(engine) as conn:
+                self.insert(conn, "a")
+            return "ok"
+
+        # A reader holding its shared lock keeps the commit at the end of the request from getting the database
+        with engine.connect() as reader:
+            reader.exec_driver_sql("BEGIN")
+            reader.execute(sqlalchemy.select(self.table.c.id)).all()
+            with self.assertLogs(self.app.logger, "ERROR"):
+                response = self.client.post("/peers")
+            reader.exec_driver_sql("ROLLBACK")
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(self.stored(), [])
+        self.assertEqual(engine.pool.checkedout(), 0)
+
+    def test_outside_a_request_blocks_commit_on_their_own(self):
+        with UnitOfWork.Begin(self.engine) as conn:
+            self.insert(conn, "a")
+        self.assertEqual(self.commits, 1)
+        with self.app.app_context():
+            UnitOfWork.Start()
+            UnitOfWork.Finish(True)
+            with UnitOfWork.Begin(self.engine) as conn:
+                self.insert(conn, "b")
+        self.assertEqual(self.commits, 2)
+        self.assertEqual(self.stored(), ["a", "b"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+"""
+Key generation in Utilities against the X25519 test vectors of RFC 7748
+Run from src: python3 -m unittest discover -s tests -t .
+"""
+import base64
+import unittest
+from unittest import mock
+
+from modules import Utilities
+from modules.Utilities import (
+    X25519, DeriveX25519PublicKey, GenerateWireguardPublicKey, GenerateWireguardPrivateKey,
+    GenerateWireguardPresharedKey
+)
+
+# RFC 7748 section 5.2, (scalar, u-coordinate, result)
+FunctionVectors = [
+    ("a546e36bf0527c9d3b16154b82465edd62144c0ac1fc5a18506a2244ba449ac4",
+     "e6db6867583030db3594c1a424b15f7c726624ec26b3353b10a903a6d0ab1c4c",
+     "c3da55379de9c6908e94ea4df28d084f32eccf03491c71f754b4075577a28552"),
+    ("4b66e9d4d1b4673c5ad22691957d6af5c11b6421e0ea01d42ca4169e7918ba0d",
+     "e5210f12786811d3f4b7959d0538ae2c31dbe7106fc03c3efc4cd549c715a493",
+     "95cbde9476e8907d7aade45cb4b873f88b595a68799fa152e6f8f7647aac7957"),
+]
+# RFC 7748 section 5.2, k and u start at 9, result after 1 and 1000 iterations
+IteratedVectors = {
+    1: "422c8e7a6227d7bca1350b3e2bb7279f7897b87bb6854b783c60e80311ae3079",
+    1000: "684cf59ba83309552800ef566f2f4d3c1c3887c49360e3875f2eb94d99532c51",
+}
+# RFC 7748 section 6.1, (private key, public key)
+KeyPairVectors = [
+    ("77076d0a7318a57d3c16c17251b26645df4c2f87ebc0992ab177fba51db92c2a",
+     "8520f0098930a754748b7ddcb43ef75a0dbf3a0d26381af4eba4a98eaa9b4e6a"),
+    ("5dab087e624a8a4b79e17f8b83800ee66f3bb1292618b6fd1c2f8b27ff88e0eb",
+     "de9edb7d7b7dc1b4d35b61c2ece435373f8343c85b78674dadfc7e146f882b4f"),
+]
+SharedSecret = "4a5d9d5ba4ce2de1728e3bf480350f25e07e21c947d19e3376f09b3c1e161742"
+
+
+def Base64(value: str) -> str:
+    return base64.b64encode(bytes.fromhex(value)).decode()
+
+
+class X25519Test(unittest.TestCase):
+    def test_function_vectors(self):
+        for scalar, u, result in FunctionVectors:
+            self.assertEqual(X25519(bytes.fromhex(scalar), bytes.fromhex(u)).hex(), result)
+
+    def test_iterated_vectors(self):
+        k = u = (9).to_bytes(32, "little")
+        for i in range(1, max(IteratedVectors.keys()) + 1):
+            k, u = X25519(k, u), k
+            if i in IteratedVectors:
+                self.assertEqual(k.hex(), IteratedVectors[i])
+
+    def test_shared_secret(self):
+        (alicePrivate, alicePublic), (bobPrivate, bobPublic) = KeyPairVectors
+        self.assertEqual(X25519(bytes.fromhex(alicePrivate), bytes.fromhex(bobPublic)).hex(), SharedSecret)
+        self.assertEqual(X25519(bytes.fromhex(bobPrivate), bytes.fromhex(alicePublic)).hex(), SharedSecret)
+
+
+class DeriveX25519PublicKeyTest(unittest.TestCase):
+    def test_pure_python(self):
+        with mock.patch.object(Utilities, "X25519PrivateKey", None):
+            for privateKey, publicKey in KeyPairVectors:
+                self.assertEqual(DeriveX25519PublicKey(bytes.fromhex(privateKey)).hex(), publicKey)
+
+    @unittest.skipIf(Utilities.X25519PrivateKey is None, "cryptography is not installed")
+    def test_cryptography(self):
+        for privateKey, publicKey in KeyPairVectors:
+            self.assertEqual(DeriveX25519PublicKey(bytes.fromhex(privateKey)).hex(), publicKey)
+
+
+class GenerateWireguardKeysTest(unittest.TestCase):
+    def test_public_key(self):
+        for privateKey, publicKey in KeyPairVectors:
+            self.assertEqual(GenerateWireguardPublicKey(Base64(privateKey)), (True, Base64(publicKey)))
+            # A second call is answered from the cache
+            self.assertEqual(GenerateWireguardPublicKey(Base64(privateKey)), (True, Base64(publicKey)))
+            self.assertEqual(GenerateWireguardPublicKey(Base64(privateKey), cache=False), (True, Base64(publicKey)))
+
+    def test_invalid_private_key(self):
+        for privateKey in ["", "not base64!", base64.b64encode(b"\x01" * 31).decode()]:
+            self.assertEqual(GenerateWireguardPublicKey(privateKey), (False, None))
+
+    def test_private_key_is_clamped(self):
+        status, privateKey = GenerateWireguardPrivateKey()
+        self.assertTrue(status)
+        key = base64.b64decode(privateKey)
+        self.assertEqual(len(key), 32)
+        self.assertEqual(key[0] & 7, 0)
+        self.assertEqual(key[31] & 0xC0, 0x40)
+        self.assertTrue(GenerateWireguardPublicKey(privateKey)[0])
+
+    def test_preshared_key(self):
+        status, presharedKey = GenerateWireguardPresharedKey()
+        self.assertTrue(status)
+        self.assertEqual(len(base64.b64decode(presharedKey)), 32)
+
+
+if __name__ == '__main__':
+    unittest.main()
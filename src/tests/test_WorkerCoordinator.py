@@ -0,0 +1,57 @@
+"""
+WorkerCoordinator tells workers what other workers changed
+Run from src: python3 -m unittest discover -s tests -t .
+"""
+import tempfile
+import unittest
+
+from modules import WorkerCoordinator as WorkerCoordinatorModule
+from modules.WorkerCoordinator import WorkerCoordinator
+
+
+class ChangedStateTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.first = WorkerCoordinator(self.directory.name, 2)
+        self.second = WorkerCoordinator(self.directory.name, 2)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_nothing_changed(self):
+        self.assertEqual(self.second.changedState(), set())
+
+    def test_changes_are_named(self):
+        self.first.bumpGeneration(["configuration:wg0"])
+        self.first.bumpGeneration(["jobs", "configuration:wg1"])
+        self.assertEqual(self.second.changedState(), {"configuration:wg0", "jobs", "configuration:wg1"})
+        self.assertEqual(self.second.changedState(), set())
+
+    def test_own_changes_are_skipped(self):
+        self.first.bumpGeneration(["settings"])
+        self.assertEqual(self.first.changedState(), set())
+
+    def test_changes_in_between_are_kept(self):
+        self.second.bumpGeneration(["apikeys"])
+        self.first.bumpGeneration(["settings"])
+        self.assertEqual(self.first.changedState(), {"apikeys", "settings"})
+
+    def test_dropped_changes_reload_everything(self):
+        for i in range(WorkerCoordinatorModule.GenerationLogSize + 1):
+            self.first.bumpGeneration([f"configuration:wg{i}"])
+        self.assertEqual(self.second.changedState(), {"*"})
+        self.first.bumpGeneration(["jobs"])
+        self.assertEqual(self.second.changedState(), {"jobs"})
+
+    def test_names_spanning_lines_reload_everything(self):
+        self.first.bumpGeneration(["configuration:wg0\njobs"])
+        self.assertEqual(self.second.changedState(), {"*"})
+
+    def test_single_worker(self):
+        single = WorkerCoordinator(self.directory.name, 1)
+        single.bumpGeneration(["settings"])
+        self.assertEqual(self.second.changedState(), set())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+"""
+ZipStream builds a ZIP archive while it is being sent
+Run from src: python3 -m unittest discover -s tests -t .
+"""
+import io
+import os
+import unittest
+import zipfile
+
+from modules.ZipStream import ZipStream
+
+
+class StreamTest(unittest.TestCase):
+    def open(self, chunks) -> zipfile.ZipFile:
+        return zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+
+    def test_archive_opens_and_crcs_match(self):
+        files = {
+            "wg0/peer1.conf": "[Interface]\nPrivateKey = a\n",
+            "wg0/ünïcode peer.conf": "[Interface]\nPrivateKey = b\n" * 100,
+            "wg0/empty.conf": "",
+            "wg0/random.bin": os.urandom(64 * 1024)
+        }
+        with self.open(ZipStream.Stream(files.items())) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.namelist(), list(files.keys()))
+            for name, content in files.items():
+                expected = content if isinstance(content, bytes) else content.encode()
+                self.assertEqual(archive.read(name), expected)
+                self.assertEqual(archive.getinfo(name).compress_type, zipfile.ZIP_DEFLATED)
+
+    def test_empty_archive(self):
+        with self.open(ZipStream.Stream([])) as archive:
+            self.assertEqual(archive.namelist(), [])
+
+    def test_entries_are_sent_as_they_are_written(self):
+        consumed = []
+
+        def files():
+            for i in range(3):
+                consumed.append(i)
+                yield f"peer{i}.conf", f"peer {i}\n" * 1000
+
+        stream = ZipStream.Stream(files())
+        chunks = [next(stream)]
+        self.assertEqual(consumed, [0])
+        self.assertTrue(chunks[0].startswith(b"PK\x03\x04"))
+        chunks.extend(stream)
+        self.assertEqual(consumed, [0, 1, 2])
+        # Three entries and the central directory
+        self.assertEqual(len(chunks), 4)
+        with self.open(chunks) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.read("peer2.conf"), b"peer 2\n" * 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()